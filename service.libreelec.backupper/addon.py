@@ -10,6 +10,7 @@ import xbmcvfs
 from resources.lib.backup_utils import BackupManager
 from resources.lib.remote_browser import RemoteBrowser
 from resources.lib.email_utils import EmailNotifier
+from resources.lib.schedule_state import ScheduleState, SCHEDULE_STATE_NAME
 
 ADDON = xbmcaddon.Addon()
 ADDON_ID = ADDON.getAddonInfo('id')
@@ -27,17 +28,18 @@ class BackupBrowser:
         self.backup_utils = BackupManager()
         self.remote_browser = RemoteBrowser()
 
-    def show_backups(self, mode='view'):
+    def show_backups(self, mode='view', selective=None):
         """Display a list of available backups for selection
-        mode: 'view' for viewing/listing, 'restore' for selecting to restore"""
+        mode: 'view' for viewing/listing, 'restore' for selecting to restore
+        selective: restore only chosen items, None asks once a backup is picked"""
         xbmc.log(f"BackupBrowser: Showing backups in {mode} mode", xbmc.LOGINFO)
 
-        # Get list of available backups
+        # Get list of available backups, together with their sidecar indexes
         xbmc.log("BackupBrowser: Retrieving backup list...", xbmc.LOGDEBUG)
-        backups = self.backup_utils.get_all_backups()
-        xbmc.log(f"BackupBrowser: Found {len(backups)} backups", xbmc.LOGINFO)
+        catalog = self.backup_utils.get_backup_catalog()
+        xbmc.log(f"BackupBrowser: Found {len(catalog)} backups", xbmc.LOGINFO)
 
-        if not backups:
+        if not catalog:
             xbmc.log("BackupBrowser: No backup files found", xbmc.LOGWARNING)
             xbmcgui.Dialog().ok(ADDON_NAME, "No backup files found")
             return
@@ -45,59 +47,21 @@ class BackupBrowser:
         # Create backup options with detailed information
         xbmc.log("BackupBrowser: Processing backup list...", xbmc.LOGDEBUG)
         backup_options = []
-        for backup in backups:
+        for backup, sidecar in catalog:
             try:
                 backup_name = os.path.basename(backup)
                 xbmc.log(f"BackupBrowser: Processing backup: {backup_name}", xbmc.LOGDEBUG)
 
-                # Get backup date from filename (format: backup_items_timestamp.zip)
-                # Extract timestamp from filename
-                try:
-                    # Split by underscore and find the timestamp part
-                    parts = backup_name.replace('.zip', '').split('_')
-                    if len(parts) >= 3:
-                        # Find the timestamp (should be the last part that's all digits)
-                        timestamp_part = None
-                        for part in reversed(parts):
-                            if part.isdigit() and len(part) == 14:  # YYYYMMDDHHMMSS format
-                                timestamp_part = part
-                                break
-
-                        if timestamp_part:
-                            # Parse timestamp: YYYYMMDDHHMMSS
-                            year = int(timestamp_part[0:4])
-                            month = int(timestamp_part[4:6])
-                            day = int(timestamp_part[6:8])
-                            hour = int(timestamp_part[8:10])
-                            minute = int(timestamp_part[10:12])
-                            second = int(timestamp_part[12:14])
-
-                            from datetime import datetime
-                            backup_date = datetime(year, month, day, hour, minute, second).strftime("%Y-%m-%d %H:%M:%S")
-                        else:
-                            backup_date = "Unknown date"
-                    else:
-                        backup_date = "Unknown date"
-                except Exception as e:
-                    xbmc.log(f"BackupBrowser: Error parsing backup date for {backup_name}: {str(e)}", xbmc.LOGWARNING)
-                    backup_date = "Unknown date"
-
-                # Get backup size
-                try:
-                    if self.backup_utils.location_type == 0:  # Local
-                        backup_size = os.path.getsize(backup)
-                    else:
-                        # For remote backups, size info may not be available
-                        backup_size = 0
-                    backup_size_formatted = self.backup_utils.format_size(backup_size)
-                except Exception as e:
-                    xbmc.log(f"BackupBrowser: Error getting backup size for {backup_name}: {str(e)}", xbmc.LOGWARNING)
-                    backup_size_formatted = "Unknown size"
+                # Date and size come from the sidecar index, or the file name and local file for older backups
+                backup_date = self.backup_utils.get_backup_date(backup)
+                backup_size = self.backup_utils.get_backup_size(backup)
 
                 # Create display string
                 display_name = f"{backup_date} - {backup_name}"
-                if backup_size_formatted != "Unknown size":
-                    display_name += f" ({backup_size_formatted})"
+                if backup_size is not None:
+                    display_name += f" ({self.backup_utils.format_size(backup_size)})"
+                if sidecar:
+                    display_name += f" [{', '.join(sidecar.items)}, {sidecar.file_count} files]"
 
                 backup_options.append((display_name, backup))
                 xbmc.log(f"BackupBrowser: Added backup option: {display_name}", xbmc.LOGDEBUG)
@@ -127,6 +91,14 @@ class BackupBrowser:
         xbmc.log(f"BackupBrowser: User selected backup: {selected_display}", xbmc.LOGINFO)
 
         if mode == 'restore':
+            if selective is None:
+                restore_type = dialog.select(os.path.basename(selected_backup),
+                                             ["Restore everything", "Choose items, add-ons or files to restore"])
+                if restore_type == -1:
+                    xbmc.log("BackupBrowser: User cancelled backup restoration", xbmc.LOGINFO)
+                    return
+                selective = restore_type == 1
+            
             # Confirm restore
             xbmc.log("BackupBrowser: Showing restore confirmation dialog", xbmc.LOGDEBUG)
             confirmed = dialog.yesno(
@@ -136,8 +108,8 @@ class BackupBrowser:
             )
 
             if confirmed:
-                xbmc.log(f"BackupBrowser: Starting backup restoration: {selected_backup}", xbmc.LOGINFO)
-                success, message = self.backup_utils.restore_backup(selected_backup)
+                xbmc.log(f"BackupBrowser: Starting {'selective ' if selective else ''}backup restoration: {selected_backup}", xbmc.LOGINFO)
+                success, message = self.backup_utils.restore_backup(selected_backup, selective=selective)
                 if success:
                     xbmc.log("BackupBrowser: Backup restoration completed successfully", xbmc.LOGINFO)
                     dialog.ok(ADDON_NAME, "Backup restored successfully")
@@ -147,15 +119,62 @@ class BackupBrowser:
             else:
                 xbmc.log("BackupBrowser: User cancelled backup restoration", xbmc.LOGINFO)
         else:
-            # For view mode, just show backup info
+            # For view mode, show what the backup holds and what changed
             xbmc.log("BackupBrowser: Showing backup information dialog", xbmc.LOGDEBUG)
-            dialog.ok(ADDON_NAME, f"Backup: {os.path.basename(selected_backup)}")
+            dialog.textviewer(ADDON_NAME, self.describe_backup(selected_backup, catalog))
+
+    def describe_backup(self, backup, catalog):
+        """Summarise a backup and its changes from the sidecar indexes alone"""
+        sidecars = dict(catalog)
+        sidecar = sidecars.get(backup)
+        lines = [f"Backup: {os.path.basename(backup)}", f"Date: {self.backup_utils.get_backup_date(backup)}"]
+        if not sidecar:
+            lines.append("No index stored with this backup, details are only available after a restore")
+            return '\n'.join(lines)
+
+        lines.append(f"Type: {'Incremental' if sidecar.is_incremental else 'Full'}")
+        lines.append(f"Items: {', '.join(sidecar.items)}")
+        lines.append(f"Files: {sidecar.file_count}")
+        lines.append(f"Original size: {self.backup_utils.format_size(sidecar.original_size)}")
+        lines.append(f"Stored size: {self.backup_utils.format_size(sidecar.compressed_size)}")
+
+        if sidecar.is_incremental:
+            # An increment only holds what changed since the backup before it
+            deleted = sidecar.header.get('deleted_files', [])
+            lines.append("")
+            lines.append(f"Changes since {sidecar.header.get('base_backup', 'the previous backup')}: "
+                         f"{sidecar.file_count} added or changed, {len(deleted)} deleted")
+            lines.extend(self._list_names("Added or changed", sorted(sidecar.files)))
+            lines.extend(self._list_names("Deleted", deleted))
+            return '\n'.join(lines)
+
+        # Compare with the newest older full backup of the same items
+        older = [other for other in sidecars.values()
+                 if other and not other.is_incremental and other.items == sidecar.items and (other.timestamp or '') < (sidecar.timestamp or '')]
+        if older:
+            previous = max(older, key=lambda other: other.timestamp or '')
+            added, removed, changed = sidecar.diff(previous)
+            lines.append("")
+            lines.append(f"Changes since {previous.header.get('archive')}: {len(added)} added, {len(removed)} removed, {len(changed)} changed")
+            lines.extend(self._list_names("Added", added))
+            lines.extend(self._list_names("Removed", removed))
+            lines.extend(self._list_names("Changed", changed))
+        return '\n'.join(lines)
+
+    def _list_names(self, title, names, limit=50):
+        if not names:
+            return []
+        lines = ["", f"{title}:"] + [f"  {name}" for name in names[:limit]]
+        if len(names) > limit:
+            lines.append(f"  ... and {len(names) - limit} more")
+        return lines
 
 def show_main_menu():
     """Show the main menu with options"""
     backup_utils = BackupManager()
     last_backup = backup_utils.get_last_successful_backup()
     next_backup = backup_utils.get_next_scheduled_backup()
+    schedule_state = ScheduleState(os.path.join(xbmcvfs.translatePath(ADDON.getAddonInfo('profile')), SCHEDULE_STATE_NAME))
     
     # Create menu items with backup information
     options = [
@@ -164,7 +183,8 @@ def show_main_menu():
         "Settings",
         "----------------------------------------",  # Divider line
         f"Last Backup: {last_backup}",
-        f"Next Backup: {next_backup}"
+        f"Next Backup: {next_backup}",
+        f"Scheduler: {schedule_state.summary()}"
     ]
     
     selected = xbmcgui.Dialog().select(ADDON_NAME, options)
@@ -188,6 +208,16 @@ def backup():
         xbmcgui.Dialog().ok(ADDON_NAME, f"Backup failed: {message}")
     return success
 
+def undo_restore():
+    """Put back the files the last restore replaced"""
+    dialog = xbmcgui.Dialog()
+    if not dialog.yesno(ADDON_NAME, "Put back the files as they were before the last restore?"):
+        log("User cancelled undoing the last restore", xbmc.LOGINFO)
+        return
+    success, message = BackupManager().undo_last_restore()
+    log(f"Undo last restore: {message}", xbmc.LOGINFO if success else xbmc.LOGERROR)
+    dialog.ok(ADDON_NAME, message)
+
 def test_email():
     """Test email notification settings"""
     dialog = xbmcgui.Dialog()
@@ -237,6 +267,11 @@ def main():
         elif args == 'restore':
             browser = BackupBrowser()
             browser.show_backups(mode='restore')
+        elif args == 'restore_selective':
+            browser = BackupBrowser()
+            browser.show_backups(mode='restore', selective=True)
+        elif args == 'undo_restore':
+            undo_restore()
         elif args == 'view':
             browser = BackupBrowser()
             browser.show_backups(mode='view')
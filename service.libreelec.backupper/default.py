@@ -23,6 +23,10 @@ def main():
         backup_manager.create_backup()
     elif command == 'restore':
         backup_manager.restore_backup()
+    elif command == 'restore_selective':
+        backup_manager.restore_backup(selective=True)
+    elif command == 'undo_restore':
+        backup_manager.undo_last_restore()
     elif command == 'view':
         backup_manager.view_backups()
     elif command == 'test_connection':
@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import gzip
+import hashlib
+import lzma
+import zlib
+import tarfile
+import zipfile
+import xbmc
+from .parallel_zip import ParallelZipWriter, LARGE_FILE_THRESHOLD
+from .backup_manifest import MANIFEST_NAME
+XZ_MAX_PRESET = 6  # Higher presets need hundreds of MB of RAM to compress
+
+
+class ZipArchiveWriter:
+    """Per-file compressed zip archive, members are compressed in parallel"""
+
+    extension = '.zip'
+
+    def __init__(self, target, compression_method, compresslevel, workers=None, policy=None, deduplicate=False, restore_path=None):
+        self.zipf = zipfile.ZipFile(target, 'w', compression=compression_method, compresslevel=compresslevel, allowZip64=True)
+        self.writer = ParallelZipWriter(self.zipf, compression_method, compresslevel, workers, policy, deduplicate, restore_path)
+
+    @property
+    def summary(self):
+        return self.writer.summary
+
+    def pop_member_info(self, arcname):
+        """Get (compression label, duplicate source, crc) of a written file and forget the details"""
+        compression = self.writer.choices.pop(arcname, None)
+        duplicate_of = self.writer.duplicates.pop(arcname, None)
+        zinfo = self.zipf.NameToInfo.get(duplicate_of or arcname)
+        return compression, duplicate_of, zinfo.CRC if zinfo is not None else None
+
+    def write_files(self, files):
+        """Write (file_path, arcname, file_size, ...) entries, yielding (entry, error) in input order"""
+        return self.writer.write_files(files)
+
+    def add_manifest(self, path):
+        """Add the spooled manifest file as the last member"""
+        self.zipf.write(path, MANIFEST_NAME)
+
+    def close(self):
+        self.zipf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _PaddedReader(io.RawIOBase):
+    """Reads exactly size bytes from a file that may have shrunk since it was scanned"""
+
+    def __init__(self, source, size, name):
+        self._source = source
+        self._remaining = size
+        self._name = name
+        self._padding = False
+        self.crc = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._remaining <= 0:
+            return 0
+        n = min(len(b), self._remaining)
+        data = b'' if self._padding else self._source.read(n)
+        if not data:
+            if not self._padding:
+                xbmc.log(f"File {self._name} shrank while being archived, padding it", xbmc.LOGWARNING)
+                self._padding = True
+            data = bytes(n)
+        b[:len(data)] = data
+        self.crc = zlib.crc32(data, self.crc)
+        self._remaining -= len(data)
+        return len(data)
+
+
+class TarArchiveWriter:
+    """Solid tar archive, the whole stream is compressed as one unit"""
+
+    extension = '.tar'
+    compression = None
+
+    def __init__(self, target, compression_method, compresslevel, workers=None, policy=None, deduplicate=False, restore_path=None):
+        if compression_method == zipfile.ZIP_STORED:
+            compresslevel = 0
+        # The target is either a path or an open stream, like zipfile accepts
+        self._owned_file = None
+        if isinstance(target, str):
+            target = self._owned_file = open(target, 'wb')
+        if self.compression == 'gz':
+            # mtime=0 keeps the gzip header reproducible
+            self._stream = gzip.GzipFile(fileobj=target, mode='wb', compresslevel=compresslevel, mtime=0)
+        elif self.compression == 'xz':
+            self._stream = lzma.LZMAFile(target, 'wb', preset=min(compresslevel, XZ_MAX_PRESET))
+        else:
+            self._stream = target
+        # Stream mode only ever writes forward, so the target may be a remote stream
+        self.tar = tarfile.open(fileobj=self._stream, mode='w|', format=tarfile.PAX_FORMAT)
+        self.summary = {}  # Solid archives use a single method for everything
+        self.deduplicate = deduplicate
+        self.restore_path = restore_path or (lambda arcname: arcname)  # Where a member lands on restore
+        self._duplicates = {}  # arcname -> arcname of the member holding the same content, until popped
+        self._crcs = {}  # arcname -> CRC-32, until popped
+        self._stored = {}  # sha256 digest -> (arcname, crc), kept for files small enough to be read whole
+
+    def _tarinfo(self, arcname, size, file_stat=None):
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.size = size
+        tarinfo.mode = 0o644
+        if file_stat is not None:
+            tarinfo.mtime = int(file_stat.st_mtime)
+        return tarinfo
+
+    def write_files(self, files):
+        """Write (file_path, arcname, file_size, stat) entries, yielding (entry, error) in input order"""
+        for entry in files:
+            file_path, arcname, file_size = entry[:3]
+            file_stat = entry[3] if len(entry) > 3 else None
+            try:
+                source = open(file_path, 'rb')
+                if file_size <= LARGE_FILE_THRESHOLD:
+                    # Small files are read whole so the header always matches the data
+                    with source:
+                        data = source.read()
+                    source = None
+            except OSError as e:
+                # Nothing has been written to the archive for this file yet
+                xbmc.log(f"Error backing up file {file_path}: {str(e)}", xbmc.LOGERROR)
+                yield entry, e
+                continue
+
+            if source is None:
+                crc = zlib.crc32(data)
+                if self.deduplicate and data:
+                    digest = hashlib.sha256(data).digest()
+                    stored = self._stored.get(digest)
+                    # Two names restoring to one file are both kept, the restore would copy the file onto itself
+                    if stored is not None and self.restore_path(stored[0]) != self.restore_path(arcname):
+                        self._duplicates[arcname], self._crcs[arcname] = stored
+                        yield entry, None
+                        continue
+                    self._stored.setdefault(digest, (arcname, crc))
+                self.tar.addfile(self._tarinfo(arcname, len(data), file_stat), io.BytesIO(data))
+                self._crcs[arcname] = crc
+            else:
+                # A read error half way through a member leaves the stream unusable, so it is not caught
+                with source:
+                    padded = _PaddedReader(source, file_size, file_path)
+                    reader = io.BufferedReader(padded, buffer_size=1024 * 1024)
+                    self.tar.addfile(self._tarinfo(arcname, file_size, file_stat), reader)
+                self._crcs[arcname] = padded.crc
+            yield entry, None
+
+    def pop_member_info(self, arcname):
+        """Get (compression label, duplicate source, crc) of a written file and forget the details"""
+        return None, self._duplicates.pop(arcname, None), self._crcs.pop(arcname, None)
+
+    def add_manifest(self, path):
+        """Add the spooled manifest file as the last member"""
+        with open(path, 'rb') as f:
+            self.tar.addfile(self._tarinfo(MANIFEST_NAME, os.path.getsize(path)), f)
+
+    def close(self):
+        try:
+            self.tar.close()
+            if self.compression:
+                # Writes the compressor trailer, the target itself stays open
+                self._stream.close()
+        finally:
+            if self._owned_file is not None:
+                self._owned_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TarGzArchiveWriter(TarArchiveWriter):
+    extension = '.tar.gz'
+    compression = 'gz'
+
+
+class TarXzArchiveWriter(TarArchiveWriter):
+    extension = '.tar.xz'
+    compression = 'xz'
+
+
+ARCHIVE_BACKENDS = {
+    'zip': ZipArchiveWriter,
+    'tar.gz': TarGzArchiveWriter,
+    'tar.xz': TarXzArchiveWriter
+}
+ARCHIVE_EXTENSIONS = tuple(backend.extension for backend in ARCHIVE_BACKENDS.values())
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz')
+
+
+class ArchiveEntry:
+    """A single file stored in a tar archive"""
+
+    def __init__(self, filename, file_size, member):
+        self.filename = filename
+        self.file_size = file_size
+        self.member = member
+
+
+class TarArchiveReader:
+    """Read a tar archive through the same interface zipfile.ZipFile offers"""
+
+    def __init__(self, path, fileobj=None):
+        # Listing the members decompresses the stream once, restoring them in order takes one more pass
+        self.tar = tarfile.open(path, 'r:*', fileobj=fileobj)
+        self.filelist = [ArchiveEntry(member.name, member.size, member) for member in self.tar.getmembers() if member.isfile()]
+        self._entries = {entry.filename: entry for entry in self.filelist}
+
+    def namelist(self):
+        return [entry.filename for entry in self.filelist]
+
+    def getinfo(self, name):
+        return self._entries[name]
+
+    def open(self, entry):
+        """Open an entry, or the entry with the given name, for reading"""
+        if isinstance(entry, str):
+            entry = self._entries[entry]
+        return self.tar.extractfile(entry.member)
+
+    def read(self, name):
+        with self.open(name) as f:
+            return f.read()
+
+    def close(self):
+        self.tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _StreamMember(io.RawIOBase):
+    """Member of a tar stream, tarfile's own member file asks the stream whether it can seek, which it cannot answer"""
+
+    def __init__(self, member_file):
+        self._file = member_file
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._file.readinto(b)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class TarStreamReader:
+    """Read a tar archive front to back from a stream that cannot seek
+
+    entries() yields the files as they arrive and only the one yielded last
+    can be opened. Entries already passed stay known to getinfo(), so
+    duplicates can still refer to them.
+    """
+
+    def __init__(self, fileobj):
+        self.tar = tarfile.open(fileobj=fileobj, mode='r|*')
+        self._entries = {}
+        self._current = None
+
+    def entries(self):
+        for member in self.tar:
+            if member.isfile():
+                self._current = self._entries[member.name] = ArchiveEntry(member.name, member.size, member)
+                yield self._current
+
+    def getinfo(self, name):
+        return self._entries[name]
+
+    def open(self, entry):
+        """Open the current entry, or the entry with the given name if it is the current one"""
+        if isinstance(entry, str):
+            entry = self._entries[entry]
+        if entry is not self._current:
+            raise IOError(f"{entry.filename} has already been passed in the archive stream")
+        return io.BufferedReader(_StreamMember(self.tar.extractfile(entry.member)))
+
+    def read(self, name):
+        with self.open(name) as f:
+            return f.read()
+
+    def close(self):
+        self.tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_archive(path, fileobj=None):
+    """Open a backup archive for reading, whatever backend wrote it, from fileobj when given"""
+    source = fileobj if fileobj is not None else path
+    is_tar = path.endswith(TAR_EXTENSIONS) or (not zipfile.is_zipfile(source) and tarfile.is_tarfile(source))
+    if fileobj is not None:
+        fileobj.seek(0)
+    if is_tar:
+        return TarArchiveReader(path, fileobj)
+    return zipfile.ZipFile(source, 'r')
+
+
+class DuplicateEntry:
+    """An archive path whose content is stored under another member"""
+
+    def __init__(self, filename, source):
+        self.filename = filename
+        self.file_size = source.file_size
+        self.source = source
+
+
+class DeduplicatedArchive:
+    """Reader wrapper that resolves duplicate entries to the member holding their content"""
+
+    def __init__(self, archive, duplicates):
+        self.archive = archive
+        self.duplicates = duplicates  # arcname -> arcname of the stored member
+        self.restored = {}  # member name -> path it was restored to in this run
+
+    def duplicate_entries(self, names):
+        """Build entries for the given duplicate paths"""
+        return [DuplicateEntry(name, self.archive.getinfo(self.duplicates[name])) for name in names]
+
+    def mark_restored(self, entry, path):
+        self.restored[entry.filename] = path
+
+    def restored_to(self, entry, path):
+        """Check if a duplicate's content was already restored to path, copying it would truncate its own source"""
+        return isinstance(entry, DuplicateEntry) and self.restored.get(entry.source.filename) == path
+
+    def open(self, entry):
+        if isinstance(entry, DuplicateEntry):
+            # Copying the already restored file avoids rewinding a solid archive
+            restored_path = self.restored.get(entry.source.filename)
+            if restored_path:
+                try:
+                    return open(restored_path, 'rb')
+                except OSError:
+                    pass
+            entry = entry.source
+        return self.archive.open(entry)
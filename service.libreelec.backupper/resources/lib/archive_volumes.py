@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import re
+import bisect
+import hashlib
+import shutil
+import itertools
+import xbmc
+
+from .archive_backends import ARCHIVE_EXTENSIONS, open_archive
+
+VOLUME_PATTERN = re.compile(r'^(.+)\.(\d{3})$')  # <archive name>.001, .002, ...
+
+
+def volume_name(archive_name, number):
+    """Get the name of one volume of a split archive, numbered from 1"""
+    return f"{archive_name}.{number:03d}"
+
+
+def split_volume_name(filename):
+    """Get (archive name, volume number) of a volume, (None, None) for other files"""
+    match = VOLUME_PATTERN.match(filename)
+    if match and match.group(1).endswith(ARCHIVE_EXTENSIONS):
+        return match.group(1), int(match.group(2))
+    return None, None
+
+
+def group_volumes(filenames):
+    """Collect the volume sets in a directory listing, archive name -> volume names in order
+
+    A set is listed once its first volume exists, the first volume is always
+    stored last. Sets with gaps in the numbering are left out.
+    """
+    numbers = {}
+    for filename in filenames:
+        archive_name, number = split_volume_name(filename)
+        if archive_name:
+            numbers.setdefault(archive_name, set()).add(number)
+    return {
+        archive_name: [volume_name(archive_name, number) for number in sorted(found)]
+        for archive_name, found in numbers.items()
+        if 1 in found and found == set(range(1, max(found) + 1))
+    }
+
+
+def split_archive(path, volume_size):
+    """Split a finished archive into volumes next to it, returns their paths in order
+
+    Volumes are cut from the end and the archive is truncated behind each one,
+    so the split needs no more free space than one volume.
+    """
+    count = max(1, -(-os.path.getsize(path) // volume_size))
+    paths = [volume_name(path, number) for number in range(1, count + 1)]
+    with open(path, 'r+b') as archive:
+        for number in range(count, 1, -1):
+            start = (number - 1) * volume_size
+            archive.seek(start)
+            with open(paths[number - 1], 'wb') as volume:
+                shutil.copyfileobj(archive, volume, 1024 * 1024)
+            archive.truncate(start)
+    os.replace(path, paths[0])
+    return paths
+
+
+def join_volumes(volume_paths, path):
+    """Concatenate downloaded volumes into the archive, each volume is removed once copied"""
+    with open(path, 'wb') as archive:
+        for volume_path in volume_paths:
+            with open(volume_path, 'rb') as volume:
+                shutil.copyfileobj(volume, archive, 1024 * 1024)
+            os.remove(volume_path)
+
+
+def find_volumes(path):
+    """Get the volume paths of the split archive stored under path, [] unless there is one"""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        return []
+    volume_sets = group_volumes(os.listdir(directory))
+    return [os.path.join(directory, name) for name in volume_sets.get(os.path.basename(path), [])]
+
+
+def stored_archive_exists(path):
+    """Check for a local archive, whole or split into volumes"""
+    return os.path.exists(path) or bool(find_volumes(path))
+
+
+def stored_archive_size(path):
+    """Get the size of a local archive, the volumes of a split one added up"""
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(volume) for volume in find_volumes(path))
+
+
+def open_stored_archive(path):
+    """Open a local archive for reading, a split one is read straight from its volumes"""
+    volumes = [] if os.path.exists(path) else find_volumes(path)
+    if not volumes:
+        return open_archive(path)
+    return open_archive(path, VolumeReader(volumes))
+
+
+class VolumeWriter(io.RawIOBase):
+    """Writable target that cuts an archive into volumes of volume_size bytes as it is written
+
+    Not seekable, so zipfile records member sizes in data descriptors as it
+    does for streamed uploads. Every full volume is closed and handed to
+    on_volume(path, number) before the next one is started, the callback
+    may block to keep the staging area small. The SHA-256 of each volume is
+    computed on the way and known by the time it is handed over.
+    """
+
+    def __init__(self, path, volume_size, on_volume):
+        self.path = path
+        self.volume_size = volume_size
+        self.on_volume = on_volume
+        self.paths = []  # Volumes started so far, in order
+        self.checksums = {}  # Volume path -> SHA-256, for handed over volumes
+        self.sizes = {}  # Volume path -> bytes, for handed over volumes
+        self._file = None
+        self._digest = None
+        self._volume_bytes = 0
+        self._position = 0
+        self._error = None
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, b):
+        # The archive writer may carry on after a failed write, the error sticks until close
+        if self._error is not None:
+            raise IOError(f"Storing volumes failed: {str(self._error)}")
+        try:
+            return self._write(memoryview(b).cast('B'))
+        except Exception as e:
+            self._error = e
+            raise
+
+    def _write(self, data):
+        written = 0
+        while written < len(data):
+            # A volume is only started once there is data for it, so none is ever empty
+            if self._file is None:
+                self.paths.append(volume_name(self.path, len(self.paths) + 1))
+                self._file = open(self.paths[-1], 'wb')
+                self._digest = hashlib.sha256()
+                self._volume_bytes = 0
+            chunk = data[written:written + self.volume_size - self._volume_bytes]
+            self._file.write(chunk)
+            self._digest.update(chunk)
+            self._volume_bytes += len(chunk)
+            written += len(chunk)
+            if self._volume_bytes == self.volume_size:
+                self._finish_volume()
+        self._position += written
+        return written
+
+    def _finish_volume(self):
+        self._file.close()
+        self._file = None
+        self.checksums[self.paths[-1]] = self._digest.hexdigest()
+        self.sizes[self.paths[-1]] = self._volume_bytes
+        self.on_volume(self.paths[-1], len(self.paths))
+
+    def tell(self):
+        return self._position
+
+    @property
+    def bytes_written(self):
+        return self._position
+
+    def close(self):
+        """Finish the last volume and hand it over"""
+        if not self.closed:
+            try:
+                if self._error is not None:
+                    raise IOError(f"Storing volumes failed: {str(self._error)}")
+                if self._file is not None:
+                    self._finish_volume()
+            finally:
+                super().close()
+
+    def abort(self):
+        """Close the open volume after a failure without handing it over"""
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            super().close()
+        except Exception as e:
+            xbmc.log(f"Error closing aborted volume: {str(e)}", xbmc.LOGWARNING)
+
+
+class VolumeReader(io.RawIOBase):
+    """Read the volumes of a split archive as one seekable file, nothing is copied
+
+    Only the volume under the read position is open at a time.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.sizes = [os.path.getsize(path) for path in paths]
+        self.starts = list(itertools.accumulate([0] + self.sizes[:-1]))
+        self.size = sum(self.sizes)
+        self._position = 0
+        self._index = None
+        self._file = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = offset
+        return offset
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        filled = 0
+        # Reads are filled across volume boundaries, zipfile expects whole headers
+        while filled < len(view) and self._position < self.size:
+            index = bisect.bisect_right(self.starts, self._position) - 1
+            if index != self._index:
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self.paths[index], 'rb')
+                self._index = index
+            offset = self._position - self.starts[index]
+            self._file.seek(offset)
+            count = self._file.readinto(view[filled:filled + self.sizes[index] - offset])
+            if not count:
+                raise IOError(f"Volume {os.path.basename(self.paths[index])} is shorter than expected")
+            filled += count
+            self._position += count
+        return filled
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import xbmc
+
+INDEX_VERSION = 1
+
+
+def file_state(stat_result, digest=None):
+    """Index entry of a file, a copy made afresh for every backup is identified by its content"""
+    if digest is not None:
+        return [stat_result.st_size, digest]
+    return [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino]
+
+
+class BackupIndex:
+    """Persistent file-state index used to drive incremental backups"""
+
+    def __init__(self, index_path, signature):
+        self.index_path = index_path
+        self.signature = signature  # Identifies the item selection and destination the index belongs to
+        self.chain = []  # Backup names from the last full backup up to the newest increment
+        self.increments_since_full = 0
+        self.files = {}  # arcname -> file_state() from the last successful backup
+        self.new_files = {}  # State being collected during the current run
+        self.seen = set()  # Every arcname found by the current scan
+        self.load()
+
+    def load(self):
+        """Load the index from disk, starting empty if it is missing or belongs to another setup"""
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION or data.get('signature') != self.signature:
+                xbmc.log("BackupIndex: Index does not match current backup settings, ignoring it", xbmc.LOGINFO)
+                return False
+            self.chain = data.get('chain', [])
+            self.increments_since_full = data.get('increments_since_full', 0)
+            self.files = data.get('files', {})
+            xbmc.log(f"BackupIndex: Loaded {len(self.files)} entries, chain length {len(self.chain)}", xbmc.LOGINFO)
+            return True
+        except (OSError, ValueError) as e:
+            xbmc.log(f"BackupIndex: Error loading index {self.index_path}: {str(e)}", xbmc.LOGWARNING)
+            self.chain = []
+            self.increments_since_full = 0
+            self.files = {}
+            return False
+
+    def needs_full_backup(self, full_interval):
+        """Check whether the next backup has to be a full one"""
+        if not self.chain or not self.files:
+            return True
+        return self.increments_since_full + 1 >= full_interval
+
+    def is_changed(self, arcname, stat_result, digest=None):
+        """Mark a scanned file as seen and report whether it differs from the last run"""
+        self.seen.add(arcname)
+        previous = self.files.get(arcname)
+        if previous is None:
+            return True
+        return previous != file_state(stat_result, digest)
+
+    def record(self, arcname, stat_result, digest=None):
+        """Record the state of a file that is present in the backup chain after this run"""
+        self.new_files[arcname] = file_state(stat_result, digest)
+
+    def keep(self, arcname):
+        """Carry an unchanged file over into the new state"""
+        if arcname in self.files:
+            self.new_files[arcname] = self.files[arcname]
+
+    def deleted_files(self):
+        """Get files present in the last run that no longer exist"""
+        return sorted(arcname for arcname in self.files if arcname not in self.seen)
+
+    def commit(self, backup_name, is_full):
+        """Persist the collected state once the backup has been stored successfully"""
+        if is_full:
+            self.chain = [backup_name]
+            self.increments_since_full = 0
+        else:
+            self.chain = self.chain + [backup_name]
+            self.increments_since_full += 1
+        self.files = self.new_files
+        self.new_files = {}
+        self.seen = set()
+
+        data = {
+            'version': INDEX_VERSION,
+            'signature': self.signature,
+            'chain': self.chain,
+            'increments_since_full': self.increments_since_full,
+            'files': self.files
+        }
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temp_path = self.index_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temp_path, self.index_path)
+            xbmc.log(f"BackupIndex: Saved {len(self.files)} entries to {self.index_path}", xbmc.LOGINFO)
+            return True
+        except OSError as e:
+            xbmc.log(f"BackupIndex: Error saving index: {str(e)}", xbmc.LOGERROR)
+            return False
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import io
+import json
+
+MANIFEST_VERSION = 2
+MANIFEST_NAME = 'manifest.jsonl'
+LEGACY_MANIFEST_NAME = 'manifest.json'  # Single JSON document written by older versions
+MANIFEST_NAMES = (MANIFEST_NAME, LEGACY_MANIFEST_NAME)
+
+
+class ManifestWriter:
+    """Write an archive manifest as JSON Lines while the archive is being filled
+
+    Every line is an object with a 'record' key. The header comes first, then
+    one 'file' record per stored file, 'deleted' records for incremental
+    tombstones and a closing 'summary' with the totals. Records go straight to
+    a spool file, so memory use does not grow with the number of files.
+    """
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.file_count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+        # Tombstones get their own records, everything else added later goes to the summary
+        self._header_keys = set(manifest) | {'deleted_files'}
+        header = {key: value for key, value in manifest.items() if key != 'deleted_files'}
+        self._write(dict(header, record='header', version=MANIFEST_VERSION))
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def add_file(self, arcname, compression=None, duplicate_of=None):
+        """Record a stored file, with its compression if it differs from the configured one"""
+        record = {'record': 'file', 'name': arcname}
+        if compression:
+            record['compression'] = compression
+        if duplicate_of:
+            record['duplicate_of'] = duplicate_of
+        self._write(record)
+        self.file_count += 1
+
+    def finish(self, manifest):
+        """Write the tombstones and totals that are only known once every file is stored"""
+        for arcname in manifest.get('deleted_files', []):
+            self._write({'record': 'deleted', 'name': arcname})
+        summary = {key: value for key, value in manifest.items() if key not in self._header_keys}
+        self._write(dict(summary, record='summary', file_count=self.file_count))
+        self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_manifest(archive):
+    """Read the manifest of an open archive into a dict, whichever version wrote it
+
+    Stored files are not collected, duplicates, compression choices and
+    tombstones are gathered into the same keys the single document used.
+    """
+    try:
+        stream = archive.open(MANIFEST_NAME)
+    except KeyError:
+        return json.loads(archive.read(LEGACY_MANIFEST_NAME))
+
+    manifest = {'duplicates': {}, 'compression': {}, 'deleted_files': []}
+    with io.TextIOWrapper(stream, encoding='utf-8') as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop('record', None)
+            if kind == 'file':
+                if 'duplicate_of' in record:
+                    manifest['duplicates'][record['name']] = record['duplicate_of']
+                if 'compression' in record:
+                    manifest['compression'][record['name']] = record['compression']
+            elif kind == 'deleted':
+                manifest['deleted_files'].append(record['name'])
+            elif kind in ('header', 'summary'):
+                manifest.update(record)
+    return manifest
@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import io
+import gzip
+import json
+import shutil
+from datetime import datetime
+
+SIDECAR_VERSION = 1
+SIDECAR_EXTENSION = '.idx'
+
+
+def sidecar_name(archive_name):
+    """Get the name of the sidecar index stored next to an archive"""
+    return archive_name + SIDECAR_EXTENSION
+
+
+def timestamp_from_name(backup_name):
+    """Get the YYYYMMDD_HHMMSS timestamp embedded in a backup name, or None"""
+    match = re.search(r'(\d{8}_\d{6})', backup_name)
+    return match.group(1) if match else None
+
+
+def format_timestamp(timestamp):
+    """Turn a YYYYMMDD_HHMMSS timestamp into a readable date"""
+    try:
+        return datetime.strptime(timestamp, '%Y%m%d_%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return "Unknown date"
+
+
+class SidecarWriter:
+    """Build the sidecar index of an archive while it is being written
+
+    File lines are spooled to disk as they come in, the compressed index with
+    the header in front is only assembled once the totals are known.
+    """
+
+    def __init__(self, path, archive_name, manifest):
+        self.path = path
+        self.header = {
+            'version': SIDECAR_VERSION,
+            'archive': archive_name,
+            'timestamp': manifest['timestamp'],
+            'items': manifest['items'],
+            'backup_type': manifest['backup_type']
+        }
+        if 'base_backup' in manifest:
+            self.header['base_backup'] = manifest['base_backup']
+        self.file_count = 0
+        self._spool_path = path + '.files'
+        self._spool = open(self._spool_path, 'w', encoding='utf-8')
+
+    def add_file(self, arcname, size, mtime, crc):
+        self._spool.write(json.dumps([arcname, size, int(mtime), crc], separators=(',', ':')) + '\n')
+        self.file_count += 1
+
+    def finish(self, manifest, compressed_size, checksums=None):
+        """Write the compressed index once the archive is complete, checksums maps stored file names to SHA-256"""
+        self._spool.close()
+        self.header.update({
+            'file_count': self.file_count,
+            'original_size': manifest['total_size'],
+            'compressed_size': compressed_size,
+            'deleted_files': manifest.get('deleted_files', [])
+        })
+        if checksums:
+            self.header['checksums'] = checksums
+        # mtime=0 keeps identical indexes byte for byte identical
+        with gzip.GzipFile(self.path, 'wb', mtime=0) as target:
+            target.write((json.dumps(self.header, separators=(',', ':')) + '\n').encode('utf-8'))
+            with open(self._spool_path, 'rb') as spool:
+                shutil.copyfileobj(spool, target, 1024 * 1024)
+        os.remove(self._spool_path)
+
+    def close(self):
+        """Drop the spool of an index that will not be finished"""
+        if not self._spool.closed:
+            self._spool.close()
+        if os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+
+
+class BackupSidecar:
+    """Small index describing a backup archive, read back from the backup location
+
+    The sidecar is gzip compressed JSON Lines. The first line is a header with
+    the totals, every further line is [arcname, size, mtime, crc] of one file.
+    Listing backups only needs the header, comparing two backups the file lines,
+    neither needs the archive itself.
+    """
+
+    def __init__(self, header, files=None, data=None):
+        self.header = header
+        self._files = files  # arcname -> [size, mtime, crc], parsed on first use
+        self._data = data  # Compressed index the file lines are read from
+
+    @property
+    def files(self):
+        if self._files is None:
+            self._files = self._parse_files()
+        return self._files
+
+    def _parse_files(self):
+        """Parse the file lines of the compressed index, the header line is skipped"""
+        files = {}
+        if self._data is None:
+            return files
+        with gzip.GzipFile(fileobj=io.BytesIO(self._data)) as source:
+            source.readline()
+            for line in source:
+                if line.strip():
+                    arcname, size, mtime, crc = json.loads(line)
+                    files[arcname] = [size, mtime, crc]
+        self._data = None
+        return files
+
+    @property
+    def items(self):
+        return self.header.get('items', [])
+
+    @property
+    def timestamp(self):
+        return self.header.get('timestamp')
+
+    @property
+    def file_count(self):
+        if 'file_count' in self.header:
+            return self.header['file_count']
+        return len(self.files)
+
+    @property
+    def original_size(self):
+        return self.header.get('original_size', 0)
+
+    @property
+    def compressed_size(self):
+        return self.header.get('compressed_size', 0)
+
+    @property
+    def is_incremental(self):
+        return self.header.get('backup_type') == 'incremental'
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Read the header line only, the file lines are parsed when files is first used"""
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as source:
+            line = source.readline()
+        if not line.strip():
+            raise ValueError("Empty sidecar index")
+        header = json.loads(line)
+        if header.get('version') != SIDECAR_VERSION:
+            raise ValueError(f"Unsupported sidecar index version {header.get('version')}")
+        return cls(header, data=data)
+
+    def diff(self, older):
+        """Compare with an older sidecar, returns (added, removed, changed) arcname lists"""
+        added = sorted(name for name in self.files if name not in older.files)
+        removed = sorted(name for name in older.files if name not in self.files)
+        changed = []
+        for name, (size, mtime, crc) in self.files.items():
+            previous = older.files.get(name)
+            if previous is None:
+                continue
+            # The checksum decides when both sides have one, size and mtime otherwise
+            if crc is not None and previous[2] is not None:
+                if crc != previous[2]:
+                    changed.append(name)
+            elif [size, mtime] != previous[:2]:
+                changed.append(name)
+        return added, removed, sorted(changed)
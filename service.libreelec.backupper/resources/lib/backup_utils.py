@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import copy
 import glob
 import shutil
 import xbmc
@@ -12,16 +13,41 @@ from datetime import datetime, timedelta
 import zipfile
 import json
 import time
+import calendar
+import itertools
+import sqlite3
 import gc  # Add garbage collector import
 import re
 import ftplib
 import socket
+import shlex
+import threading
 import urllib.parse
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import xbmcgui
 from .email_utils import EmailNotifier
+from .backup_index import BackupIndex
+from .archive_backends import ARCHIVE_BACKENDS, ARCHIVE_EXTENSIONS, TAR_EXTENSIONS, DeduplicatedArchive, TarStreamReader, open_archive
+from .backup_manifest import ManifestWriter, MANIFEST_NAME, MANIFEST_NAMES, read_manifest
+from .file_collector import FileCollector, FILE_ARCNAMES
+from .compression_policy import CompressionPolicy
+from .exclusion_rules import ExclusionRules
+from .database_snapshot import list_databases, snapshot_database
+from .backup_sidecar import BackupSidecar, SidecarWriter, SIDECAR_EXTENSION, sidecar_name, timestamp_from_name, format_timestamp
+from .throttle import ResourceThrottle
+from .remote_streams import FileStreamWriter, QueueStreamWriter, RangeReader, PrefetchReader, reader_for
+from .upload_journal import UploadJournal, UPLOAD_JOURNAL_NAME, partial_name, file_sha256
+from .archive_volumes import (split_volume_name, group_volumes, split_archive, join_volumes, VolumeWriter,
+                             open_stored_archive, stored_archive_exists, stored_archive_size)
+from .parallel_upload import ParallelUploader
+from .transfer import TransferProgress, HashingWriter, read_chunks, copy_file
+from .chunk_repository import ChunkRepository, SnapshotReader, SNAPSHOT_EXTENSION, is_repository_file, snapshot_packs
+from .restore_selection import choose_restore_files
+from .restore_mounts import MountSession
+from .restore_staging import StagedRestore, RestoreRollback, ROLLBACK_JOURNAL_NAME
+from .parallel_extract import ParallelExtractor, directories_to_create
 
 # Try to import paramiko, but don't fail if it's not available
 try:
@@ -31,6 +57,23 @@ except ImportError:
     PARAMIKO_AVAILABLE = False
     xbmc.log("Paramiko module not available. SFTP functionality will be disabled.", xbmc.LOGWARNING)
 
+# File extensions of restorable backups (zip archives and repository snapshots)
+BACKUP_EXTENSIONS = ARCHIVE_EXTENSIONS + (SNAPSHOT_EXTENSION,)
+# Archive backends selectable in settings, format 1 is the deduplicated repository
+ARCHIVE_FORMATS = {0: 'zip', 2: 'tar.gz', 3: 'tar.xz'}
+
+UPLOAD_ATTEMPTS = 3  # Tries per upload, each one continues where the previous stopped
+UPLOAD_RETRY_DELAY = 10  # Seconds before the first retry, doubled for each further one
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+WEBDAV_CHUNK_SIZE = 8 * 1024 * 1024  # One request per chunk when the server takes partial uploads
+SEAM_CHECK_SIZE = 64 * 1024  # Bytes before a resume point compared with the local file
+SFTP_HASH_TIMEOUT = 600  # Seconds sha256sum may take on the server
+MAX_PENDING_UPLOADS = 2  # Archives kept back for a later upload when the remote is unreachable
+SSH_KEEPALIVE_INTERVAL = 30  # Seconds between keepalive packets while a job holds the SFTP connection
+# Volume sizes selectable in settings, 0 splits only for parallel uploads
+VOLUME_SIZES = {0: 0, 1: 64 * 1024 * 1024, 2: 256 * 1024 * 1024, 3: 1024 * 1024 * 1024}
+MIN_PARALLEL_VOLUME = 16 * 1024 * 1024  # Smaller archives are not split just to upload them in parallel
+
 class BackupManager:
     """Utility class to manage config backups"""
     
@@ -44,6 +87,19 @@ class BackupManager:
         self._cleanup_old_temp_files()  # Clean up any old temp files on startup
         self.progress_dialog = None  # Initialize progress dialog
         self.current_notification = None  # Track current notification
+        self.restored_databases = []  # Databases written back by the current restore
+        self.mounts = MountSession()  # Read-write window over the filesystems a restore writes to
+        self.staging = None  # Staging trees of the running restore
+        self._upload_journal = None  # Loaded on the first upload
+        self._journal_lock = threading.Lock()  # Upload streams may be the first to ask for the journal
+        self._stream_of = None  # Backup manager this one is an extra upload stream of
+        self._session_depth = 0  # Jobs holding the remote connection open
+        self._connection_key = None  # Location the open connection belongs to
+        self._sidecars = {}  # Backup name -> sidecar index read during this session, None if it has none
+        self._remote_archives = {}  # Session temp path -> RangeReader of a remote archive restored in place
+        self._range_handles = {}  # Remote file name -> handle kept open for range reads
+        self._staged_copies = {}  # arcname -> [path, SHA-256 or None] of a copy made afresh for this backup
+        self.throttle = ResourceThrottle()  # Replaced by the configured throttle while a backup runs
         self.email_notifier = EmailNotifier()
     
     def update_backup_location(self):
@@ -150,7 +206,7 @@ class BackupManager:
         adapter = HTTPAdapter(
             max_retries=retry_strategy,
             pool_connections=1,  # maintain one connection in the pool
-            pool_maxsize=1,  # max number of connections in the pool
+            pool_maxsize=self.get_upload_streams(),  # one connection per parallel upload stream
             pool_block=False  # don't block when pool is full
         )
         session.mount("http://", adapter)
@@ -162,11 +218,57 @@ class BackupManager:
         self._webdav_session = session
         return session
 
+    def begin_remote_session(self):
+        """Hold the remote connection open for a job, connect and disconnect calls within it reuse one connection"""
+        self._session_depth += 1
+    
+    def end_remote_session(self):
+        """Release the hold of a job, the connection is closed when the outermost job ends"""
+        self._session_depth = max(0, self._session_depth - 1)
+        if not self._session_depth:
+            self.disconnect_remote()
+    
     def connect_remote(self):
-        """Connect to the remote location"""
+        """Connect to the remote location, within a job the open connection is reused while it works"""
         if self.location_type == 0:  # Local
             return True
+        if self._stream_of is not None and self.remote_type != 2:
+            return self._connect_stream()
         
+        if self.remote_connection and self._session_depth:
+            if self._connection_key == self.get_location_key() and self._remote_alive():
+                return True
+            self._close_remote()
+        
+        connected = self._open_remote()
+        self._connection_key = self.get_location_key() if connected else None
+        return connected
+    
+    def reconnect_remote(self):
+        """Replace a connection that a failed transfer may have left unusable"""
+        if self.remote_connection:
+            self._close_remote()
+        return self.connect_remote()
+    
+    def _remote_alive(self):
+        """Check that the open connection still answers, cheap enough to run before every reuse"""
+        try:
+            if self.remote_type == 1:  # NFS
+                return os.path.ismount(self.remote_connection)
+            elif self.remote_type == 2:  # FTP
+                self.remote_connection.voidcmd('NOOP')
+            elif self.remote_type == 3:  # SFTP
+                if not self.remote_connection.get_channel().get_transport().is_active():
+                    return False
+                self.remote_connection.stat('.')
+            # SMB goes through xbmcvfs and WebDAV through the pooled session, both reconnect on their own
+            return True
+        except Exception as e:
+            xbmc.log(f"Remote connection lost, reconnecting: {str(e)}", xbmc.LOGINFO)
+            return False
+    
+    def _open_remote(self):
+        """Open a new connection to the remote location"""
         try:
             if self.remote_type == 0:  # SMB
                 # Use Kodi's built-in SMB support via xbmcvfs
@@ -260,6 +362,8 @@ class BackupManager:
                 host = self.remote_path.split('/')[0]
                 ssh.connect(host, port=self.remote_port, username=self.remote_username, password=self.remote_password)
                 
+                # The connection stays open for the whole job, idle while archives are compressed
+                ssh.get_transport().set_keepalive(SSH_KEEPALIVE_INTERVAL)
                 sftp = ssh.open_sftp()
                 
                 # Change to the specified directory if provided
@@ -343,9 +447,22 @@ class BackupManager:
             return False
     
     def disconnect_remote(self):
-        """Disconnect from the remote location"""
+        """Disconnect from the remote location, unless a job still holds the connection"""
         if self.location_type == 0 or not self.remote_connection:  # Local or not connected
             return
+        if self._session_depth and self._stream_of is None:
+            return
+        self._close_remote()
+    
+    def _close_remote(self):
+        """Close the connection to the remote location"""
+        self._connection_key = None
+        if self._stream_of is not None and self.remote_type != 2:
+            # Extra streams only own their SFTP channel, the rest belongs to the main connection
+            if self.remote_type == 3:  # SFTP
+                self.remote_connection.close()
+            self.remote_connection = None
+            return
         
         try:
             if self.remote_type == 0:  # SMB
@@ -376,6 +493,53 @@ class BackupManager:
         except Exception as e:
             xbmc.log(f"Error disconnecting from remote location: {str(e)}", xbmc.LOGERROR)
     
+    def _connect_stream(self):
+        """Connect an extra upload stream through the main connection"""
+        main = self._stream_of.remote_connection
+        if not main:
+            return False
+        if self.remote_type == 3:  # SFTP
+            # Another channel on the same SSH transport, no second handshake
+            sftp = paramiko.SFTPClient.from_transport(main.get_channel().get_transport())
+            sftp.chdir(main.getcwd())
+            self.remote_connection = sftp
+        elif self.remote_type == 4:  # WebDAV
+            # The pooled session is shared, the partial upload state is kept per stream
+            self.remote_connection = dict(main)
+        else:
+            # SMB and NFS paths are shared, FTP logs in again
+            self.remote_connection = main
+        return True
+    
+    def get_upload_streams(self):
+        """Number of connections archive volumes are uploaded over"""
+        return max(1, self.addon.getSettingInt('upload_streams'))
+    
+    def _open_upload_stream(self):
+        """Open one more connection to the remote location for a parallel upload stream"""
+        stream = copy.copy(self)
+        stream._stream_of = self
+        stream._session_depth = 0  # Streams open and close their own connections
+        stream.remote_connection = None
+        stream._connection_key = None
+        # The copy is shallow, every stream thread gets containers of its own
+        stream._temp_files = set()
+        stream._sidecars = {}
+        stream._remote_archives = {}
+        stream._range_handles = {}
+        stream.restored_databases = []
+        # The journal is shared on purpose, it takes its own lock around every change
+        stream._upload_journal = self.get_upload_journal()
+        # Progress is reported for all streams together
+        stream.notify = lambda *args, **kwargs: None
+        stream.update_progress = lambda *args, **kwargs: None
+        try:
+            if stream.connect_remote():
+                return stream
+        except Exception as e:
+            xbmc.log(f"Error opening upload stream: {str(e)}", xbmc.LOGWARNING)
+        return None
+    
     def get_remote_path(self, filename):
         """Get the full path to a file on the remote location"""
         if self.location_type == 0:  # Local
@@ -400,8 +564,30 @@ class BackupManager:
             else:
                 return f"{base_url}/{filename}"
     
-    def upload_file(self, local_path, remote_filename):
-        """Upload a file to the remote location"""
+    def get_upload_journal(self):
+        """Journal of interrupted uploads, kept in the add-on profile so it survives a restart"""
+        with self._journal_lock:
+            if self._upload_journal is None:
+                profile_dir = xbmcvfs.translatePath(self.addon.getAddonInfo('profile'))
+                self._upload_journal = UploadJournal(os.path.join(profile_dir, UPLOAD_JOURNAL_NAME))
+            return self._upload_journal
+    
+    def get_location_key(self):
+        """Identify the backup location, state kept per location is keyed by this"""
+        if self.location_type == 0:  # Local
+            return self.backup_dir
+        return f"{self.remote_type}:{self.remote_path}"
+    
+    def upload_file(self, local_path, remote_filename, publish=True, sha256=None):
+        """Upload a file to the remote location, continuing where an interrupted upload stopped
+        
+        The data goes to a partial file that is only renamed to remote_filename
+        once its size, and its hash where the server can compute one, match
+        the local file. Failed attempts are retried after reconnecting, the
+        journal lets a later run continue the same upload. With publish False
+        the verified partial file is left for the caller to rename. A sha256
+        computed while the file was written spares hashing it again.
+        """
         try:
             if not os.path.exists(local_path):
                 return False
@@ -412,89 +598,410 @@ class BackupManager:
             # Show initial upload notification
             self.notify("Uploading backup...", persistent=True)
             self.update_progress(0, "Uploading backup...", f"Size: {file_size_str}")
-
+            
+            journal = self.get_upload_journal()
+            journal.begin(remote_filename, local_path, self.get_location_key(), sha256)
+            
+            for attempt in range(UPLOAD_ATTEMPTS):
+                if attempt:
+                    delay = UPLOAD_RETRY_DELAY * 2 ** (attempt - 1)
+                    xbmc.log(f"Retrying upload of {remote_filename} in {delay} seconds", xbmc.LOGINFO)
+                    if xbmc.Monitor().waitForAbort(delay):
+                        break
+                    # A broken transfer often leaves the control connection unusable
+                    if not self.reconnect_remote():
+                        continue
+                if not self.remote_connection:
+                    return False
+                try:
+                    offset = self._resume_offset(remote_filename, local_path)
+                    journal.start_attempt(remote_filename, offset)
+                    self._send_file(local_path, remote_filename, offset)
+                    if not self._verify_upload(remote_filename, file_size):
+                        journal.restart(remote_filename)
+                        continue
+                    if not publish:
+                        return True
+                    self._publish_partial_file(remote_filename)
+                    
+                    # Show completion notification
+                    self.notify("Upload complete", persistent=True)
+                    self.update_progress(100, "Upload complete")
+                    return True
+                except Exception as e:
+                    xbmc.log(f"Upload attempt {attempt + 1} of {remote_filename} failed: {str(e)}", xbmc.LOGWARNING)
+            
+            journal.save()
+            return False
+                
+        except Exception as e:
+            xbmc.log(f"Error uploading file: {str(e)}", xbmc.LOGERROR)
+            return False
+    
+    def _resume_offset(self, remote_filename, local_path):
+        """Get the offset an upload continues from, 0 unless the partial remote file is ours"""
+        entry = self.get_upload_journal().entries[remote_filename]
+        if not entry['attempts'] or self.remote_type == 0:  # xbmcvfs cannot append to SMB files
+            return 0
+        if self.remote_type == 4 and self._webdav_partial_mode() is None:
+            return 0
+        partial = partial_name(remote_filename)
+        remote_size = self._remote_file_size(partial)
+        if not remote_size or remote_size > entry['size']:
+            return 0
+        
+        # The bytes in front of the resume point must be the ones we sent
+        seam = min(SEAM_CHECK_SIZE, remote_size)
+        remote_bytes = self._read_remote_range(partial, remote_size - seam, seam)
+        with open(local_path, 'rb') as local_file:
+            local_file.seek(remote_size - seam)
+            local_bytes = local_file.read(seam)
+        if remote_bytes != local_bytes:
+            xbmc.log(f"Partial upload of {remote_filename} does not match the local file, starting over", xbmc.LOGWARNING)
+            return 0
+        xbmc.log(f"Resuming upload of {remote_filename} at {self.format_size(remote_size)}", xbmc.LOGINFO)
+        return remote_size
+    
+    def _send_file(self, local_path, remote_filename, offset):
+        """Send a local file to the partial remote file, starting at offset"""
+        journal = self.get_upload_journal()
+        partial = partial_name(remote_filename)
+        file_size = os.path.getsize(local_path)
+        
+        def report(done, total):
+            journal.confirm(remote_filename, done)
+            self._upload_progress_callback(done, total)
+        
+        # The copy loops only count bytes, the journal and the dialog are updated from a timer
+        with open(local_path, 'rb') as local_file, TransferProgress(file_size, report, offset) as progress:
+            local_file.seek(offset)
+            checkpoint = self.throttle.checkpoint
+            
             if self.remote_type == 0:  # SMB
-                remote_path = self.get_remote_path(remote_filename)
-                with open(local_path, 'rb') as local_file:
-                    with xbmcvfs.File(remote_path, 'wb') as remote_file:
-                        bytes_uploaded = 0
-                        last_update = time.time()
-                        update_interval = 0.5  # Update every 0.5 seconds
-                        chunk_size = 8192  # 8KB chunks
-                        
-                        while True:
-                            chunk = local_file.read(chunk_size)
-                            if not chunk:
-                                break
-                                
-                            remote_file.write(chunk)
-                            bytes_uploaded += len(chunk)
-                            current_time = time.time()
-                            
-                            if current_time - last_update >= update_interval:
-                                progress = int((bytes_uploaded / file_size) * 100)
-                                uploaded_str = self.format_size(bytes_uploaded)
-                                
-                                # Update progress dialog only
-                                self.update_progress(
-                                    progress,
-                                    "Uploading backup...",
-                                    f"{uploaded_str} / {file_size_str}"
-                                )
-                                
-                                last_update = current_time
+                with xbmcvfs.File(self.get_remote_path(partial), 'wb') as remote_file:
+                    for chunk in read_chunks(local_file, progress=progress, checkpoint=checkpoint):
+                        if not remote_file.write(chunk):
+                            raise IOError("Write to SMB share failed")
                 
             elif self.remote_type == 1:  # NFS
-                if not self.remote_connection:
-                    return False
-                dest_path = os.path.join(self.remote_connection, remote_filename)
-                self.buffered_copy(local_path, dest_path, file_size, 0, file_size)
+                with open(os.path.join(self.remote_connection, partial), 'r+b' if offset else 'wb') as remote_file:
+                    remote_file.truncate(offset)
+                    copy_file(local_file, remote_file, offset, progress, checkpoint)
+                    remote_file.flush()
+                    os.fsync(remote_file.fileno())
                 
             elif self.remote_type == 2:  # FTP
-                if not self.remote_connection:
-                    return False
-                    
-                with open(local_path, 'rb') as local_file:
-                    self.remote_connection.storbinary(
-                        f'STOR {remote_filename}',
-                        local_file,
-                        callback=lambda sent: self._upload_progress_callback(sent, file_size)
-                    )
+                ftp = self.remote_connection
+                # REST offsets count bytes of the binary representation
+                ftp.voidcmd('TYPE I')
+                ftp.storbinary(f'STOR {partial}', local_file, blocksize=UPLOAD_BLOCK_SIZE,
+                               callback=lambda block: (progress.add(len(block)), checkpoint()), rest=offset or None)
                 
             elif self.remote_type == 3:  # SFTP
-                if not self.remote_connection:
-                    return False
-                    
-                def progress_callback(sent, total):
-                    self._upload_progress_callback(sent, total)
-                
-                self.remote_connection.put(local_path, remote_filename, callback=progress_callback)
+                with self.remote_connection.open(partial, 'ab' if offset else 'wb') as remote_file:
+                    remote_file.set_pipelined(True)
+                    for chunk in read_chunks(local_file, progress=progress, checkpoint=checkpoint):
+                        remote_file.write(bytes(chunk))  # Paramiko only takes bytes
                 
             elif self.remote_type == 4:  # WebDAV
-                if not self.remote_connection:
-                    return False
-                    
-                url = self.remote_connection['base_url'].rstrip('/') + '/' + remote_filename
+                url = self.get_remote_path(partial)
                 session = self.remote_connection['session']
+                mode = self._webdav_partial_mode()
+                if mode is None:
+                    # No partial updates, the whole file goes in one request
+                    local_file.seek(0)
+                    progress.done = 0
+                    # ownCloud and Nextcloud check the body against this and keep it for _remote_sha256
+                    headers = {}
+                    known_hash = journal.entries[remote_filename].get('sha256')
+                    if known_hash:
+                        headers['OC-Checksum'] = f'SHA256:{known_hash}'
+                    response = session.put(url, data=read_chunks(local_file, progress=progress, checkpoint=checkpoint), headers=headers)
+                    if response.status_code not in [200, 201, 204]:
+                        raise IOError(f"WebDAV upload failed with status code {response.status_code}")
+                    return
                 
-                with open(local_path, 'rb') as local_file:
-                    response = session.put(url, data=self._create_upload_generator(local_file, file_size))
+                # Every chunk is its own request, a body the retrying adapter can send again
+                position = offset
+                for block in iter(lambda: local_file.read(WEBDAV_CHUNK_SIZE), b''):
+                    checkpoint()
+                    start, end = position, position + len(block) - 1
+                    if start == 0:
+                        response = session.put(url, data=block)
+                    elif mode == 'patch':
+                        response = session.patch(url, data=block, headers={
+                            'Content-Type': 'application/x-sabredav-partialupdate',
+                            'X-Update-Range': f'bytes={start}-{end}'
+                        })
+                    else:
+                        response = session.put(url, data=block, headers={'Content-Range': f'bytes {start}-{end}/{file_size}'})
+                    if response.status_code not in [200, 201, 204]:
+                        if start and mode == 'content-range':
+                            self.remote_connection['partial_mode'] = None
+                        raise IOError(f"WebDAV upload failed with status code {response.status_code}")
                     
-                if response.status_code not in [200, 201, 204]:
-                    return False
-
-            # Show completion notification
-            self.notify("Upload complete", persistent=True)
-            self.update_progress(100, "Upload complete")
-            return True
-                
+                    # Servers that ignore Content-Range replace the file with the block
+                    if start and mode == 'content-range' and not self.remote_connection.get('partial_checked'):
+                        if self._remote_file_size(partial) != end + 1:
+                            self.remote_connection['partial_mode'] = None
+                            raise IOError("WebDAV server does not support partial uploads")
+                        self.remote_connection['partial_checked'] = True
+                    position += len(block)
+                    progress.add(len(block))
+    
+    def _webdav_partial_mode(self):
+        """Find how the WebDAV server takes partial uploads: 'patch', 'content-range' or None"""
+        connection = self.remote_connection
+        if 'partial_mode' not in connection:
+            mode = 'content-range'  # Confirmed with the first appended block
+            try:
+                response = connection['session'].options(connection['base_url'])
+                # SabreDAV based servers (Nextcloud, ownCloud) advertise their PATCH extension
+                if 'sabredav-partialupdate' in response.headers.get('DAV', '').lower():
+                    mode = 'patch'
+            except requests.exceptions.RequestException as e:
+                xbmc.log(f"WebDAV OPTIONS request failed: {str(e)}", xbmc.LOGWARNING)
+            connection['partial_mode'] = mode
+        return connection['partial_mode']
+    
+    def _remote_file_size(self, filename):
+        """Get the size of a file at the remote location, None if it does not exist"""
+        try:
+            if self.remote_type == 0:  # SMB
+                remote_path = self.get_remote_path(filename)
+                return xbmcvfs.Stat(remote_path).st_size() if xbmcvfs.exists(remote_path) else None
+            elif self.remote_type == 1:  # NFS
+                return os.path.getsize(self.get_remote_path(filename))
+            elif self.remote_type == 2:  # FTP
+                self.remote_connection.voidcmd('TYPE I')
+                return self.remote_connection.size(filename)
+            elif self.remote_type == 3:  # SFTP
+                return self.remote_connection.stat(filename).st_size
+            elif self.remote_type == 4:  # WebDAV
+                response = self.remote_connection['session'].head(self.get_remote_path(filename))
+                if response.status_code == 200 and 'Content-Length' in response.headers:
+                    return int(response.headers['Content-Length'])
+                # Some servers answer HEAD without a length, the property is always there
+                match = re.search(r'getcontentlength>\s*(\d+)\s*<', self._webdav_properties(filename, '<d:getcontentlength/>'))
+                if match:
+                    return int(match.group(1))
+        except ftplib.all_errors + (requests.exceptions.RequestException, ValueError):
+            pass
+        return None
+    
+    def _webdav_properties(self, filename, properties):
+        """Fetch WebDAV properties of one file, returns the raw multistatus response or an empty string"""
+        response = self.remote_connection['session'].request('PROPFIND', self.get_remote_path(filename), headers={'Depth': '0'}, data=(
+            '<?xml version="1.0"?><d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">'
+            f'<d:prop>{properties}</d:prop></d:propfind>'))
+        return response.text if response.status_code == 207 else ''
+    
+    def _read_remote_range(self, filename, offset, length, keep_open=False):
+        """Read length bytes at offset of a remote file, None if the transport cannot
+        
+        With keep_open SMB, NFS and SFTP handles stay open for the next range
+        of the same file until _close_range_handles().
+        """
+        if self.remote_type in (0, 1, 3):  # SMB, NFS, SFTP
+            remote_file = self._range_handles.get(filename) if keep_open else None
+            if remote_file is None:
+                if self.remote_type == 0:
+                    remote_file = xbmcvfs.File(self.get_remote_path(filename))
+                elif self.remote_type == 1:
+                    remote_file = open(self.get_remote_path(filename), 'rb')
+                else:
+                    remote_file = self.remote_connection.open(filename, 'rb')
+                if keep_open:
+                    self._range_handles[filename] = remote_file
+            try:
+                if self.remote_type == 0:
+                    remote_file.seek(offset, 0)
+                    return bytes(remote_file.readBytes(length))
+                elif self.remote_type == 3:
+                    # readv pipelines the requests instead of one round trip per 32 KB
+                    return b''.join(remote_file.readv([(offset, length)]))
+                remote_file.seek(offset)
+                return remote_file.read(length)
+            finally:
+                if not keep_open:
+                    remote_file.close()
+        elif self.remote_type == 2:  # FTP
+            ftp = self.remote_connection
+            data = b''
+            with ftp.transfercmd(f'RETR {filename}', rest=offset) as conn:
+                while len(data) < length:
+                    block = conn.recv(length - len(data))
+                    if not block:
+                        break
+                    data += block
+            try:
+                ftp.voidresp()
+            except ftplib.error_temp:
+                pass  # 426 for the transfer closed early
+            return data
+        elif self.remote_type == 4:  # WebDAV
+            response = self.remote_connection['session'].get(
+                self.get_remote_path(filename), headers={'Range': f'bytes={offset}-{offset + length - 1}'}, stream=True)
+            with response:
+                # A server ignoring the range answers 200 with the whole file, which is not read
+                if response.status_code == 206:
+                    return response.content
+        return None
+    
+    def _close_range_handles(self):
+        """Close the handles kept open for range reads"""
+        for filename, remote_file in self._range_handles.items():
+            try:
+                remote_file.close()
+            except Exception as e:
+                xbmc.log(f"Error closing {filename}: {str(e)}", xbmc.LOGDEBUG)
+        self._range_handles = {}
+    
+    def open_remote_reader(self, filename, volumes=None):
+        """Open a remote archive, or the given volumes of it, as a seekable file read with range reads"""
+        names = volumes or [filename]
+        sizes = [self._remote_file_size(name) for name in names]
+        if None in sizes:
+            return None
+        return RangeReader(list(zip(names, sizes)),
+                           lambda name, offset, length: self._read_remote_range(name, offset, length, keep_open=True))
+    
+    def _remote_sha256(self, filename):
+        """Ask the server for the SHA-256 of a file, None when it cannot compute one"""
+        try:
+            if self.remote_type == 2:  # FTP
+                ftp = self.remote_connection
+                for command in ('HASH', 'XSHA256'):
+                    try:
+                        if command == 'HASH':
+                            ftp.sendcmd('OPTS HASH SHA-256')
+                        match = re.search(r'\b([0-9a-fA-F]{64})\b', ftp.sendcmd(f'{command} {filename}'))
+                        if match:
+                            return match.group(1).lower()
+                    except ftplib.error_perm:
+                        continue
+            elif self.remote_type == 3:  # SFTP
+                # Works on shell accounts, chrooted SFTP-only accounts fall back to the size check
+                transport = self.remote_connection.get_channel().get_transport()
+                channel = transport.open_session(timeout=10)
+                channel.settimeout(SFTP_HASH_TIMEOUT)
+                channel.exec_command(f"sha256sum {shlex.quote(self.remote_connection.normalize(filename))}")
+                output = channel.makefile('r').read()
+                channel.close()
+                match = re.match(r'([0-9a-f]{64})\b', output.decode('ascii', 'replace') if isinstance(output, bytes) else output)
+                if match:
+                    return match.group(1)
+            elif self.remote_type == 4:  # WebDAV
+                # ownCloud and Nextcloud keep the checksum sent with the upload
+                match = re.search(r'SHA256:([0-9a-fA-F]{64})', self._webdav_properties(filename, '<oc:checksums/>'))
+                if match:
+                    return match.group(1).lower()
         except Exception as e:
-            xbmc.log(f"Error uploading file: {str(e)}", xbmc.LOGERROR)
+            xbmc.log(f"Remote hash of {filename} not available: {str(e)}", xbmc.LOGDEBUG)
+        return None
+    
+    def _verify_upload(self, remote_filename, file_size):
+        """Compare the uploaded partial file with the local one"""
+        return self._verify_remote_file(partial_name(remote_filename), file_size,
+                                        lambda: self.get_upload_journal().sha256(remote_filename))
+    
+    def _verify_remote_file(self, filename, size, local_sha256):
+        """Compare a stored remote file with the size and SHA-256 of the data sent
+        
+        local_sha256 is only called when the server can hash the file.
+        """
+        remote_size = self._remote_file_size(filename)
+        if remote_size != size:
+            xbmc.log(f"Stored {filename} has {remote_size} bytes, expected {size}", xbmc.LOGERROR)
+            return False
+        remote_hash = self._remote_sha256(filename)
+        if remote_hash is None:
+            xbmc.log(f"Verified size of stored {filename}", xbmc.LOGINFO)
+            return True
+        if remote_hash != local_sha256():
+            xbmc.log(f"Stored {filename} does not match the local SHA-256", xbmc.LOGERROR)
             return False
+        xbmc.log(f"Verified SHA-256 of stored {filename}", xbmc.LOGINFO)
+        return True
+    
+    def _publish_partial_file(self, remote_filename):
+        """Give a verified upload its real name"""
+        if not self._rename_remote_file(partial_name(remote_filename), remote_filename):
+            raise IOError(f"Failed to rename {partial_name(remote_filename)}")
+        self.get_upload_journal().finish(remote_filename)
+    
+    def _rename_remote_file(self, old_name, new_name):
+        """Rename a file at the remote location, replacing new_name"""
+        if self.remote_type == 0:  # SMB
+            old_path, new_path = self.get_remote_path(old_name), self.get_remote_path(new_name)
+            if xbmcvfs.exists(new_path):
+                xbmcvfs.delete(new_path)
+            return xbmcvfs.rename(old_path, new_path)
+        elif self.remote_type == 1:  # NFS
+            os.replace(self.get_remote_path(old_name), self.get_remote_path(new_name))
+        elif self.remote_type == 2:  # FTP
+            self.remote_connection.rename(old_name, new_name)
+        elif self.remote_type == 3:  # SFTP
+            try:
+                self.remote_connection.posix_rename(old_name, new_name)
+            except IOError:
+                # Servers without the OpenSSH extension only rename to free names
+                if self._remote_file_size(new_name) is not None:
+                    self.remote_connection.remove(new_name)
+                self.remote_connection.rename(old_name, new_name)
+        elif self.remote_type == 4:  # WebDAV
+            response = self.remote_connection['session'].request('MOVE', self.get_remote_path(old_name), headers={
+                'Destination': self.get_remote_path(new_name),
+                'Overwrite': 'T'
+            })
+            return response.status_code in [201, 204]
+        return True
             
+    def open_remote_stream(self, remote_filename):
+        """Open a writable stream that sends data straight to the remote location"""
+        if not self.remote_connection:
+            return None
+        try:
+            if self.remote_type == 0:  # SMB
+                remote_file = xbmcvfs.File(self.get_remote_path(remote_filename), 'wb')
+                return FileStreamWriter(remote_file, seekable=False)
+                
+            elif self.remote_type == 1:  # NFS
+                return FileStreamWriter(open(os.path.join(self.remote_connection, remote_filename), 'wb'))
+                
+            elif self.remote_type == 2:  # FTP
+                ftp = self.remote_connection
+                
+                def store(blocks):
+                    ftp.storbinary(f'STOR {remote_filename}', reader_for(blocks), blocksize=1024 * 1024)
+                
+                return QueueStreamWriter(remote_filename, store)
+                
+            elif self.remote_type == 3:  # SFTP
+                remote_file = self.remote_connection.open(remote_filename, 'wb')
+                remote_file.set_pipelined(True)
+                return FileStreamWriter(remote_file)
+                
+            elif self.remote_type == 4:  # WebDAV
+                url = self.get_remote_path(remote_filename)
+                auth = self.remote_connection['session'].auth
+                
+                def put(blocks):
+                    # A generator body is sent with chunked transfer encoding; it cannot be
+                    # replayed, so the request bypasses the retrying session adapter
+                    response = requests.put(url, data=blocks, auth=auth)
+                    if response.status_code not in [200, 201, 204]:
+                        raise IOError(f"WebDAV upload failed with status code {response.status_code}")
+                
+                return QueueStreamWriter(remote_filename, put)
+                
+        except Exception as e:
+            xbmc.log(f"Error opening remote stream for {remote_filename}: {str(e)}", xbmc.LOGERROR)
+        return None
+    
     def _upload_progress_callback(self, sent, total):
         """Callback for upload progress"""
-        progress = int((sent / total) * 100)
+        progress = int((sent / total) * 100) if total else 100
         sent_str = self.format_size(sent)
         total_str = self.format_size(total)
         
@@ -505,27 +1012,6 @@ class BackupManager:
             f"{sent_str} / {total_str}"
         )
         
-    def _create_upload_generator(self, file_obj, total_size):
-        """Create a generator for uploading files with progress tracking"""
-        bytes_uploaded = 0
-        chunk_size = 8192  # 8KB chunks
-        last_update = time.time()
-        update_interval = 0.5  # Update every 0.5 seconds
-        
-        while True:
-            chunk = file_obj.read(chunk_size)
-            if not chunk:
-                break
-                
-            bytes_uploaded += len(chunk)
-            current_time = time.time()
-            
-            if current_time - last_update >= update_interval:
-                self._upload_progress_callback(bytes_uploaded, total_size)
-                last_update = current_time
-                
-            yield chunk
-    
     def download_file(self, remote_filename, local_path):
         """Download a file from the remote location"""
         if self.location_type == 0:  # Local
@@ -541,15 +1027,17 @@ class BackupManager:
                 return xbmcvfs.copy(remote_path, local_path)
                 
             elif self.remote_type == 1:  # NFS
-                # Copy the file from the mounted directory
+                # Copy the file from the mounted directory, inside the kernel where it can
                 remote_path = self.get_remote_path(remote_filename)
-                shutil.copy2(remote_path, local_path)
+                with open(remote_path, 'rb') as remote_file, open(local_path, 'wb') as f:
+                    copy_file(remote_file, f)
                 return True
                 
             elif self.remote_type == 2:  # FTP
                 # Download the file via FTP
+                self.remote_connection.voidcmd('TYPE I')
                 with open(local_path, 'wb') as f:
-                    self.remote_connection.retrbinary(f'RETR {remote_filename}', f.write)
+                    self.remote_connection.retrbinary(f'RETR {remote_filename}', f.write, blocksize=UPLOAD_BLOCK_SIZE)
                 return True
                 
             elif self.remote_type == 3:  # SFTP
@@ -562,8 +1050,10 @@ class BackupManager:
                 remote_url = self.get_remote_path(remote_filename)
                 response = self.remote_connection['session'].get(remote_url, stream=True)
                 if response.status_code == 200:
+                    # Read straight into one reused buffer, undoing any transfer encoding on the way
+                    response.raw.decode_content = True
                     with open(local_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
+                        for chunk in read_chunks(response.raw):
                             f.write(chunk)
                     return True
                 return False
@@ -572,6 +1062,59 @@ class BackupManager:
             xbmc.log(f"Error downloading file from remote location: {str(e)}", xbmc.LOGERROR)
             return False
     
+    def _download_blocks(self, remote_filename):
+        """Read a remote file front to back, yielding blocks as they arrive instead of storing them"""
+        if self.remote_type == 0:  # SMB
+            remote_file = xbmcvfs.File(self.get_remote_path(remote_filename))
+            try:
+                while True:
+                    block = bytes(remote_file.readBytes(UPLOAD_BLOCK_SIZE))
+                    if not block:
+                        return
+                    yield block
+            finally:
+                remote_file.close()
+        
+        elif self.remote_type in (1, 3):  # NFS, SFTP
+            if self.remote_type == 1:
+                remote_file = open(self.get_remote_path(remote_filename), 'rb')
+            else:
+                remote_file = self.remote_connection.open(remote_filename, 'rb')
+                # Keeps several read requests in flight instead of one round trip per 32 KB
+                remote_file.prefetch()
+            with remote_file:
+                for chunk in read_chunks(remote_file):
+                    yield bytes(chunk)
+        
+        elif self.remote_type == 2:  # FTP
+            ftp = self.remote_connection
+            ftp.voidcmd('TYPE I')
+            finished = False
+            try:
+                with ftp.transfercmd(f'RETR {remote_filename}') as conn:
+                    while True:
+                        block = conn.recv(UPLOAD_BLOCK_SIZE)
+                        if not block:
+                            break
+                        yield block
+                finished = True
+                ftp.voidresp()
+            finally:
+                if not finished:
+                    try:
+                        ftp.voidresp()
+                    except ftplib.all_errors:
+                        pass  # 426 for the transfer closed early
+        
+        elif self.remote_type == 4:  # WebDAV
+            response = self.remote_connection['session'].get(self.get_remote_path(remote_filename), stream=True)
+            with response:
+                if response.status_code != 200:
+                    raise IOError(f"Download of {remote_filename} failed with status code {response.status_code}")
+                response.raw.decode_content = True
+                for chunk in read_chunks(response.raw):
+                    yield bytes(chunk)
+    
     def list_remote_files(self):
         """List files in the remote location"""
         if self.location_type == 0:  # Local
@@ -646,7 +1189,7 @@ class BackupManager:
                         filename = urllib.parse.unquote(filename)
                         xbmc.log(f"Found href: {filename}", xbmc.LOGINFO)
                         
-                        if filename.endswith('.zip'):
+                        if filename.endswith(ARCHIVE_EXTENSIONS + (SIDECAR_EXTENSION,)) or is_repository_file(filename) or split_volume_name(filename)[0]:
                             if filename not in files:  # Avoid duplicates
                                 files.append(filename)
                                 xbmc.log(f"Added file from href: {filename}", xbmc.LOGINFO)
@@ -656,7 +1199,7 @@ class BackupManager:
                         filename = line[line.find('<D:displayname>')+14:line.find('</D:displayname>')]
                         xbmc.log(f"Found displayname: {filename}", xbmc.LOGINFO)
                         
-                        if filename.endswith('.zip'):
+                        if filename.endswith(ARCHIVE_EXTENSIONS + (SIDECAR_EXTENSION,)) or is_repository_file(filename) or split_volume_name(filename)[0]:
                             if filename not in files:  # Avoid duplicates
                                 files.append(filename)
                                 xbmc.log(f"Added file from displayname: {filename}", xbmc.LOGINFO)
@@ -811,9 +1354,10 @@ class BackupManager:
                         repo_paths[f'repo_data_{item}'] = addon_data_path
         return repo_paths
 
-    def get_backup_paths(self):
+    def get_backup_paths(self, exclusions=None):
         """Get paths for all backup items based on settings"""
         paths = {}
+        self._staged_copies = {}
         
         # Log which backup items are selected
         xbmc.log("Backup items selected:", xbmc.LOGINFO)
@@ -822,6 +1366,7 @@ class BackupManager:
         xbmc.log(f"Repositories: {self.addon.getSettingBool('backup_repositories')}", xbmc.LOGINFO)
         xbmc.log(f"Userdata: {self.addon.getSettingBool('backup_userdata')}", xbmc.LOGINFO)
         xbmc.log(f"Sources: {self.addon.getSettingBool('backup_sources')}", xbmc.LOGINFO)
+        xbmc.log(f"Databases: {self.addon.getSettingBool('backup_databases')}", xbmc.LOGINFO)
         
         # Configuration Files
         if self.addon.getSettingBool('backup_configs'):
@@ -838,6 +1383,7 @@ class BackupManager:
                 try:
                     shutil.copy2(config_src, config_temp)
                     self._temp_files.add(config_temp)  # Track for cleanup
+                    self._staged_copies[FILE_ARCNAMES['config']] = [config_temp, None]
                     paths['config'] = config_temp  # Use temp location for backup
                     xbmc.log(f"Copied config.txt to temp location: {config_temp}", xbmc.LOGINFO)
                 except Exception as e:
@@ -884,9 +1430,118 @@ class BackupManager:
                 paths['addon_data'] = addon_data_path
                 xbmc.log("Added addon data path", xbmc.LOGINFO)
         
+        # Kodi Databases, archived from consistent snapshots instead of the live files
+        if self.addon.getSettingBool('backup_databases'):
+            snapshot_dir = self.snapshot_databases(exclusions)
+            if snapshot_dir:
+                paths['databases'] = snapshot_dir
+                xbmc.log("Added database snapshots", xbmc.LOGINFO)
+        
         xbmc.log(f"Final backup paths: {list(paths.keys())}", xbmc.LOGINFO)
         return paths
     
+    def snapshot_databases(self, exclusions=None):
+        """Take consistent snapshots of Kodi's databases in the temp directory"""
+        database_dir = os.path.join(self.kodi_userdata, 'Database')
+        snapshot_dir = os.path.join(self.temp_dir, 'Database')
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self._temp_files.add(snapshot_dir)  # Track for cleanup
+        vacuum = self.addon.getSettingBool('vacuum_databases')
+        
+        count = 0
+        for database_path in list_databases(database_dir):
+            name = os.path.basename(database_path)
+            arcname = f"userdata/Database/{name}"
+            
+            # Skipped databases are accounted like any other excluded file
+            rule = exclusions.match_file(arcname) if exclusions else None
+            if rule is not None:
+                exclusions.record(rule, 1, os.path.getsize(database_path))
+                continue
+            
+            self.throttle.checkpoint()
+            self.notify("Gathering files to backup...", f"Copying database {name}")
+            try:
+                size = snapshot_database(database_path, os.path.join(snapshot_dir, name), vacuum)
+                self._staged_copies[arcname] = [os.path.join(snapshot_dir, name), None]
+                xbmc.log(f"Database snapshot {name}: {self.format_size(os.path.getsize(database_path))} -> {self.format_size(size)}", xbmc.LOGINFO)
+                count += 1
+            except (sqlite3.Error, OSError) as e:
+                xbmc.log(f"Error taking snapshot of database {name}: {str(e)}", xbmc.LOGERROR)
+        
+        return snapshot_dir if count else None
+    
+    def _staged_digest(self, arcname):
+        """SHA-256 of a file copied afresh for this backup, None for any other file
+        
+        Database snapshots and the config.txt copy get a new inode and mtime
+        on every run, their content tells whether they changed.
+        """
+        staged = self._staged_copies.get(arcname)
+        if staged is None:
+            return None
+        if staged[1] is None:
+            staged[1] = file_sha256(staged[0])
+        return staged[1]
+    
+    def get_compression_workers(self):
+        """Get the number of compression worker threads from settings"""
+        worker_options = [0, 1, 2, 3, 4, 6, 8]  # 0 = one worker per CPU core
+        selected = int(self.addon.getSetting('compression_workers') or "0")
+        workers = worker_options[selected] if selected < len(worker_options) else 0
+        return workers or os.cpu_count() or 1
+    
+    def _scan_progress_message(self, processed_size, collector):
+        """Format backup progress while the file scan may still be running"""
+        processed_formatted = self.format_size(processed_size)
+        total_formatted = self.format_size(collector.total_size)
+        if not collector.finished:
+            # The total keeps growing until every item has been walked
+            return f"{processed_formatted} / {total_formatted} found so far"
+        progress = int((processed_size / collector.total_size) * 100) if collector.total_size > 0 else 0
+        return f"{processed_formatted} / {total_formatted} ({progress}%)"
+    
+    def _finish_scan_manifest(self, manifest, collector, backup_index):
+        """Fill in the manifest fields that are only known after the file scan"""
+        manifest['total_size'] = collector.total_size
+        manifest['total_size_formatted'] = self.format_size(collector.total_size)
+        xbmc.log(f"Total backup size: {manifest['total_size_formatted']} ({collector.total_size} bytes)", xbmc.LOGINFO)
+        if collector.exclusions is not None:
+            manifest['exclusions'] = collector.exclusions.report()
+        # Files that disappeared since the last run are recorded as tombstones,
+        # newly excluded files are left alone on restore
+        if 'deleted_files' in manifest and backup_index is not None:
+            manifest['deleted_files'] = [name for name in backup_index.deleted_files()
+                                         if collector.exclusions is None or not collector.exclusions.excludes(name)]
+            xbmc.log(f"Incremental backup: {collector.file_count} changed, {len(manifest['deleted_files'])} deleted files", xbmc.LOGINFO)
+    
+    def get_backup_index(self, items_str):
+        """Load the file-state index used for incremental backups"""
+        profile_dir = xbmcvfs.translatePath(self.addon.getAddonInfo('profile'))
+        if self.location_type == 0:  # Local
+            location = self.backup_dir
+        else:
+            location = f"{self.remote_type}:{self.remote_path}"
+        return BackupIndex(os.path.join(profile_dir, 'backup_index.json'), f"{items_str}|{location}")
+    
+    def _backup_chain_available(self, chain):
+        """Check that every backup of an incremental chain still exists"""
+        if not chain:
+            return False
+        try:
+            if self.location_type == 0:  # Local
+                existing = set(os.listdir(self.backup_dir))
+            else:
+                existing = set(self.list_remote_files())
+        except Exception as e:
+            xbmc.log(f"Error checking backup chain: {str(e)}", xbmc.LOGWARNING)
+            return False
+        missing = [name for name in chain if name not in existing]
+        if missing:
+            xbmc.log(f"Backup chain incomplete, missing: {missing}. Forcing full backup", xbmc.LOGWARNING)
+            return False
+        return True
+    
     def cleanup_resources(self):
         """Clean up resources before addon shutdown"""
         self.close_progress()
@@ -972,66 +1627,59 @@ class BackupManager:
 
     def __del__(self):
         """Cleanup when object is destroyed"""
+        if self._stream_of is not None:
+            return  # Upload streams share the session and temp files of their main manager
         self.close_progress()
         self.cleanup_resources()
 
     def buffered_copy(self, source, dest, file_size, processed_size, total_size):
         """Copy file with progress tracking"""
-        CHUNK_SIZE = 8192  # 8KB chunks
-        bytes_copied = 0
-        last_update = time.time()
-        update_interval = 0.5  # Update every 0.5 seconds
-        
-        with open(source, 'rb') as src, open(dest, 'wb') as dst:
-            while True:
-                chunk = src.read(CHUNK_SIZE)
-                if not chunk:
-                    break
-                
-                dst.write(chunk)
-                bytes_copied += len(chunk)
-                current_time = time.time()
-                
-                # Update progress at intervals
-                if current_time - last_update >= update_interval:
-                    # Calculate percentages
-                    file_percent = int((bytes_copied / file_size) * 100)
-                    total_percent = int(((processed_size + bytes_copied) / total_size) * 100)
-                    
-                    # Format sizes
-                    current_size = self.format_size(processed_size + bytes_copied)
-                    total_size_str = self.format_size(total_size)
-                    
-                    # Update progress
-                    self.update_progress(
-                        total_percent,
-                        f"Copying files... ({current_size} / {total_size_str})",
-                        f"{file_percent}% of current file"
-                    )
-                    
-                    # Show notification
-                    self.notify(
-                        "Copying files...",
-                        f"{current_size} / {total_size_str}",
-                        persistent=True
-                    )
-                    
-                    last_update = current_time
+        def report(done, _):
+            # Calculate percentages
+            file_percent = int((done / file_size) * 100) if file_size else 100
+            total_percent = int(((processed_size + done) / total_size) * 100) if total_size else 100
+            
+            # Format sizes
+            current_size = self.format_size(processed_size + done)
+            total_size_str = self.format_size(total_size)
+            
+            # Update progress
+            self.update_progress(
+                total_percent,
+                f"Copying files... ({current_size} / {total_size_str})",
+                f"{file_percent}% of current file"
+            )
+            
+            # Show notification
+            self.notify(
+                "Copying files...",
+                f"{current_size} / {total_size_str}",
+                persistent=True
+            )
         
-        return bytes_copied
+        # Progress comes from a timer, the copy itself runs in the kernel where it can
+        with open(source, 'rb') as src, open(dest, 'wb') as dst, TransferProgress(file_size, report) as progress:
+            return copy_file(src, dst, progress=progress)
 
-    def create_backup(self, backup_name=None):
+    def create_backup(self, backup_name=None, scheduled=False):
         """Create a backup of the selected items"""
+        # Upload, listing and rotation share one remote connection
+        self.begin_remote_session()
         try:
             # Notify backup start
-            backup_type = "scheduled" if backup_name else "manual"
+            backup_type = "scheduled" if scheduled or backup_name else "manual"
             self.email_notifier.notify_backup_started(backup_type)
             
             # Show initial progress
             self.notify("Starting backup process...", progress=True)
             
+            # Scan, compression and upload threads started from here on inherit the lowered priority
+            self.throttle = self.get_throttle(backup_type == "scheduled")
+            self.throttle.start()
+            
             # Clean up any old temporary files first
             self._cleanup_old_temp_files()
+            self.restored_databases = []
             
             # Create a new temporary directory for this session
             self.temp_dir = os.path.join(xbmcvfs.translatePath('special://temp'), 'libreelec_backupper', str(int(time.time())))
@@ -1047,12 +1695,16 @@ class BackupManager:
                     self.notify("Backup failed", "Failed to connect to remote location", persistent=True)
                     self.close_progress()
                     return False, "Failed to connect to remote location"
+                self.resume_pending_uploads()
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             
+            # Caches and other regenerable data are skipped while scanning
+            exclusions = ExclusionRules(self.addon.getSetting('exclude_patterns'), self.addon.getSettingBool('default_exclusions'))
+            
             # Get paths to backup
             self.notify("Gathering files to backup...", persistent=True)
-            paths = self.get_backup_paths()
+            paths = self.get_backup_paths(exclusions)
             
             # Log the paths that will be backed up
             xbmc.log(f"Paths to backup: {paths}", xbmc.LOGINFO)
@@ -1075,100 +1727,76 @@ class BackupManager:
                 backup_items.append('userdata')
             if self.addon.getSettingBool('backup_sources'):
                 backup_items.append('src')
+            if self.addon.getSettingBool('backup_databases'):
+                backup_items.append('db')
             
             # Add items to backup name
             items_str = '-'.join(backup_items) if backup_items else 'empty'
-            backup_name = f'backup_{items_str}_{timestamp}'
+            
+            # Decide between a full and an incremental backup
+            archive_format = int(self.addon.getSetting('archive_format') or "0")
+            backup_index = None
+            is_full_backup = True
+            if archive_format != 1 and int(self.addon.getSetting('backup_mode') or "0") == 1:  # Incremental archive
+                backup_index = self.get_backup_index(items_str)
+                full_interval = int(self.addon.getSetting('full_backup_interval') or "7")
+                is_full_backup = backup_index.needs_full_backup(full_interval) or not self._backup_chain_available(backup_index.chain)
+                xbmc.log(f"Incremental mode: creating {'full' if is_full_backup else 'incremental'} backup", xbmc.LOGINFO)
+            
+            if is_full_backup:
+                backup_name = f'backup_{items_str}_{timestamp}'
+            else:
+                backup_name = f'backup_{items_str}_incr_{timestamp}'
+            
+            # Archive backend for the selected format
+            archive_backend = ARCHIVE_BACKENDS[ARCHIVE_FORMATS.get(archive_format, 'zip')]
+            archive_name = f'{backup_name}{archive_backend.extension}'
             
             # Create backup path in temp directory
-            backup_path = os.path.join(self.temp_dir, f'{backup_name}.zip')
+            backup_path = os.path.join(self.temp_dir, archive_name)
             self._temp_files.add(backup_path)  # Track for cleanup
             self._temp_files.add(self.temp_dir)  # Track temp directory for cleanup
             
             try:
-                # Calculate total size and collect files to backup
-                total_size = 0
-                files_to_backup = []
                 processed_size = 0  # Track processed size
                 
-                # Process each path based on its type
-                for item_name, path in paths.items():
-                    xbmc.log(f"Processing backup item: {item_name} at path: {path}", xbmc.LOGINFO)
-                    
-                    if not os.path.exists(path):
-                        xbmc.log(f"Path does not exist: {path}", xbmc.LOGWARNING)
-                        continue
-                        
-                    if os.path.isfile(path):
-                        if not os.path.islink(path):  # Skip symbolic links
-                            try:
-                                file_size = os.path.getsize(path)
-                                total_size += file_size
-                                
-                                # Determine the appropriate archive name for configuration files
-                                if item_name == 'config':
-                                    arcname = 'flash/config.txt'  # Ensure config.txt goes to flash directory
-                                elif item_name == 'sources':
-                                    arcname = 'userdata/sources.xml'
-                                elif item_name == 'guisettings':
-                                    arcname = 'userdata/guisettings.xml'
-                                elif item_name == 'advancedsettings':
-                                    arcname = 'userdata/advancedsettings.xml'
-                                elif item_name == 'keyboard':
-                                    arcname = 'userdata/keyboard.xml'
-                                else:
-                                    arcname = item_name
-                                    
-                                files_to_backup.append((path, arcname, file_size))
-                                xbmc.log(f"Added file to backup: {path} as {arcname} ({self.format_size(file_size)})", xbmc.LOGINFO)
-                            except OSError as e:
-                                xbmc.log(f"Error getting size for {path}: {str(e)}", xbmc.LOGWARNING)
-                                continue
-                    else:  # Directory
-                        for root, dirs, files in os.walk(path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                if not os.path.islink(file_path):  # Skip symbolic links
-                                    try:
-                                        file_size = os.path.getsize(file_path)
-                                        total_size += file_size
-                                        
-                                        # Determine relative path based on directory type
-                                        if item_name == 'addons':
-                                            rel_path = os.path.relpath(file_path, os.path.dirname(path))
-                                            arcname = rel_path
-                                        elif item_name == 'addon_data':
-                                            rel_path = os.path.relpath(file_path, os.path.dirname(path))
-                                            arcname = f"userdata/{rel_path}"
-                                        elif item_name == 'keymaps':
-                                            rel_path = os.path.relpath(file_path, path)
-                                            arcname = f"userdata/keymaps/{rel_path}"
-                                        elif item_name.startswith('repo_'):
-                                            rel_path = os.path.relpath(file_path, os.path.dirname(path))
-                                            arcname = f"repo/{rel_path}"
-                                        else:
-                                            rel_path = os.path.relpath(file_path, path)
-                                            arcname = f"{item_name}/{rel_path}"
-                                        
-                                        files_to_backup.append((file_path, arcname, file_size))
-                                    except OSError as e:
-                                        xbmc.log(f"Error getting size for {file_path}: {str(e)}", xbmc.LOGWARNING)
-                                        continue
+                def include_file(arcname, file_stat):
+                    # Unchanged files are already stored earlier in the chain
+                    if (backup_index is not None and not backup_index.is_changed(arcname, file_stat, self._staged_digest(arcname))
+                            and not is_full_backup):
+                        backup_index.keep(arcname)
+                        return False
+                    return True
+                
+                # Files are discovered while earlier ones are already being compressed
+                collector = FileCollector(paths, include=include_file, inode_order=self.addon.getSettingBool('inode_order'), exclusions=exclusions)
+                files_to_backup = iter(collector)
+                
+                # An incremental run with nothing to store ends without writing an archive
+                if backup_index is not None and not is_full_backup:
+                    first_file = next(files_to_backup, None)
+                    if first_file is None and not [name for name in backup_index.deleted_files() if not exclusions.excludes(name)]:
+                        self.notify("Backup completed", "No changes since last backup", persistent=True)
+                        self.close_progress()
+                        if self.location_type != 0:  # Remote
+                            self.disconnect_remote()
+                        return True, "No changes since last backup"
+                    if first_file is not None:
+                        files_to_backup = itertools.chain([first_file], files_to_backup)
                 
-                xbmc.log(f"Total files to backup: {len(files_to_backup)}", xbmc.LOGINFO)
-                total_size_formatted = self.format_size(total_size)
-                self.notify("Starting backup", f"Total size: {total_size_formatted}")
-                xbmc.log(f"Total backup size: {total_size_formatted} ({total_size} bytes)", xbmc.LOGINFO)
+                self.notify("Starting backup", "Scanning and compressing files")
                 
-                # Create manifest
+                # Create manifest, sizes and tombstones are filled in once the scan has finished
                 manifest = {
                     'timestamp': timestamp,
                     'items': list(paths.keys()),
                     'paths': paths,
-                    'backed_up_files': [],
-                    'total_size': total_size,
-                    'total_size_formatted': total_size_formatted
+                    'backup_type': 'full' if is_full_backup else 'incremental'
                 }
+                if not is_full_backup:
+                    manifest['base_backup'] = backup_index.chain[-1]
+                    manifest['chain'] = backup_index.chain + [archive_name]
+                    manifest['deleted_files'] = []
                 
                 # Set compression settings based on addon settings
                 compression_level = self.addon.getSettingInt('compression_level')
@@ -1181,86 +1809,169 @@ class BackupManager:
                 }
                 compression_method, compression_strength = compression_mapping.get(compression_level, (zipfile.ZIP_DEFLATED, 6))
                 
-                # Create ZIP file with selected compression
-                with zipfile.ZipFile(backup_path, 'w', compression=compression_method, compresslevel=compression_strength, allowZip64=True) as zipf:
-                    # Process each file
-                    last_update_time = time.time()
-                    update_interval = 0.5  # Update progress every 0.5 seconds
-                    batch_size = 0  # Track size of current batch
+                # Per-file choice between storing and deflating, based on extension and a sample of the content
+                compression_policy = None
+                if self.addon.getSettingBool('smart_compression'):
+                    compression_policy = CompressionPolicy(compression_method, compression_strength)
+                
+                if archive_format == 1:  # Deduplicated repository
+                    success, result = self._store_repository_snapshot(backup_name, files_to_backup, collector, manifest, compression_strength, compression_policy)
+                    if not success:
+                        self.notify("Backup failed", result, persistent=True)
+                        self.close_progress()
+                        if self.location_type != 0:  # Remote
+                            self.disconnect_remote()
+                        return False, result
+                    size_info = result
+                else:
+                    # Remote archives can be streamed straight to the destination without a staging copy
+                    stream_upload = self.location_type != 0 and self.addon.getSettingBool('stream_uploads')
+                    # Otherwise the archive can be cut into volumes, each stored while the next one is compressed
+                    volume_size = 0 if stream_upload else self.get_volume_size()
+                    volume_uploader = None
+                    if stream_upload:
+                        # Streamed to the partial name, an interrupted stream never looks like a finished backup
+                        remote_stream = self.open_remote_stream(partial_name(archive_name))
+                        if remote_stream is None:
+                            self.notify("Backup failed", "Failed to open remote file for streaming", persistent=True)
+                            self.close_progress()
+                            self.disconnect_remote()
+                            return False, "Failed to open remote file for streaming"
+                        # SHA-256 and size are taken from the bytes as they are written, never by reading them back
+                        archive_target = HashingWriter(remote_stream)
+                    elif volume_size:
+                        if self.location_type != 0:  # Remote
+                            volume_uploader = ParallelUploader(self.get_upload_streams(), self._open_upload_stream, remove_uploaded=True)
+                            volume_uploader.start()
+                        archive_target = VolumeWriter(backup_path, volume_size,
+                                                      lambda path, number: self._store_volume(volume_uploader, path, number, archive_target))
+                    else:
+                        archive_target = HashingWriter(open(backup_path, 'wb'))
                     
-                    for file_path, arcname, file_size in files_to_backup:
-                        try:
-                            # Read and write directly to zip
-                            with open(file_path, 'rb') as source:
-                                # Create a ZipInfo object for more control
-                                info = zipfile.ZipInfo(arcname)
-                                info.file_size = file_size
-                                info.compress_type = compression_method
-                                
-                                # Open entry in zip file
-                                with zipf.open(info, mode='w') as dest:
-                                    # Copy with batched progress updates
-                                    buffer_size = 1024 * 1024  # 1MB buffer
-                                    bytes_copied = 0
-                                    
-                                    while True:
-                                        chunk = source.read(buffer_size)
-                                        if not chunk:
-                                            break
-                                        
-                                        dest.write(chunk)
-                                        bytes_copied += len(chunk)
-                                        processed_size += len(chunk)
-                                        batch_size += len(chunk)
-                                        
-                                        # Update progress based on time interval
-                                        current_time = time.time()
-                                        if current_time - last_update_time >= update_interval:
-                                            progress = int((processed_size / total_size) * 100) if total_size > 0 else 0
-                                            processed_formatted = self.format_size(processed_size)
-                                            total_formatted = self.format_size(total_size)
-                                            
-                                            # Update progress notification
-                                            self.notify("Backing up files", f"{processed_formatted} / {total_formatted} ({progress}%)")
-                                            last_update_time = current_time
-                                            batch_size = 0  # Reset batch size
+                    # Per-file records are spooled to disk so memory use stays flat however many files there are
+                    manifest_writer = ManifestWriter(os.path.join(self.temp_dir, MANIFEST_NAME), manifest)
+                    # Sidecar index stored next to the archive so it can be listed without opening it
+                    sidecar = SidecarWriter(os.path.join(self.temp_dir, sidecar_name(archive_name)), archive_name, manifest)
+                    duplicate_count = 0
+                    
+                    try:
+                        # Create the archive with selected compression
+                        with archive_backend(archive_target, compression_method, compression_strength, self.get_compression_workers(),
+                                             compression_policy, self.addon.getSettingBool('deduplicate_files'),
+                                             self._get_extract_path) as writer:
+                            last_update_time = time.time()
+                            update_interval = 0.5  # Update progress every 0.5 seconds
                         
-                            manifest['backed_up_files'].append(arcname)
+                            for (file_path, arcname, file_size, file_stat), error in writer.write_files(files_to_backup):
+                                self.throttle.checkpoint()
+                                processed_size += file_size
+                                if error is None:
+                                    compression, duplicate_of, crc = writer.pop_member_info(arcname)
+                                    manifest_writer.add_file(arcname, compression, duplicate_of)
+                                    sidecar.add_file(arcname, file_size, file_stat.st_mtime, crc)
+                                    if duplicate_of:
+                                        duplicate_count += 1
+                                    if backup_index is not None:
+                                        backup_index.record(arcname, file_stat, self._staged_digest(arcname))
                             
-                        except Exception as e:
-                            xbmc.log(f"Error backing up file {file_path}: {str(e)}", xbmc.LOGERROR)
-                    
-                    # Show final progress
-                    progress = int((processed_size / total_size) * 100) if total_size > 0 else 0
-                    processed_formatted = self.format_size(processed_size)
-                    total_formatted = self.format_size(total_size)
-                    self.notify("Backing up files", f"{processed_formatted} / {total_formatted} ({progress}%)")
+                                # Update progress based on time interval
+                                current_time = time.time()
+                                if current_time - last_update_time >= update_interval:
+                                    # Update progress notification
+                                    self.notify("Backing up files", self._scan_progress_message(processed_size, collector))
+                                    last_update_time = current_time
+                        
+                            # Show final progress
+                            self.notify("Backing up files", self._scan_progress_message(processed_size, collector))
+                            self._finish_scan_manifest(manifest, collector, backup_index)
+                            
+                            # Files that did not use the configured compression are recorded per file
+                            manifest['compression_summary'] = {
+                                label: {'files': files, 'original_size': original, 'stored_size': stored}
+                                for label, (files, original, stored) in writer.summary.items()
+                            }
+                            manifest['duplicate_count'] = duplicate_count
                     
-                    # Add manifest file
-                    zipf.writestr('manifest.json', json.dumps(manifest, indent=4))
+                            # Add manifest file, it is the last member of the archive
+                            manifest_writer.finish(manifest)
+                            writer.add_manifest(manifest_writer.path)
+                        
+                        # Wait for the transport to confirm the streamed upload, or hand over the last volume
+                        archive_target.close()
+                        if stream_upload:
+                            if not self._verify_remote_file(partial_name(archive_name), archive_target.bytes_written,
+                                                            lambda: archive_target.sha256):
+                                raise IOError(f"Streamed {archive_name} does not match the data that was sent")
+                            # Only a verified archive gets its real name
+                            if not self._rename_remote_file(partial_name(archive_name), archive_name):
+                                raise IOError(f"Failed to rename {partial_name(archive_name)}")
+                    except Exception:
+                        archive_target.abort()
+                        if stream_upload:
+                            self.delete_remote_file(partial_name(archive_name))
+                        elif volume_size:
+                            self._discard_volumes(volume_uploader, archive_target.paths)
+                        sidecar.close()
+                        raise
+                    finally:
+                        manifest_writer.close()
+                
+                    # Show completion notification
+                    total_size = manifest['total_size']
+                    total_size_formatted = manifest['total_size_formatted']
+                    self.notify("Backup completed", f"Total size: {total_size_formatted}")
+                
+                    # Get final backup size
+                    final_size = archive_target.bytes_written
+                    final_size_formatted = self.format_size(final_size)
+                    compression_ratio = (1 - (final_size / total_size)) * 100 if total_size > 0 else 0
+                    size_info = f"Original: {total_size_formatted}, Compressed: {final_size_formatted} ({compression_ratio:.1f}% saved)"
+                    stored_files = manifest['compression_summary'].get('stored', {}).get('files', 0)
+                    if compression_policy is not None and compression_policy.enabled and stored_files:
+                        size_info += f", {stored_files} already compressed files stored"
+                    if duplicate_count:
+                        size_info += f", {duplicate_count} duplicate files stored once"
+                    if volume_size:
+                        checksums = {os.path.basename(path): sha256 for path, sha256 in archive_target.checksums.items()}
+                    else:
+                        checksums = {archive_name: archive_target.sha256}
+                    sidecar.finish(manifest, final_size, checksums)
+                
+                    # Upload to remote location if needed
+                    if self.location_type != 0 and not stream_upload:  # Remote, staged archive
+                        self.notify("Uploading backup...", size_info)
+                        if volume_size:
+                            # Most volumes are stored already, the first one makes the set visible
+                            failed_paths = self._finish_volume_upload(volume_uploader, archive_target.paths)
+                        else:
+                            upload_paths = self._split_for_upload(backup_path)
+                            failed_paths = self._upload_backup_files(upload_paths, checksums)
+                        if failed_paths:
+                            # The next run continues the upload where it stopped
+                            self._keep_pending_upload(failed_paths + [sidecar.path])
+                            self.notify("Backup failed", "Failed to upload to remote location", persistent=True)
+                            self.close_progress()
+                            self.disconnect_remote()
+                            return False, "Failed to upload backup to remote location, the upload continues with the next backup"
+                    elif self.location_type == 0:  # Local
+                        # Move the backup file to the final location
+                        final_path = os.path.join(self.backup_dir, archive_name)
+                        if volume_size:
+                            # The other volumes are in place, the first one makes the set visible
+                            first_volume = archive_target.paths[0]
+                            self._store_local_file(first_volume, archive_target.sizes[first_volume])
+                        else:
+                            self._store_local_file(backup_path, final_size, final_path)
                 
-                # Show completion notification
-                self.notify("Backup completed", f"Total size: {total_size_formatted}")
+                    # Stored after the archive, a sidecar never describes a missing backup
+                    self._store_sidecar(sidecar)
                 
-                # Get final backup size
-                final_size = os.path.getsize(backup_path)
-                final_size_formatted = self.format_size(final_size)
-                compression_ratio = (1 - (final_size / total_size)) * 100 if total_size > 0 else 0
-                size_info = f"Original: {total_size_formatted}, Compressed: {final_size_formatted} ({compression_ratio:.1f}% saved)"
+                    # Only advance the incremental index once the archive is stored
+                    if backup_index is not None:
+                        backup_index.commit(archive_name, is_full_backup)
                 
-                # Upload to remote location if needed
-                if self.location_type != 0:  # Remote
-                    self.notify("Uploading backup...", size_info)
-                    if not self.upload_file(backup_path, f'{backup_name}.zip'):
-                        self.notify("Backup failed", "Failed to upload to remote location", persistent=True)
-                        self.close_progress()
-                        self.disconnect_remote()
-                        return False, "Failed to upload backup to remote location"
-                else:  # Local
-                    # Move the backup file to the final location
-                    final_path = os.path.join(self.backup_dir, f'{backup_name}.zip')
-                    shutil.move(backup_path, final_path)
-                    self._temp_files.remove(backup_path)  # Remove from cleanup tracking
+                if exclusions.excluded_bytes:
+                    size_info += f", {self.format_size(exclusions.excluded_bytes)} excluded"
                 
                 # Cleanup old backups
                 self.cleanup_old_backups(int(self.addon.getSetting('max_backups')))
@@ -1306,6 +2017,8 @@ class BackupManager:
                 self.disconnect_remote()
             return False, error_msg
         finally:
+            self.throttle.stop()
+            self.end_remote_session()
             # Clean up resources and temporary files only after everything is done
             try:
                 self.cleanup_current_session()
@@ -1313,49 +2026,364 @@ class BackupManager:
             except Exception as e:
                 xbmc.log(f"Error during final cleanup: {str(e)}", xbmc.LOGERROR)
     
-    def get_all_backups(self):
-        """Get list of all available backup files"""
-        self.update_backup_location()
-
-        if self.location_type == 0:  # Local
-            backup_pattern = os.path.join(self.backup_dir, 'backup_*.zip')
-            return sorted(glob.glob(backup_pattern))
-        else:  # Remote
-            try:
-                # Connect to remote location
-                if not self.connect_remote():
-                    xbmc.log("Failed to connect to remote location for listing backups", xbmc.LOGERROR)
-                    return []
-
+    def get_throttle(self, scheduled):
+        """Build the playback-aware throttle configured for scheduled or manual backups"""
+        mode = int(self.addon.getSetting('throttle_scheduled' if scheduled else 'throttle_manual') or "0")
+        return ResourceThrottle(mode, self.addon.getSettingInt('playback_duty_cycle'), self.addon.getSettingInt('playback_pause_bitrate'),
+                                notify=self.notify)
+    
+    def _publish_backup_file(self, local_path, filename):
+        """Move a finished backup file to the backup location"""
+        if self.location_type != 0:  # Remote
+            if not self.upload_file(local_path, filename):
+                return False
+            os.remove(local_path)
+            return True
+        shutil.move(local_path, os.path.join(self.backup_dir, filename))
+        return True
+    
+    def _pending_upload_dir(self):
+        """Directory for archives whose upload failed, outside the temp directories cleaned on every run"""
+        return os.path.join(xbmcvfs.translatePath(self.addon.getAddonInfo('profile')), 'pending_uploads')
+    
+    def get_volume_size(self):
+        """Size of the volumes archives are cut into, 0 to store them whole"""
+        return VOLUME_SIZES.get(int(self.addon.getSetting('volume_size') or "0"), 0)
+    
+    def _store_volume(self, uploader, path, number, writer):
+        """Store a finished volume while the next one is compressed
+        
+        Remote volumes go to the upload streams, the first one is uploaded
+        under its partial name and kept locally until the set is complete.
+        Local volumes are moved to the backup folder, the first one last.
+        The writer knows the SHA-256 and size of every finished volume.
+        """
+        self._temp_files.add(path)
+        if uploader is not None:  # Remote
+            uploader.put(path, os.path.basename(path), publish=number != 1, sha256=writer.checksums[path])
+        elif number != 1:
+            self._store_local_file(path, writer.sizes[path])
+    
+    def _store_local_file(self, path, size, final_path=None):
+        """Move a finished archive or volume to the local backup folder and check its size there"""
+        final_path = final_path or os.path.join(self.backup_dir, os.path.basename(path))
+        shutil.move(path, final_path)
+        self._temp_files.discard(path)
+        stored_size = os.path.getsize(final_path)
+        if stored_size != size:
+            raise IOError(f"Stored {os.path.basename(final_path)} has {stored_size} bytes, expected {size}")
+    
+    def _finish_volume_upload(self, uploader, paths):
+        """Wait for the volume uploads and publish the set, returns the local paths that were not stored"""
+        failed = uploader.finish()
+        self.notify("Upload complete", f"{len(paths) - len(failed)} of {len(paths)} volumes, {uploader.summary()}")
+        return self._publish_first_volume(paths, failed)
+    
+    def _discard_volumes(self, uploader, paths):
+        """Remove the volumes of a failed backup that were already stored"""
+        if uploader is not None:
+            uploader.finish()
+        for path in paths:
+            name = os.path.basename(path)
+            for stored_name in ([name, partial_name(name)] if uploader is not None else [name]):
+                try:
+                    if self.location_type != 0 or os.path.exists(os.path.join(self.backup_dir, stored_name)):
+                        self.delete_remote_file(stored_name)
+                except Exception as e:
+                    xbmc.log(f"Error removing volume {stored_name} of a failed backup: {str(e)}", xbmc.LOGWARNING)
+    
+    def _split_for_upload(self, archive_path):
+        """Split a staged archive to spread it over several upload streams"""
+        size = os.path.getsize(archive_path)
+        streams = self.get_upload_streams()
+        if streams < 2 or size < MIN_PARALLEL_VOLUME * 2:
+            return [archive_path]
+        # One volume per stream
+        volume_size = max(-(-size // streams), MIN_PARALLEL_VOLUME)
+        paths = split_archive(archive_path, volume_size)
+        self._temp_files.discard(archive_path)
+        self._temp_files.update(paths)
+        xbmc.log(f"Split {os.path.basename(archive_path)} into {len(paths)} volumes of up to {self.format_size(volume_size)}", xbmc.LOGINFO)
+        return paths
+    
+    def _upload_backup_files(self, paths, checksums=None):
+        """Upload an archive or its volumes, returns the local paths that were not stored
+        
+        The first volume is only renamed to its real name once every other
+        volume is stored, so listings never show an incomplete volume set.
+        checksums maps file names to a SHA-256 already known from writing them.
+        """
+        names = [os.path.basename(path) for path in paths]
+        checksums = checksums or {}
+        first = names[0] if len(paths) > 1 else None
+        streams = min(self.get_upload_streams(), len(paths))
+        if streams > 1:
+            uploader = ParallelUploader(streams, self._open_upload_stream,
+                                        lambda percent, detail: self.update_progress(percent, "Uploading backup...", detail))
+            failed = uploader.run([(path, name, name != first, checksums.get(name)) for path, name in zip(paths, names)])
+            self.notify("Upload complete", f"{len(paths) - len(failed)} of {len(paths)} volumes, {uploader.summary()}")
+        else:
+            failed = []
+            order = paths[1:] + paths[:1] if first else paths
+            for index, path in enumerate(order):
+                name = os.path.basename(path)
+                if not self.upload_file(path, name, publish=name != first, sha256=checksums.get(name)):
+                    # The remote is gone, the rest is left for the next run
+                    failed = order[index:]
+                    break
+        
+        if first is None:
+            return failed
+        return self._publish_first_volume(paths, failed)
+    
+    def _publish_first_volume(self, paths, failed):
+        """Give the uploaded first volume its real name once every other volume is stored"""
+        first = os.path.basename(paths[0])
+        if paths[0] in failed:
+            return failed
+        if failed:
+            return failed + [paths[0]]  # Uploaded, but stays unpublished until the other volumes are stored
+        try:
+            self._publish_partial_file(first)
+        except Exception:
+            # The main connection may have timed out while the streams were busy
+            if not self.reconnect_remote():
+                return [paths[0]]
+            self._publish_partial_file(first)
+        return failed
+    
+    def _keep_pending_upload(self, paths):
+        """Keep archives or volumes whose upload failed so a later run can finish the upload"""
+        pending_dir = self._pending_upload_dir()
+        journal = self.get_upload_journal()
+        try:
+            os.makedirs(pending_dir, exist_ok=True)
+            for path in paths:
+                if os.path.exists(path):
+                    filename = os.path.basename(path)
+                    target = os.path.join(pending_dir, filename)
+                    shutil.move(path, target)
+                    self._temp_files.discard(path)
+                    journal.move(filename, target)
+        except OSError as e:
+            xbmc.log(f"Error keeping {os.path.basename(paths[0])} for a later upload: {str(e)}", xbmc.LOGERROR)
+            return
+        
+        # Only the newest archives are kept, older ones are given up
+        pending = os.listdir(pending_dir)
+        archives = sorted({self._pending_archive_name(name) for name in pending}, key=lambda name: timestamp_from_name(name) or '')
+        for archive_name in archives[:-MAX_PENDING_UPLOADS]:
+            xbmc.log(f"Giving up pending upload of {archive_name}", xbmc.LOGWARNING)
+            for name in pending:
+                if self._pending_archive_name(name) == archive_name:
+                    os.remove(os.path.join(pending_dir, name))
+                    journal.finish(name)
+    
+    def _pending_archive_name(self, filename):
+        """Get the archive a pending archive, volume or sidecar index belongs to"""
+        if filename.endswith(SIDECAR_EXTENSION):
+            filename = filename[:-len(SIDECAR_EXTENSION)]
+        return split_volume_name(filename)[0] or filename
+    
+    def resume_pending_uploads(self):
+        """Finish uploads of archives kept back by earlier runs, the remote must be connected"""
+        pending_dir = self._pending_upload_dir()
+        if self.location_type == 0 or not os.path.isdir(pending_dir):
+            return
+        # Per archive the first volume goes last, it makes a volume set visible
+        pending = sorted((name for name in os.listdir(pending_dir) if not name.endswith(SIDECAR_EXTENSION)),
+                         key=lambda name: (self._pending_archive_name(name), split_volume_name(name)[1] == 1, name))
+        failed_archives = set()
+        for filename in pending:
+            if self._pending_archive_name(filename) in failed_archives:
+                continue  # A volume set stays unpublished until all its volumes are stored
+            self.notify("Resuming upload", filename, persistent=True)
+            if not self.upload_file(os.path.join(pending_dir, filename), filename):
+                xbmc.log(f"Pending upload of {filename} failed again", xbmc.LOGWARNING)
+                failed_archives.add(self._pending_archive_name(filename))
+                continue
+            os.remove(os.path.join(pending_dir, filename))
+            if split_volume_name(filename)[1] not in (None, 1):
+                continue  # The index follows the first volume
+            archive_name = self._pending_archive_name(filename)
+            index_path = os.path.join(pending_dir, sidecar_name(archive_name))
+            if os.path.exists(index_path):
+                # The backup is usable without its index, a failed one is not kept
+                if not self._publish_backup_file(index_path, sidecar_name(archive_name)):
+                    xbmc.log(f"Failed to store sidecar index of {archive_name}", xbmc.LOGWARNING)
+                    os.remove(index_path)
+            self._sidecars.pop(archive_name, None)
+            xbmc.log(f"Finished pending upload of {filename}", xbmc.LOGINFO)
+    
+    def _store_sidecar(self, sidecar):
+        """Store the finished sidecar index of an archive, the backup stays usable without it"""
+        filename = os.path.basename(sidecar.path)
+        try:
+            if not self._publish_backup_file(sidecar.path, filename):
+                xbmc.log(f"Failed to store sidecar index {filename}", xbmc.LOGWARNING)
+        except Exception as e:
+            xbmc.log(f"Error storing sidecar index {filename}: {str(e)}", xbmc.LOGWARNING)
+        self._sidecars.pop(sidecar.header['archive'], None)
+    
+    def _read_backup_file(self, filename):
+        """Read a small file such as a snapshot manifest from the backup location"""
+        if self.location_type == 0:  # Local
+            with open(os.path.join(self.backup_dir, filename), 'rb') as f:
+                return f.read()
+        local_path = os.path.join(self.temp_dir or xbmcvfs.translatePath('special://temp'), filename)
+        if not self.download_file(filename, local_path):
+            raise IOError(f"Failed to download {filename}")
+        try:
+            with open(local_path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(local_path)
+    
+    def _list_backup_location(self):
+        """List file names at the backup location"""
+        if self.location_type == 0:  # Local
+            return os.listdir(self.backup_dir) if os.path.isdir(self.backup_dir) else []
+        return self.list_remote_files()
+    
+    def get_chunk_repository(self, compression_strength):
+        """Open the deduplicated repository writer for the current backup location"""
+        profile_dir = xbmcvfs.translatePath(self.addon.getAddonInfo('profile'))
+        repository = ChunkRepository(
+            os.path.join(profile_dir, 'repository_cache.json'),
+            self.get_location_key(),
+            os.path.join(self.temp_dir, 'packs'),
+            compression_strength
+        )
+        
+        # Rebuild the chunk cache from the snapshots already stored at the destination
+        if not repository.cache_loaded:
+            for filename in self._list_backup_location():
+                if filename.endswith(SNAPSHOT_EXTENSION):
+                    try:
+                        repository.add_snapshot(filename, json.loads(self._read_backup_file(filename)))
+                    except Exception as e:
+                        xbmc.log(f"Error reading snapshot {filename}: {str(e)}", xbmc.LOGWARNING)
+            xbmc.log(f"Rebuilt repository cache with {len(repository.chunks)} chunks", xbmc.LOGINFO)
+        return repository
+    
+    def _should_compress_chunks(self, arcname, compression_policy):
+        """Check whether chunks of a file are worth compressing in the repository"""
+        if compression_policy is None:
+            return True
+        choice = compression_policy.extension_choice(arcname)
+        # Chunks of unknown types are still only kept compressed when that makes them smaller
+        return choice is None or choice[0] != zipfile.ZIP_STORED
+    
+    def _store_repository_snapshot(self, backup_name, files_to_backup, collector, manifest, compression_strength, compression_policy=None):
+        """Store files as deduplicated chunks and publish a snapshot manifest"""
+        repository = self.get_chunk_repository(compression_strength)
+        processed_size = 0
+        last_update_time = time.time()
+        update_interval = 0.5  # Update progress every 0.5 seconds
+        file_entries = []
+        
+        try:
+            for file_path, arcname, file_size, file_stat in files_to_backup:
+                self.throttle.checkpoint()
+                try:
+                    chunk_ids = repository.store_file(file_path, arcname, file_stat, compress=self._should_compress_chunks(arcname, compression_policy))
+                    file_entries.append((arcname, file_size, chunk_ids))
+                except Exception as e:
+                    xbmc.log(f"Error backing up file {file_path}: {str(e)}", xbmc.LOGERROR)
+                processed_size += file_size
+                
+                # Publish finished packs right away to keep temp usage low
+                while repository.new_packs:
+                    pack_path = repository.new_packs.pop(0)
+                    if not self._publish_backup_file(pack_path, os.path.basename(pack_path)):
+                        raise IOError(f"Failed to store pack {os.path.basename(pack_path)}")
+                
+                current_time = time.time()
+                if current_time - last_update_time >= update_interval:
+                    self.notify("Backing up files", self._scan_progress_message(processed_size, collector))
+                    last_update_time = current_time
+            
+            repository.finish_pack()
+            while repository.new_packs:
+                pack_path = repository.new_packs.pop(0)
+                if not self._publish_backup_file(pack_path, os.path.basename(pack_path)):
+                    raise IOError(f"Failed to store pack {os.path.basename(pack_path)}")
+        except Exception as e:
+            repository.abort()
+            xbmc.log(f"Error writing repository packs: {str(e)}", xbmc.LOGERROR)
+            return False, f"Failed to store backup data: {str(e)}"
+        
+        self._finish_scan_manifest(manifest, collector, None)
+        total_size = manifest['total_size']
+        total_formatted = manifest['total_size_formatted']
+        
+        # The snapshot is published last, it is what makes the backup visible
+        snapshot_name = f'{backup_name}{SNAPSHOT_EXTENSION}'
+        snapshot = repository.build_snapshot(manifest, file_entries)
+        snapshot_path = os.path.join(self.temp_dir, snapshot_name)
+        with open(snapshot_path, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        if not self._publish_backup_file(snapshot_path, snapshot_name):
+            return False, "Failed to store snapshot manifest"
+        repository.commit(snapshot_name, snapshot)
+        
+        new_formatted = self.format_size(repository.bytes_new)
+        saved = (1 - (repository.bytes_new / total_size)) * 100 if total_size > 0 else 0
+        size_info = f"Original: {total_formatted}, New data: {new_formatted} ({saved:.1f}% saved)"
+        xbmc.log(f"Repository snapshot {snapshot_name} stored, read {self.format_size(repository.bytes_read)}", xbmc.LOGINFO)
+        return True, size_info
+    
+    def _remote_mtime(self, filename):
+        """Get the modification time of a remote file, 0 where the protocol has no cheap way to tell"""
+        try:
+            if self.remote_type == 1:  # NFS
+                return os.stat(os.path.join(self.remote_connection, filename)).st_mtime
+            elif self.remote_type == 3:  # SFTP
+                return self.remote_connection.stat(filename).st_mtime
+            elif self.remote_type == 2:  # FTP
+                # 213 YYYYMMDDHHMMSS, in UTC
+                modified = self.remote_connection.voidcmd(f'MDTM {filename}')[4:].strip()
+                return calendar.timegm(time.strptime(modified[:14], '%Y%m%d%H%M%S'))
+        except Exception:
+            pass
+        # SMB via xbmcvfs and WebDAV do not report it without an extra request per file
+        return 0
+    
+    def get_all_backups(self):
+        """Get list of all available backup files"""
+        self.update_backup_location()
+
+        if self.location_type == 0:  # Local
+            backups = []
+            for extension in BACKUP_EXTENSIONS:
+                backups.extend(glob.glob(os.path.join(self.backup_dir, f'backup_*{extension}')))
+            # Volume sets are listed under the path of the archive they make up
+            backups.extend(os.path.join(self.backup_dir, name) for name in group_volumes(self._list_backup_location())
+                           if name.startswith('backup_'))
+            return sorted(backups)
+        else:  # Remote
+            try:
+                # Connect to remote location
+                if not self.connect_remote():
+                    xbmc.log("Failed to connect to remote location for listing backups", xbmc.LOGERROR)
+                    return []
+
                 # List files based on remote type
                 files = self.list_remote_files()
+                
+                # Volume sets are listed under the name of the archive they make up
+                volume_sets = group_volumes(files)
+                files = [f for f in files if split_volume_name(f)[0] is None] + list(volume_sets)
 
-                # Filter for backup files (backup_*.zip)
-                backup_files = [f for f in files if f.startswith('backup_') and f.endswith('.zip')]
+                # Filter for backup files (backup_*.zip and repository snapshots)
+                backup_files = [f for f in files if f.startswith('backup_') and f.endswith(BACKUP_EXTENSIONS)]
 
                 # Sort by modification time (newest first) if possible
                 try:
                     backup_files_with_time = []
                     for f in backup_files:
-                        # Get file info if available
-                        try:
-                            if self.remote_type == 0:  # SMB
-                                # For SMB, we can't easily get timestamps via xbmcvfs
-                                backup_files_with_time.append((f, 0))
-                            elif self.remote_type == 1:  # NFS
-                                stat = os.stat(os.path.join(self.remote_connection, f))
-                                backup_files_with_time.append((f, stat.st_mtime))
-                            elif self.remote_type == 2:  # FTP
-                                # FTP doesn't provide easy timestamp access
-                                backup_files_with_time.append((f, 0))
-                            elif self.remote_type == 3:  # SFTP
-                                stat = self.remote_connection.stat(f)
-                                backup_files_with_time.append((f, stat.st_mtime))
-                            elif self.remote_type == 4:  # WebDAV
-                                # WebDAV timestamps are complex, use 0
-                                backup_files_with_time.append((f, 0))
-                        except:
-                            backup_files_with_time.append((f, 0))
+                        stored = volume_sets[f][0] if f in volume_sets else f
+                        backup_files_with_time.append((f, self._remote_mtime(stored)))
 
                     # Sort by timestamp (newest first)
                     backup_files_with_time.sort(key=lambda x: x[1], reverse=True)
@@ -1377,6 +2405,72 @@ class BackupManager:
                 # Disconnect from remote location
                 self.disconnect_remote()
     
+    def get_backup_sidecar(self, backup):
+        """Get the sidecar index of a backup, or None if it has none
+
+        Remote indexes are only downloaded while connected, get_backup_catalog
+        reads them all over a single connection.
+        """
+        name = os.path.basename(backup)
+        if name in self._sidecars:
+            return self._sidecars[name]
+        sidecar = None
+        try:
+            if self.location_type == 0:  # Local
+                path = os.path.join(os.path.dirname(backup) or self.backup_dir, sidecar_name(name))
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        sidecar = BackupSidecar.from_bytes(f.read())
+            else:
+                sidecar = BackupSidecar.from_bytes(self._read_backup_file(sidecar_name(name)))
+        except Exception as e:
+            xbmc.log(f"Cannot read sidecar index of {name}: {str(e)}", xbmc.LOGWARNING)
+        self._sidecars[name] = sidecar
+        return sidecar
+    
+    def get_backup_catalog(self):
+        """List backups together with their sidecar index, None for backups without one"""
+        # Listing and reading the indexes share one remote connection
+        self.begin_remote_session()
+        try:
+            backups = self.get_all_backups()
+            if self.location_type == 0:  # Local
+                return [(backup, self.get_backup_sidecar(backup)) for backup in backups]
+            
+            # Remote backups are listed by name, older backups may not have an index
+            if backups and self.connect_remote():
+                available = set(self.list_remote_files())
+                for backup in backups:
+                    if sidecar_name(backup) in available:
+                        self.get_backup_sidecar(backup)
+            return [(backup, self._sidecars.get(backup)) for backup in backups]
+        finally:
+            self.end_remote_session()
+    
+    def get_backup_date(self, backup):
+        """Get the readable creation date of a backup"""
+        sidecar = self._sidecars.get(os.path.basename(backup))
+        timestamp = sidecar.timestamp if sidecar else timestamp_from_name(os.path.basename(backup))
+        return format_timestamp(timestamp)
+    
+    def get_backup_info(self, backup):
+        """Get the items stored in a backup"""
+        sidecar = self._sidecars.get(os.path.basename(backup))
+        if sidecar:
+            return sidecar.items
+        # backup_<items>_[incr_]<timestamp>, items are joined with dashes
+        match = re.match(r'backup_(.+?)_(?:incr_)?\d{8}_\d{6}', os.path.basename(backup))
+        return match.group(1).split('-') if match else []
+    
+    def get_backup_size(self, backup):
+        """Get the stored size of a backup, or None if it is not known without downloading it"""
+        sidecar = self._sidecars.get(os.path.basename(backup))
+        if sidecar:
+            return sidecar.compressed_size
+        if self.location_type == 0 and stored_archive_exists(backup):  # Local
+            return stored_archive_size(backup)
+        return None
+    
     def show_rotation_warning(self):
         """Show warning dialog when enabling backup rotation"""
         dialog = xbmcgui.Dialog()
@@ -1398,6 +2492,124 @@ class BackupManager:
             return False
         return True
 
+    def _split_by_rotation(self, backup_files, max_backups, rotation_strategy):
+        """Split backups sorted newest first into those to keep and those to delete"""
+        if len(backup_files) <= max_backups:
+            return backup_files, []
+        if rotation_strategy == 0:  # Keep Newest
+            return backup_files[:max_backups], backup_files[max_backups:]
+        elif rotation_strategy == 1:  # Keep Oldest
+            return backup_files[-max_backups:], backup_files[:-max_backups]
+        else:  # Keep Both Ends
+            half = max_backups // 2
+            return backup_files[:half] + backup_files[-half:], backup_files[half:-half]
+    
+    def _delete_sidecar(self, archive_name):
+        """Remove the sidecar index of a deleted backup"""
+        self._sidecars.pop(archive_name, None)
+        filename = sidecar_name(archive_name)
+        try:
+            if self.location_type == 0 and not os.path.exists(os.path.join(self.backup_dir, filename)):  # Local
+                return
+            if self.delete_remote_file(filename):
+                xbmc.log(f"Deleted sidecar index: {filename}", xbmc.LOGINFO)
+        except OSError as e:
+            xbmc.log(f"Error deleting sidecar index {filename}: {str(e)}", xbmc.LOGWARNING)
+    
+    def _delete_volumes(self, archive_name):
+        """Remove the volumes of a deleted split archive, the first one goes first to hide the set"""
+        try:
+            volumes = sorted(name for name in self._list_backup_location() if split_volume_name(name)[0] == archive_name)
+            for name in volumes:
+                if not self.delete_remote_file(name):
+                    xbmc.log(f"Error deleting volume: {name}", xbmc.LOGERROR)
+            if volumes:
+                xbmc.log(f"Deleted {len(volumes)} volumes of {archive_name}", xbmc.LOGINFO)
+        except Exception as e:
+            xbmc.log(f"Error deleting volumes of {archive_name}: {str(e)}", xbmc.LOGWARNING)
+    
+    def prune_repository(self, max_backups, rotation_strategy):
+        """Rotate repository snapshots and garbage-collect unreferenced pack files"""
+        try:
+            files = self._list_backup_location()
+        except Exception as e:
+            xbmc.log(f"Error listing repository files: {str(e)}", xbmc.LOGERROR)
+            return
+        
+        snapshots = [f for f in files if f.endswith(SNAPSHOT_EXTENSION)]
+        packs = [f for f in files if is_repository_file(f) and not f.endswith(SNAPSHOT_EXTENSION)]
+        if not snapshots and not packs:
+            return
+        
+        # Snapshot names end with their timestamp, sort newest first
+        def snapshot_time(name):
+            match = re.search(r'(\d{8}_\d{6})', name)
+            return match.group(1) if match else ''
+        snapshots.sort(key=snapshot_time, reverse=True)
+        entries = [(name, snapshot_time(name)) for name in snapshots]
+        keep, delete = self._split_by_rotation(entries, max_backups, rotation_strategy)
+        
+        repository = self.get_chunk_repository(0)
+        
+        # Delete snapshots before packs so a failure never leaves a snapshot without its data
+        for name, _ in delete:
+            if self.delete_remote_file(name):
+                repository.snapshots.pop(name, None)
+                xbmc.log(f"Deleted old snapshot: {name}", xbmc.LOGINFO)
+            else:
+                xbmc.log(f"Error deleting old snapshot: {name}", xbmc.LOGERROR)
+        
+        # Mark every pack referenced by a remaining snapshot
+        referenced = set()
+        for name, _ in keep:
+            if name in repository.snapshots:
+                referenced.update(repository.snapshots[name])
+                continue
+            try:
+                referenced.update(snapshot_packs(json.loads(self._read_backup_file(name))))
+            except Exception as e:
+                # Without the full picture nothing can be safely collected
+                xbmc.log(f"Cannot read snapshot {name}, skipping pack collection: {str(e)}", xbmc.LOGERROR)
+                return
+        
+        # Sweep packs nothing refers to anymore
+        removed = []
+        for pack in packs:
+            if pack not in referenced:
+                if self.delete_remote_file(pack):
+                    removed.append(pack)
+                else:
+                    xbmc.log(f"Error deleting unreferenced pack: {pack}", xbmc.LOGERROR)
+        
+        repository.forget_packs(removed)
+        repository.save_cache()
+        if delete or removed:
+            xbmc.log(f"Repository pruned: {len(delete)} snapshots, {len(removed)} packs removed", xbmc.LOGINFO)
+            self.notify("Backup Cleanup Complete", f"Removed {len(delete)} snapshots and {len(removed)} unused packs")
+    
+    def _protect_backup_chains(self, backup_files, backups_to_keep, backups_to_delete):
+        """Keep every backup that a kept incremental backup depends on"""
+        # Walk from oldest to newest, every full backup starts a new chain
+        chains = {}
+        current_chain = []
+        for file_path, _ in reversed(backup_files):
+            name = file_path.rstrip('/').split('/')[-1]
+            if '_incr_' in name:
+                current_chain = current_chain + [file_path]
+            else:
+                current_chain = [file_path]
+            chains[file_path] = current_chain
+        
+        protected = set()
+        for file_path, _ in backups_to_keep:
+            protected.update(chains.get(file_path, [file_path]))
+        
+        kept = [entry for entry in backup_files if entry[0] in protected]
+        deleted = [entry for entry in backups_to_delete if entry[0] not in protected]
+        if len(deleted) < len(backups_to_delete):
+            xbmc.log(f"Keeping {len(backups_to_delete) - len(deleted)} extra backups needed by incremental chains", xbmc.LOGINFO)
+        return kept, deleted
+
     def cleanup_old_backups(self, max_backups):
         """Clean up old backups based on rotation strategy"""
         try:
@@ -1412,6 +2624,7 @@ class BackupManager:
 
             # Get all backup files
             backup_files = []
+            volume_sets = set()  # Remote archives stored as volumes only
             
             # For remote locations, ensure we have a connection
             if self.location_type != 0:  # Remote
@@ -1426,28 +2639,22 @@ class BackupManager:
             # List backup files
             if self.location_type == 0:  # Local
                 for file in os.listdir(self.backup_dir):
-                    if file.endswith('.zip'):
+                    if file.endswith(ARCHIVE_EXTENSIONS):
                         file_path = os.path.join(self.backup_dir, file)
                         backup_files.append((file_path, os.path.getmtime(file_path)))
+                    elif split_volume_name(file)[1] == 1:
+                        # A volume set counts once, under the path of its archive
+                        file_path = os.path.join(self.backup_dir, split_volume_name(file)[0])
+                        backup_files.append((file_path, os.path.getmtime(os.path.join(self.backup_dir, file))))
             else:  # Remote
-                if self.remote_type == 0:  # SMB
-                    for file in os.listdir(self.backup_dir):
-                        if file.endswith('.zip'):
-                            file_path = os.path.join(self.backup_dir, file)
-                            backup_files.append((file_path, os.path.getmtime(file_path)))
-                elif self.remote_type == 1:  # NFS
-                    for file in os.listdir(self.backup_dir):
-                        if file.endswith('.zip'):
-                            file_path = os.path.join(self.backup_dir, file)
-                            backup_files.append((file_path, os.path.getmtime(file_path)))
-                elif self.remote_type == 2:  # FTP
-                    for file in self.ftp.nlst():
-                        if file.endswith('.zip'):
-                            backup_files.append((file, self.ftp.voidcmd(f'MDTM {file}')[4:]))
-                elif self.remote_type == 3:  # SFTP
-                    for file in self.sftp.listdir():
-                        if file.endswith('.zip'):
-                            backup_files.append((file, self.sftp.stat(file).st_mtime))
+                if self.remote_type != 4:  # Listed over the connection the backup job already holds
+                    for file in self.list_remote_files():
+                        if file.endswith(ARCHIVE_EXTENSIONS):
+                            backup_files.append((file, self._remote_mtime(file)))
+                        elif split_volume_name(file)[1] == 1:
+                            # A volume set counts once, under the name of its archive
+                            volume_sets.add(split_volume_name(file)[0])
+                            backup_files.append((split_volume_name(file)[0], self._remote_mtime(file)))
                 elif self.remote_type == 4:  # WebDAV
                     if self.remote_connection and 'session' in self.remote_connection:
                         response = self.remote_connection['session'].request(
@@ -1467,7 +2674,10 @@ class BackupManager:
                                 filename = href.split('/')[-1] if href.split('/')[-1] else href.split('/')[-2]
                                 filename = urllib.parse.unquote(filename)
                                 
-                                if filename.endswith('.zip'):
+                                # A volume set counts once, under the name of its archive
+                                if split_volume_name(filename)[1] == 1:
+                                    filename = split_volume_name(filename)[0]
+                                if filename.endswith(ARCHIVE_EXTENSIONS):
                                     # Get last modified time
                                     last_modified = response_elem.find('.//d:getlastmodified', ns)
                                     if last_modified is not None:
@@ -1496,8 +2706,8 @@ class BackupManager:
             for bf in backup_files:
                 xbmc.log(f"Backup file: {bf[0]} with timestamp {bf[1]}", xbmc.LOGINFO)
 
-            # Sort backups by modification time
-            backup_files.sort(key=lambda x: x[1], reverse=True)
+            # Sort backups by modification time, the timestamp in the name decides where it is unknown
+            backup_files.sort(key=lambda x: (x[1], timestamp_from_name(x[0].rstrip('/').split('/')[-1]) or ''), reverse=True)
 
             # Get rotation strategy
             rotation_strategy = int(self.addon.getSetting('backup_rotation') or "0")
@@ -1511,32 +2721,25 @@ class BackupManager:
 
             # Determine which backups to keep
             if len(backup_files) > max_backups:
-                if rotation_strategy == 0:  # Keep Newest
-                    backups_to_keep = backup_files[:max_backups]
-                    backups_to_delete = backup_files[max_backups:]
-                elif rotation_strategy == 1:  # Keep Oldest
-                    backups_to_keep = backup_files[-max_backups:]
-                    backups_to_delete = backup_files[:-max_backups]
-                else:  # Keep Both Ends
-                    half = max_backups // 2
-                    backups_to_keep = backup_files[:half] + backup_files[-half:]
-                    backups_to_delete = backup_files[half:-half]
+                backups_to_keep, backups_to_delete = self._split_by_rotation(backup_files, max_backups, rotation_strategy)
+
+                # Never delete a backup that a kept incremental backup still depends on
+                backups_to_keep, backups_to_delete = self._protect_backup_chains(backup_files, backups_to_keep, backups_to_delete)
 
                 # Delete old backups
                 deleted_count = 0
                 for file_path, _ in backups_to_delete:
                     try:
                         if self.location_type == 0:  # Local
-                            os.remove(file_path)
-                        else:  # Remote
-                            if self.remote_type == 0:  # SMB
-                                os.remove(file_path)
-                            elif self.remote_type == 1:  # NFS
+                            if os.path.exists(file_path):  # Split archives only have volumes
                                 os.remove(file_path)
-                            elif self.remote_type == 2:  # FTP
-                                self.ftp.delete(file_path)
-                            elif self.remote_type == 3:  # SFTP
-                                self.sftp.remove(file_path)
+                        else:  # Remote
+                            if self.remote_type != 4:
+                                # Split archives only have volumes, they go with _delete_volumes
+                                if file_path not in volume_sets:
+                                    if not self.delete_remote_file(file_path):
+                                        xbmc.log(f"Error deleting old backup {file_path}", xbmc.LOGERROR)
+                                        continue
                             elif self.remote_type == 4:  # WebDAV
                                 if self.remote_connection and 'session' in self.remote_connection:
                                     response = self.remote_connection['session'].delete(file_path)
@@ -1547,6 +2750,8 @@ class BackupManager:
                                     continue
                         xbmc.log(f"Deleted old backup: {file_path}", xbmc.LOGINFO)
                         deleted_count += 1
+                        self._delete_sidecar(file_path.rstrip('/').split('/')[-1])
+                        self._delete_volumes(file_path.rstrip('/').split('/')[-1])
                     except Exception as e:
                         xbmc.log(f"Error deleting old backup {file_path}: {str(e)}", xbmc.LOGERROR)
 
@@ -1568,6 +2773,9 @@ class BackupManager:
                     f"Current backup count ({len(backup_files)}) is within limit ({max_backups})"
                 )
 
+            # Rotate repository snapshots and reclaim packs nothing refers to anymore
+            self.prune_repository(max_backups, rotation_strategy)
+
             # Always disconnect from remote location if we connected
             if self.location_type != 0:  # Remote
                 self.disconnect_remote()
@@ -1579,347 +2787,485 @@ class BackupManager:
                 f"Error during cleanup: {str(e)}"
             )
     
-    def mount_flash_rw(self):
-        """Mount /flash in read-write mode"""
+    def restore_file(self, archive, file_info, extract_path):
+        """Restore a single file into the staging tree, with special handling for Kodi's databases
+        
+        Runs inside the restore's mount session, the filesystem holding the
+        file is remounted read-write the first time it is written to. The
+        live file is replaced when the restore is committed.
+        """
         try:
-            subprocess.run(['mount', '-o', 'remount,rw', '/flash'], check=True)
+            if not self.mounts.writable(extract_path):
+                return False, f"Failed to mount the filesystem of {extract_path} in read-write mode"
+            os.makedirs(os.path.dirname(self._restore_target(extract_path)), exist_ok=True)
+            self._write_member(archive, file_info, extract_path)
+            return True, None
+        except Exception as e:
+            return False, str(e)
+    
+    def _write_member(self, archive, file_info, extract_path):
+        """Write a member to its place in the staging tree, the directory has to exist on a writable filesystem"""
+        target_path = self._restore_target(extract_path)
+        with archive.open(file_info) as source, open(target_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        
+        # Configuration, userdata and add-on files get the permissions Kodi creates them with, renaming keeps them
+        if extract_path.startswith(('/flash/', self.kodi_userdata, os.path.join(self.kodi_home, 'addons'))):
+            os.chmod(target_path, 0o644)
+        xbmc.log(f"File extracted successfully: {extract_path}", xbmc.LOGDEBUG)
+    
+    def _restore_target(self, extract_path):
+        """Get the staging path a restored file is written to, databases are staged as snapshots"""
+        return self.staging.stage(extract_path, database=self._is_database_path(extract_path))
+    
+    def _is_database_path(self, extract_path):
+        """Check if a restore target is one of Kodi's SQLite databases"""
+        return os.path.dirname(extract_path) == os.path.join(self.kodi_userdata, 'Database') and extract_path.endswith('.db')
+    
+    def _commit_restore(self):
+        """Swap the staged files in, the live files only change here
+        
+        Kodi's databases are written through SQLite while Kodi keeps them
+        open, which is why a restore of them offers a restart.
+        """
+        self.notify("Applying restored files...", f"{self.staging.file_count} files")
+        self.staging.commit()
+        self.restored_databases = [os.path.basename(path) for path in self.staging.databases]
+    
+    def _rollback_journal_path(self):
+        return os.path.join(xbmcvfs.translatePath(self.addon.getAddonInfo('profile')), ROLLBACK_JOURNAL_NAME)
+    
+    def _recover_interrupted_restore(self):
+        """Undo a restore that stopped half way through swapping its files in, True when nothing is left over"""
+        rollback = RestoreRollback(self._rollback_journal_path())
+        if not rollback.interrupted:
             return True
-        except subprocess.CalledProcessError as e:
-            xbmc.log(f"Error mounting /flash as read-write: {str(e)}", xbmc.LOGERROR)
+        xbmc.log(f"Undoing interrupted restore of {len(rollback.paths)} files", xbmc.LOGWARNING)
+        if not all(self.mounts.writable(path) for path in rollback.paths):
             return False
+        return not rollback.undo()
     
-    def mount_flash_ro(self):
-        """Mount /flash back in read-only mode"""
+    def undo_last_restore(self):
+        """Put back the files the last restore replaced or deleted, only once"""
+        rollback = RestoreRollback(self._rollback_journal_path())
+        if not rollback.available:
+            return False, "No restore to undo"
+        
+        if not self.mounts.begin():
+            return False, "Cannot read the mount table, see the log for details"
         try:
-            subprocess.run(['mount', '-o', 'remount,ro', '/flash'], check=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            xbmc.log(f"Error mounting /flash as read-only: {str(e)}", xbmc.LOGERROR)
-            return False
+            for path in rollback.paths:
+                if not self.mounts.writable(path):
+                    return False, f"Failed to mount the filesystem of {path} in read-write mode"
+            failed = rollback.undo()
+        finally:
+            if not self.mounts.end():
+                self.notify("Warning: Failed to remount filesystems as read-only")
+        if failed:
+            return False, f"Failed to put back {len(failed)} files, see the log for details"
+        
+        xbmc.log(f"Undid the last restore of {len(rollback.paths)} files", xbmc.LOGINFO)
+        self.restored_databases = [os.path.basename(path) for path in rollback.databases]
+        self._offer_restart_after_database_restore()
+        return True, "Last restore undone"
+    
+    def _offer_restart_after_database_restore(self):
+        """Kodi caches library data in memory, restarting it loads the restored databases"""
+        if not self.restored_databases:
+            return
+        xbmc.log(f"Restored databases: {self.restored_databases}", xbmc.LOGINFO)
+        if xbmcgui.Dialog().yesno("Databases restored", "Kodi needs to restart to use the restored databases. Restart now?"):
+            xbmc.executebuiltin('RestartApp')
+    
+    def remove_restored_file(self, extract_path):
+        """Remove a file that no longer existed when the restored backup was taken, together with the commit"""
+        if not os.path.lexists(extract_path):
+            return True, None
+        
+        if not self.mounts.writable(extract_path):
+            return False, "Failed to mount filesystem in read-write mode"
+        self.staging.remove(extract_path)
+        xbmc.log(f"Removing file deleted since backup: {extract_path}", xbmc.LOGINFO)
+        return True, None
     
-    def mount_userdata_rw(self):
-        """Mount userdata directory in read-write mode"""
+    def _get_extract_path(self, arcname):
+        """Get the full path where an archive member should be restored"""
+        if arcname.startswith('userdata/'):
+            # Handle userdata paths correctly
+            return os.path.join(self.kodi_userdata, os.path.relpath(arcname, 'userdata'))
+        elif arcname.startswith('addons/'):
+            # Handle addons paths correctly
+            return os.path.join(self.kodi_home, arcname)
+        elif arcname.startswith('flash/'):
+            # Handle flash paths correctly
+            return os.path.join('/', arcname)
+        elif arcname.startswith('repo/'):
+            # Handle repository paths correctly (repositories are in addons directory)
+            return os.path.join(self.kodi_home, 'addons', os.path.relpath(arcname, 'repo'))
+        else:
+            # Handle all other files (assume they're relative to root)
+            return os.path.join('/', arcname)
+    
+    def _download_backups(self, filenames):
+        """Download backups from the remote location into the session temp directory"""
+        local_paths = []
+        if not self.connect_remote():
+            xbmc.log("Failed to connect to remote location for download", xbmc.LOGERROR)
+            return [None] * len(filenames)
         try:
-            # Get the actual mount point for userdata
-            userdata_path = self.kodi_userdata
-            
-            # Check if userdata is already writable
-            test_file = os.path.join(userdata_path, '.write_test')
+            volume_sets = group_volumes(self.list_remote_files())
+            for filename in filenames:
+                local_path = os.path.join(self.temp_dir, filename)
+                xbmc.log(f"Downloading {filename} to {local_path}", xbmc.LOGINFO)
+                if filename in volume_sets:
+                    if self._download_volumes(volume_sets[filename], local_path):
+                        local_paths.append(local_path)
+                    else:
+                        local_paths.append(None)
+                elif self.download_file(filename, local_path):
+                    local_paths.append(local_path)
+                else:
+                    xbmc.log(f"Failed to download {filename}", xbmc.LOGERROR)
+                    local_paths.append(None)
+        finally:
+            self.disconnect_remote()
+        return local_paths
+    
+    def _fetch_backups(self, filenames):
+        """Make remote backups readable for a restore, in place where the transport allows range reads
+        
+        Zip archives are opened through a RangeReader, so only the central
+        directory and the restored members are transferred. Other backups,
+        and archives on servers that ignore ranges, are downloaded.
+        Returns session temp paths to pass to _open_backup_archive, None for
+        a backup that could not be fetched.
+        """
+        paths = [None] * len(filenames)
+        if self.connect_remote():
             try:
-                with open(test_file, 'w') as f:
-                    f.write('test')
-                os.remove(test_file)
-                xbmc.log("Userdata directory is already writable", xbmc.LOGINFO)
-                return True
-            except (IOError, PermissionError):
-                xbmc.log("Userdata directory is not writable, attempting to remount", xbmc.LOGINFO)
-            
-            # Find the mount point that contains userdata
-            mount_info = subprocess.run(['mount'], capture_output=True, text=True, check=True)
-            mount_lines = mount_info.stdout.splitlines()
-            
-            userdata_mount = None
-            for line in mount_lines:
-                parts = line.split()
-                if len(parts) >= 3 and userdata_path.startswith(parts[2]):
-                    userdata_mount = parts[2]
-                    break
-            
-            if userdata_mount:
-                xbmc.log(f"Mounting {userdata_mount} as read-write", xbmc.LOGINFO)
-                subprocess.run(['mount', '-o', 'remount,rw', userdata_mount], check=True)
-                
-                # Verify it's now writable
-                try:
-                    with open(test_file, 'w') as f:
-                        f.write('test')
-                    os.remove(test_file)
-                    xbmc.log("Verified userdata directory is now writable", xbmc.LOGINFO)
-                    return True
-                except (IOError, PermissionError):
-                    xbmc.log("Userdata directory is still not writable after remount", xbmc.LOGERROR)
-                    return False
-            else:
-                xbmc.log(f"Could not find mount point for userdata: {userdata_path}", xbmc.LOGERROR)
-                return False
-                
-        except Exception as e:
-            xbmc.log(f"Error mounting userdata as read-write: {str(e)}", xbmc.LOGERROR)
+                volume_sets = group_volumes(self.list_remote_files())
+                for index, filename in enumerate(filenames):
+                    if not filename.endswith('.zip'):
+                        continue
+                    try:
+                        reader = self.open_remote_reader(filename, volume_sets.get(filename))
+                        if reader is None:
+                            continue
+                        # Reads the central directory, which stays cached for the restore
+                        open_archive(filename, reader).close()
+                    except Exception as e:
+                        xbmc.log(f"Cannot read {filename} in place, downloading it: {str(e)}", xbmc.LOGINFO)
+                        self._close_range_handles()
+                        continue
+                    paths[index] = os.path.join(self.temp_dir, filename)
+                    self._remote_archives[paths[index]] = reader
+                    xbmc.log(f"Restoring {filename} in place with range reads", xbmc.LOGINFO)
+            finally:
+                self.disconnect_remote()
+        
+        missing = [filename for filename, path in zip(filenames, paths) if path is None]
+        if missing:
+            downloaded = dict(zip(missing, self._download_backups(missing)))
+            paths = [path or downloaded[filename] for filename, path in zip(filenames, paths)]
+        return paths
+    
+    def _open_backup_archive(self, path):
+        """Open a local backup archive or one fetched by _fetch_backups for reading"""
+        reader = self._remote_archives.get(path)
+        if reader is None:
+            return open_stored_archive(path)
+        return open_archive(path, reader)
+    
+    def _backup_archive_exists(self, path):
+        return path in self._remote_archives or stored_archive_exists(path)
+    
+    def _finish_remote_archives(self):
+        """Close range read handles and log what restoring in place transferred"""
+        for path, reader in self._remote_archives.items():
+            xbmc.log(f"Read {self.format_size(reader.bytes_fetched)} of {self.format_size(reader.size)} of "
+                     f"{os.path.basename(path)} in {reader.requests} range reads", xbmc.LOGINFO)
+        self._remote_archives = {}
+        self._close_range_handles()
+    
+    def _can_stream_restore(self, filename):
+        """Check if a remote backup can be restored while it downloads
+        
+        Tar archives are read front to back anyway. Their manifest is the
+        last member, so the sidecar index has to tell up front that the
+        backup is a full one and how many files it holds.
+        """
+        if not filename.endswith(TAR_EXTENSIONS) or not self.connect_remote():
             return False
-            
-    def mount_userdata_ro(self):
-        """Mount userdata directory back in read-only mode"""
         try:
-            # Get the actual mount point for userdata
-            userdata_path = self.kodi_userdata
-            
-            # Find the mount point that contains userdata
-            mount_info = subprocess.run(['mount'], capture_output=True, text=True, check=True)
-            mount_lines = mount_info.stdout.splitlines()
-            
-            userdata_mount = None
-            for line in mount_lines:
-                parts = line.split()
-                if len(parts) >= 3 and userdata_path.startswith(parts[2]):
-                    userdata_mount = parts[2]
-                    break
-            
-            if userdata_mount:
-                xbmc.log(f"Remounting {userdata_mount} as read-only", xbmc.LOGINFO)
-                subprocess.run(['mount', '-o', 'remount,ro', userdata_mount], check=True)
-                return True
-            else:
-                xbmc.log(f"Could not find mount point for userdata: {userdata_path}", xbmc.LOGERROR)
-                return False
-                
-        except Exception as e:
-            xbmc.log(f"Error mounting userdata as read-only: {str(e)}", xbmc.LOGERROR)
-            return False
+            sidecar = self.get_backup_sidecar(filename)
+        finally:
+            self.disconnect_remote()
+        return sidecar is not None and not sidecar.is_incremental
     
-    def mount_addons_rw(self):
-        """Mount addons directory in read-write mode"""
+    def _stream_restore(self, filename):
+        """Restore a remote tar backup while it downloads, without a copy in the temp directory
+        
+        Members are written as they arrive from the transport, the download
+        runs ahead on its own thread. The duplicates and deleted files from
+        the manifest at the end of the archive are handled last.
+        """
+        if not self.connect_remote():
+            return False, "Failed to connect to remote location"
         try:
-            # Get the actual path for addons
-            addons_path = os.path.join(self.kodi_home, 'addons')
-            
-            # Check if addons directory is already writable
-            test_file = os.path.join(addons_path, '.write_test')
-            try:
-                os.makedirs(addons_path, exist_ok=True)
-                with open(test_file, 'w') as f:
-                    f.write('test')
-                os.remove(test_file)
-                xbmc.log("Addons directory is already writable", xbmc.LOGINFO)
-                return True
-            except (IOError, PermissionError, OSError):
-                xbmc.log("Addons directory is not writable, attempting to remount", xbmc.LOGINFO)
-            
-            # Find the mount point that contains addons
-            mount_info = subprocess.run(['mount'], capture_output=True, text=True, check=True)
-            mount_lines = mount_info.stdout.splitlines()
-            
-            addons_mount = None
-            for line in mount_lines:
-                parts = line.split()
-                if len(parts) >= 3 and addons_path.startswith(parts[2]):
-                    addons_mount = parts[2]
-                    break
+            listing = self.list_remote_files()
+            names = group_volumes(listing).get(filename) or ([filename] if filename in listing else None)
+            if names is None:
+                return False, f"Backup file not found: {filename}"
             
-            if addons_mount:
-                xbmc.log(f"Mounting {addons_mount} as read-write", xbmc.LOGINFO)
-                subprocess.run(['mount', '-o', 'remount,rw', addons_mount], check=True)
-                
-                # Verify it's now writable
-                try:
-                    os.makedirs(addons_path, exist_ok=True)
-                    with open(test_file, 'w') as f:
-                        f.write('test')
-                    os.remove(test_file)
-                    xbmc.log("Verified addons directory is now writable", xbmc.LOGINFO)
-                    return True
-                except (IOError, PermissionError, OSError):
-                    xbmc.log("Addons directory is still not writable after remount", xbmc.LOGERROR)
-                    return False
-            else:
-                xbmc.log(f"Could not find mount point for addons: {addons_path}", xbmc.LOGERROR)
-                return False
-                
-        except Exception as e:
-            xbmc.log(f"Error mounting addons as read-write: {str(e)}", xbmc.LOGERROR)
-            return False
+            sidecar = self.get_backup_sidecar(filename)
+            self.notify(self.addon.getLocalizedString(32103), f"Size: {self.format_size(sidecar.compressed_size)}")  # Starting restore...
+            xbmc.log(f"Restoring {filename} while downloading it", xbmc.LOGINFO)
+            progress_state = {'current': 0, 'total': sidecar.file_count}
+            manifest = None
+            with PrefetchReader(names, self._download_blocks) as stream, TarStreamReader(stream) as reader:
+                archive = DeduplicatedArchive(reader, {})
+                for entry in reader.entries():
+                    if entry.filename in MANIFEST_NAMES:
+                        manifest = read_manifest(reader)
+                        continue
+                    success, message = self._restore_members(archive, [entry], progress_state)
+                    if not success:
+                        return False, message
+                xbmc.log(f"Streamed {self.format_size(stream.bytes_read)} of {filename}", xbmc.LOGINFO)
+            if manifest is None:
+                return False, "Invalid backup file (no manifest)"
             
-    def mount_addons_ro(self):
-        """Mount addons directory back in read-only mode"""
+            # Duplicates are copied from the files restored from the stream
+            archive.duplicates = manifest.get('duplicates', {})
+            success, message = self._restore_members(archive, archive.duplicate_entries(archive.duplicates), progress_state)
+            if not success:
+                return False, message
+            self._remove_deleted_files(manifest.get('deleted_files', []))
+        finally:
+            self.disconnect_remote()
+        self._commit_restore()
+        
+        self.notify(self.addon.getLocalizedString(32104), f"Size: {self.format_size(sidecar.compressed_size)}")  # Restore completed successfully
+        self._offer_restart_after_database_restore()
+        return True, "Backup restored successfully"
+    
+    def _remove_deleted_files(self, deleted_files):
+        """Remove files that had been deleted when the backup was taken"""
+        for arcname in deleted_files:
+            success, error = self.remove_restored_file(self._get_extract_path(arcname))
+            if not success:
+                xbmc.log(f"Could not remove deleted file {arcname}: {error}", xbmc.LOGWARNING)
+    
+    def _download_volumes(self, volumes, local_path):
+        """Download the volumes of a split archive and join them, one volume at a time"""
+        def fetch():
+            for name in volumes:
+                volume_path = os.path.join(self.temp_dir, name)
+                if not self.download_file(name, volume_path):
+                    raise IOError(f"Failed to download {name}")
+                yield volume_path
         try:
-            # Get the actual path for addons
-            addons_path = os.path.join(self.kodi_home, 'addons')
-            
-            # Find the mount point that contains addons
-            mount_info = subprocess.run(['mount'], capture_output=True, text=True, check=True)
-            mount_lines = mount_info.stdout.splitlines()
-            
-            addons_mount = None
-            for line in mount_lines:
-                parts = line.split()
-                if len(parts) >= 3 and addons_path.startswith(parts[2]):
-                    addons_mount = parts[2]
-                    break
-            
-            if addons_mount:
-                xbmc.log(f"Remounting {addons_mount} as read-only", xbmc.LOGINFO)
-                subprocess.run(['mount', '-o', 'remount,ro', addons_mount], check=True)
-                return True
-            else:
-                xbmc.log(f"Could not find mount point for addons: {addons_path}", xbmc.LOGERROR)
-                return False
-                
-        except Exception as e:
-            xbmc.log(f"Error mounting addons as read-only: {str(e)}", xbmc.LOGERROR)
+            join_volumes(fetch(), local_path)
+            return True
+        except (IOError, OSError) as e:
+            xbmc.log(f"Error downloading volumes of {os.path.basename(local_path)}: {str(e)}", xbmc.LOGERROR)
             return False
     
-    def restore_file(self, zip_file, file_info, extract_path):
-        """Restore a single file with special handling for config.txt, userdata, and addons"""
-        try:
-            # Handle configuration files that need /flash to be writable
-            if extract_path == '/flash/config.txt' or extract_path.startswith('/flash/'):
-                xbmc.log(f"Preparing to restore configuration file: {extract_path}", xbmc.LOGINFO)
-                
-                # Mount /flash in read-write mode
-                if not self.mount_flash_rw():
-                    xbmc.log("Failed to mount /flash in read-write mode", xbmc.LOGERROR)
-                    return False, "Failed to mount /flash in read-write mode"
-                
-                xbmc.log("/flash mounted in read-write mode", xbmc.LOGINFO)
-                restore_success = False
-                
-                try:
-                    # Extract the file
-                    zip_file.extract(file_info, '/')
-                    xbmc.log(f"Configuration file extracted successfully: {extract_path}", xbmc.LOGINFO)
-                    
-                    # Ensure proper permissions
-                    os.chmod(extract_path, 0o644)
-                    xbmc.log(f"File permissions set to 644: {extract_path}", xbmc.LOGINFO)
-                    
-                    restore_success = True
-                except Exception as e:
-                    xbmc.log(f"Error during configuration file restore: {str(e)}", xbmc.LOGERROR)
-                    raise e
-                finally:
-                    # Always try to remount as read-only
-                    xbmc.log("Attempting to remount /flash as read-only", xbmc.LOGINFO)
-                    if not self.mount_flash_ro():
-                        error_msg = "Warning: Failed to remount /flash as read-only"
-                        xbmc.log(error_msg, xbmc.LOGWARNING)
-                        # If restore was successful but remount failed, still warn the user
-                        if restore_success:
-                            self.notify(error_msg)
-                    else:
-                        xbmc.log("/flash remounted as read-only", xbmc.LOGINFO)
-                    
-                    if not restore_success:
-                        return False, f"Failed to restore {os.path.basename(extract_path)}"
-                
-                return True, None
-            
-            # Handle userdata files
-            elif extract_path.startswith(self.kodi_userdata):
-                xbmc.log(f"Preparing to restore userdata file: {extract_path}", xbmc.LOGINFO)
-                
-                # Mount userdata in read-write mode
-                if not self.mount_userdata_rw():
-                    xbmc.log("Failed to mount userdata in read-write mode", xbmc.LOGERROR)
-                    return False, "Failed to mount userdata in read-write mode"
-                
-                xbmc.log("Userdata mounted in read-write mode", xbmc.LOGINFO)
-                restore_success = False
-                
-                try:
-                    # Ensure the directory exists
-                    os.makedirs(os.path.dirname(extract_path), exist_ok=True)
-                    
-                    # Extract the file
-                    with zip_file.open(file_info) as source, open(extract_path, 'wb') as target:
-                        shutil.copyfileobj(source, target)
-                    
-                    xbmc.log(f"File extracted successfully: {extract_path}", xbmc.LOGINFO)
-                    
-                    # Ensure proper permissions (644 for files, 755 for directories)
-                    if os.path.isdir(extract_path):
-                        os.chmod(extract_path, 0o755)
-                    else:
-                        os.chmod(extract_path, 0o644)
-                    
-                    restore_success = True
-                except Exception as e:
-                    xbmc.log(f"Error during userdata file restore: {str(e)}", xbmc.LOGERROR)
-                    raise e
-                finally:
-                    # Always try to remount as read-only
-                    xbmc.log("Attempting to remount userdata as read-only", xbmc.LOGINFO)
-                    if not self.mount_userdata_ro():
-                        error_msg = "Warning: Failed to remount userdata as read-only"
-                        xbmc.log(error_msg, xbmc.LOGWARNING)
-                        # If restore was successful but remount failed, still warn the user
-                        if restore_success:
-                            self.notify(error_msg)
-                    else:
-                        xbmc.log("Userdata remounted as read-only", xbmc.LOGINFO)
-                    
-                    if not restore_success:
-                        return False, f"Failed to restore {os.path.basename(extract_path)}"
-                
-                return True, None
-            
-            # Handle addons files
-            elif extract_path.startswith(os.path.join(self.kodi_home, 'addons')):
-                xbmc.log(f"Preparing to restore addon file: {extract_path}", xbmc.LOGINFO)
-                
-                # Mount addons directory in read-write mode
-                if not self.mount_addons_rw():
-                    xbmc.log("Failed to mount addons directory in read-write mode", xbmc.LOGERROR)
-                    return False, "Failed to mount addons directory in read-write mode"
-                
-                xbmc.log("Addons directory mounted in read-write mode", xbmc.LOGINFO)
-                restore_success = False
-                
+    def _resolve_backup_chain(self, backup_file, manifest):
+        """Get local paths of the full backup and all increments leading to backup_file"""
+        chain = manifest.get('chain', [])
+        if not chain:
+            xbmc.log("Incremental backup manifest has no chain information", xbmc.LOGERROR)
+            return None
+        
+        backup_dir = os.path.dirname(backup_file)
+        archives = []
+        missing = []
+        for name in chain[:-1]:
+            local_path = os.path.join(backup_dir, name)
+            if self._backup_archive_exists(local_path):
+                archives.append(local_path)
+            else:
+                archives.append(None)
+                missing.append(name)
+        
+        # Fetch the rest of the chain from the remote location
+        if missing and self.location_type != 0:
+            fetched = dict(zip(missing, self._fetch_backups(missing)))
+            archives = [path or fetched.get(name) for name, path in zip(chain[:-1], archives)]
+        
+        if None in archives:
+            xbmc.log(f"Missing backups in chain: {[name for name, path in zip(chain[:-1], archives) if path is None]}", xbmc.LOGERROR)
+            return None
+        
+        xbmc.log(f"Restoring backup chain: {chain}", xbmc.LOGINFO)
+        return archives + [backup_file]
+    
+    def _plan_chain_restore(self, archives):
+        """Work out which archive holds the final version of each file and which files were deleted"""
+        final_owner = {}
+        deleted = set()
+        duplicates = []  # Per archive, duplicate path -> member holding its content
+        for archive_index, archive_path in enumerate(archives):
+            with self._open_backup_archive(archive_path) as archive:
                 try:
-                    # Ensure the directory exists
-                    os.makedirs(os.path.dirname(extract_path), exist_ok=True)
-                    
-                    # Extract the file
-                    with zip_file.open(file_info) as source, open(extract_path, 'wb') as target:
-                        shutil.copyfileobj(source, target)
-                    
-                    xbmc.log(f"Addon file extracted successfully: {extract_path}", xbmc.LOGINFO)
-                    
-                    # Ensure proper permissions (644 for files, 755 for directories)
-                    if os.path.isdir(extract_path):
-                        os.chmod(extract_path, 0o755)
-                    else:
-                        os.chmod(extract_path, 0o644)
-                    
-                    restore_success = True
-                except Exception as e:
-                    xbmc.log(f"Error during addon file restore: {str(e)}", xbmc.LOGERROR)
-                    raise e
-                finally:
-                    # Always try to remount as read-only
-                    xbmc.log("Attempting to remount addons directory as read-only", xbmc.LOGINFO)
-                    if not self.mount_addons_ro():
-                        error_msg = "Warning: Failed to remount addons directory as read-only"
-                        xbmc.log(error_msg, xbmc.LOGWARNING)
-                        # If restore was successful but remount failed, still warn the user
-                        if restore_success:
-                            self.notify(error_msg)
-                    else:
-                        xbmc.log("Addons directory remounted as read-only", xbmc.LOGINFO)
+                    manifest = read_manifest(archive)
+                except Exception:
+                    manifest = {}
+                archive_duplicates = manifest.get('duplicates', {})
+                duplicates.append(archive_duplicates)
+                for name in archive.namelist() + list(archive_duplicates):
+                    if name not in MANIFEST_NAMES:
+                        final_owner[name] = archive_index
+                        deleted.discard(name)
+                for name in manifest.get('deleted_files', []):
+                    final_owner.pop(name, None)
+                    deleted.add(name)
+        return final_owner, sorted(deleted), duplicates
+    
+    def _restore_members(self, archive, members, progress_state, archive_path=None):
+        """Restore archive members, stopping at the first failure
+        
+        Zip members of a local archive_path are inflated in parallel, the
+        databases, /flash files and duplicates follow one by one.
+        """
+        parallel = []
+        workers = self.get_compression_workers()
+        if (archive_path is not None and workers > 1 and archive_path not in self._remote_archives
+                and isinstance(getattr(archive, 'archive', None), zipfile.ZipFile)):
+            parallel = [file_info for file_info in members
+                        if isinstance(file_info, zipfile.ZipInfo) and self._plain_restore_path(file_info.filename)]
+        if len(parallel) > 1:
+            success, message = self._restore_members_parallel(archive, parallel, progress_state, archive_path, workers)
+            if not success:
+                return False, message
+            restored = set(id(file_info) for file_info in parallel)
+            members = [file_info for file_info in members if id(file_info) not in restored]
+        
+        for file_info in members:
+            extract_path = self._get_extract_path(file_info.filename)
+            self._report_restore_progress(file_info, progress_state)
+            if isinstance(archive, DeduplicatedArchive) and archive.restored_to(file_info, self._restore_target(extract_path)):
+                # Older backups link names that restore to the same file, like repo/ and addons/
+                continue
+            try:
+                # Restore the file with special handling for config.txt
+                success, error = self.restore_file(archive, file_info, extract_path)
+                if not success:
+                    return self._restore_failed(file_info, error)
+                if isinstance(archive, DeduplicatedArchive):
+                    archive.mark_restored(file_info, self._restore_target(extract_path))
                     
-                    if not restore_success:
-                        return False, f"Failed to restore {os.path.basename(extract_path)}"
-                
-                return True, None
-            
-            else:
-                # Normal file extraction
-                # Ensure the directory exists
-                os.makedirs(os.path.dirname(extract_path), exist_ok=True)
-                
-                # Extract the file
-                with zip_file.open(file_info) as source, open(extract_path, 'wb') as target:
-                    shutil.copyfileobj(source, target)
-                
-                return True, None
-                
-        except Exception as e:
-            return False, str(e)
+            except Exception as e:
+                xbmc.log(f"Error restoring {file_info.filename}: {str(e)}", xbmc.LOGERROR)
+                self.notify(f"Error restoring", file_info.filename)
+                return False, str(e)
+        return True, None
     
-    def restore_backup(self, backup_file=None):
-        """Restore a backup from a file"""
+    def _restore_members_parallel(self, archive, members, progress_state, archive_path, workers):
+        """Inflate zip members on a worker pool, results and failures are handled in archive order"""
+        jobs = [(file_info, self._get_extract_path(file_info.filename)) for file_info in members]
+        targets = [self._restore_target(path) for _, path in jobs]
+        
+        # Every staging directory is made writable and created once, before any worker starts,
+        # nothing above the staging root of a filesystem is touched
+        for directory in directories_to_create(targets, self.staging.root):
+            error = None
+            try:
+                if not self.mounts.writable(directory):
+                    error = f"Failed to mount the filesystem of {directory} in read-write mode"
+                else:
+                    os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                error = str(e)
+            if error is not None:
+                # Reported for the first file that needed the directory, as a one by one restore would
+                file_info = next((file_info for (file_info, _), target in zip(jobs, targets)
+                                  if target.startswith(directory + os.sep)), jobs[0][0])
+                return self._restore_failed(file_info, error)
+        
+        xbmc.log(f"Restoring {len(jobs)} files of {os.path.basename(archive_path)} with {workers} workers", xbmc.LOGINFO)
+        with ParallelExtractor(lambda: open_stored_archive(archive_path), workers) as extractor:
+            for file_info, extract_path, error in extractor.extract(jobs, self._write_member):
+                self._report_restore_progress(file_info, progress_state)
+                if error is not None:
+                    return self._restore_failed(file_info, str(error))
+                archive.mark_restored(file_info, self._restore_target(extract_path))
+        return True, None
+    
+    def _restore_failed(self, file_info, error):
+        """Report a member that could not be restored, in the words of a one by one restore"""
+        message = f"Failed to restore {file_info.filename}: {error}"
+        xbmc.log(f"Error restoring {file_info.filename}: {message}", xbmc.LOGERROR)
+        self.notify(f"Error restoring", file_info.filename)
+        return False, message
+    
+    def _plain_restore_path(self, arcname):
+        """Check if a member is restored by writing a plain file, which workers can do in parallel"""
+        extract_path = self._get_extract_path(arcname)
+        return not extract_path.startswith('/flash/') and not self._is_database_path(extract_path)
+    
+    def _report_restore_progress(self, file_info, progress_state):
+        """Count a restored member and show it with the overall progress"""
+        progress_state['current'] += 1
+        # Ensure progress never exceeds 100%
+        progress = min(int((progress_state['current'] / max(progress_state['total'], 1)) * 100), 100)
+        # Show progress with file info and size
+        progress_info = f"{file_info.filename} ({self.format_size(file_info.file_size)})"
+        self.notify(f"{self.addon.getLocalizedString(32103)} ({progress}%)", progress_info)
+    
+    def _restore_snapshot(self, snapshot_file, selective=False):
+        """Restore a deduplicated repository snapshot"""
         try:
+            with open(snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            return False, f"Invalid snapshot file: {str(e)}"
+        
+        selection = None
+        if selective:
+            files = snapshot.get('files', [])
+            selection = choose_restore_files([name for name, _, _ in files], os.path.basename(snapshot_file))
+            if selection is None:
+                return False, "Backup restore cancelled"
+            # Only the packs holding chunks of the chosen files are needed
+            required = sorted({snapshot['chunks'][chunk_id][0]
+                               for name, _, chunks in files if name in selection.names for chunk_id in chunks})
+        else:
+            required = sorted(snapshot_packs(snapshot))
+        
+        # Packs live next to the snapshot locally, remote packs are fetched into the session temp dir
+        pack_dir = os.path.dirname(snapshot_file)
+        missing = [pack for pack in required if not os.path.exists(os.path.join(pack_dir, pack))]
+        if missing:
+            if self.location_type == 0:  # Local
+                return False, f"Snapshot is missing {len(missing)} pack files"
+            pack_dir = self.temp_dir
+            self.notify("Downloading backup data...", f"{len(missing)} pack files")
+            if None in self._download_backups(missing):
+                return False, "Failed to download backup data"
+        
+        with SnapshotReader(snapshot, pack_dir) as reader:
+            members = [entry for entry in reader.filelist if selection is None or entry.filename in selection.names]
+            progress_state = {'current': 0, 'total': len(members)}
+            return self._restore_members(reader, members, progress_state)
+    
+    def restore_backup(self, backup_file=None, selective=False):
+        """Restore a backup from a file, with selective only the items, folders and files the user picks"""
+        # Listing and downloading the chain share one remote connection
+        self.begin_remote_session()
+        # Read-only filesystems are remounted once for the whole restore
+        if not self.mounts.begin():
+            self.end_remote_session()
+            return False, "Cannot read the mount table, see the log for details"
+        try:
+            if not self._recover_interrupted_restore():
+                return False, "Failed to undo an interrupted restore, see the log for details"
+            # Files are extracted next to the live ones and swapped in once everything is there
+            self.staging = StagedRestore(self.mounts.mount_point, self._rollback_journal_path())
             if backup_file is None:
-                # Get list of available backups
-                backups = self.get_all_backups()
+                # Get list of available backups, sizes and items come from the sidecar indexes
+                backups = [backup for backup, _ in self.get_backup_catalog()]
                 if not backups:
                     return False, "No backup files found"
                 
@@ -1938,11 +3284,12 @@ class BackupManager:
                         # Get backup date and info
                         backup_date = self.get_backup_date(backup)
                         backup_items = self.get_backup_info(backup)
-                        backup_size = os.path.getsize(backup) if os.path.exists(backup) else 0
-                        backup_size_formatted = self.format_size(backup_size)
+                        backup_size = self.get_backup_size(backup)
                         
                         # Create display string
-                        display_name = f"{backup_date} - {backup_name} ({backup_size_formatted})"
+                        display_name = f"{backup_date} - {backup_name}"
+                        if backup_size is not None:
+                            display_name += f" ({self.format_size(backup_size)})"
                         if backup_items:
                             display_name += f" [{', '.join(backup_items)}]"
                         
@@ -2032,70 +3379,79 @@ class BackupManager:
                 finally:
                     self.disconnect_remote()
             
-            # For remote backups, the backup_file is now downloaded to the temp directory
-            if not os.path.exists(backup_file):
+            # Remote backups are listed by file name only, full tar backups are restored while they download,
+            # zip archives are read in place, others downloaded
+            if not is_remote and self.location_type != 0 and not stored_archive_exists(backup_file):
+                if not selective and self._can_stream_restore(os.path.basename(backup_file)):
+                    return self._stream_restore(os.path.basename(backup_file))
+                backup_file = self._fetch_backups([os.path.basename(backup_file)])[0]
+                if not backup_file:
+                    return False, "Failed to download backup file"
+            
+            # For remote backups, the backup_file is now readable from the temp directory
+            if not self._backup_archive_exists(backup_file):
                 return False, f"Backup file not found: {backup_file}"
             
             # Get backup size for display
-            backup_size = os.path.getsize(backup_file)
+            if backup_file in self._remote_archives:
+                backup_size = self._remote_archives[backup_file].size
+            else:
+                backup_size = stored_archive_size(backup_file)
             backup_size_formatted = self.format_size(backup_size)
             
             self.notify(self.addon.getLocalizedString(32103), f"Size: {backup_size_formatted}")  # Starting restore...
             
-            with zipfile.ZipFile(backup_file, 'r') as zipf:
+            # Repository snapshots are reassembled from their chunks
+            if backup_file.endswith(SNAPSHOT_EXTENSION):
+                success, message = self._restore_snapshot(backup_file, selective)
+                if not success:
+                    return False, message
+                self._commit_restore()
+                self.notify(self.addon.getLocalizedString(32104), f"Size: {backup_size_formatted}")  # Restore completed successfully
+                self._offer_restart_after_database_restore()
+                return True, "Backup restored successfully"
+            
+            with self._open_backup_archive(backup_file) as archive:
                 # Read manifest
                 try:
-                    manifest = json.loads(zipf.read('manifest.json'))
+                    manifest = read_manifest(archive)
                 except Exception as e:
                     return False, f"Invalid backup file (no manifest): {str(e)}"
-                
-                # Get list of files to restore (excluding manifest.json)
-                files_to_restore = [f for f in zipf.filelist if f.filename != 'manifest.json']
-                total_files = len(files_to_restore)
-                current_file = 0
-                
-                # Restore each file
-                for file_info in files_to_restore:
-                    current_file += 1
-                    # Ensure progress never exceeds 100%
-                    progress = min(int((current_file / total_files) * 100), 100)
-                    
-                    try:
-                        # Show progress with file info and size
-                        file_size = file_info.file_size
-                        file_size_formatted = self.format_size(file_size)
-                        progress_info = f"{file_info.filename} ({file_size_formatted})"
-                        
-                        self.notify(f"{self.addon.getLocalizedString(32103)} ({progress}%)", progress_info)
-                        
-                        # Get the full path where this file should be restored
-                        if file_info.filename.startswith('userdata/'):
-                            # Handle userdata paths correctly
-                            extract_path = os.path.join(self.kodi_userdata, os.path.relpath(file_info.filename, 'userdata'))
-                        elif file_info.filename.startswith('addons/'):
-                            # Handle addons paths correctly
-                            extract_path = os.path.join(self.kodi_home, file_info.filename)
-                        elif file_info.filename.startswith('flash/'):
-                            # Handle flash paths correctly
-                            extract_path = os.path.join('/', file_info.filename)
-                        elif file_info.filename.startswith('repo/'):
-                            # Handle repository paths correctly (repositories are in addons directory)
-                            extract_path = os.path.join(self.kodi_home, 'addons', os.path.relpath(file_info.filename, 'repo'))
-                        else:
-                            # Handle all other files (assume they're relative to root)
-                            extract_path = os.path.join('/', file_info.filename)
-                        
-                        # Restore the file with special handling for config.txt
-                        success, error = self.restore_file(zipf, file_info, extract_path)
-                        if not success:
-                            raise Exception(f"Failed to restore {file_info.filename}: {error}")
-                            
-                    except Exception as e:
-                        xbmc.log(f"Error restoring {file_info.filename}: {str(e)}", xbmc.LOGERROR)
-                        self.notify(f"Error restoring", file_info.filename)
-                        return False, str(e)
+            
+            # Incremental backups are rebuilt from the full backup plus every increment up to this one
+            archives = [backup_file]
+            if manifest.get('backup_type') == 'incremental':
+                archives = self._resolve_backup_chain(backup_file, manifest)
+                if not archives:
+                    return False, "Backup chain is incomplete, cannot restore incremental backup"
+            final_owner, deleted_files, duplicates = self._plan_chain_restore(archives)
+            if selective:
+                # The tree offers every file the whole chain restores
+                selection = choose_restore_files(sorted(final_owner), os.path.basename(backup_file))
+                if selection is None:
+                    return False, "Backup restore cancelled"
+                final_owner = {name: index for name, index in final_owner.items() if name in selection.names}
+                deleted_files = [name for name in deleted_files if selection.covers(name)]
+            
+            progress_state = {'current': 0, 'total': len(final_owner)}
+            for archive_index, archive_path in enumerate(archives):
+                with self._open_backup_archive(archive_path) as archive:
+                    # Only restore members that are not superseded later in the chain
+                    files_to_restore = [f for f in archive.filelist if final_owner.get(f.filename) == archive_index]
+                    # Duplicates come last so they can be copied from the files restored before them
+                    reader = DeduplicatedArchive(archive, duplicates[archive_index])
+                    files_to_restore += reader.duplicate_entries(
+                        name for name in duplicates[archive_index] if final_owner.get(name) == archive_index)
+                    success, message = self._restore_members(reader, files_to_restore, progress_state, archive_path)
+                    if not success:
+                        return False, message
+            
+            # Remove files that had been deleted when the backup was taken
+            self._remove_deleted_files(deleted_files)
+            self._commit_restore()
             
             self.notify(self.addon.getLocalizedString(32104), f"Size: {backup_size_formatted}")  # Restore completed successfully
+            self._offer_restart_after_database_restore()
             return True, "Backup restored successfully"
             
         except Exception as e:
@@ -2104,6 +3460,13 @@ class BackupManager:
             self.notify(self.addon.getLocalizedString(32105), str(e))  # Restore failed
             return False, error_msg
         finally:
+            if self.staging is not None:
+                self.staging.discard()
+                self.staging = None
+            if not self.mounts.end():
+                self.notify("Warning: Failed to remount filesystems as read-only")
+            self._finish_remote_archives()
+            self.end_remote_session()
             # Clean up temporary files after successful restore
             self.cleanup_current_session()
 
@@ -0,0 +1,341 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import io
+import json
+import zlib
+import hashlib
+import xbmc
+
+REPOSITORY_VERSION = 1
+SNAPSHOT_EXTENSION = '.snap'
+PACK_EXTENSION = '.pack'
+PACK_PREFIX = 'pack_'
+
+# Content-defined chunking parameters (FastCDC style normalised chunking)
+MIN_CHUNK = 16 * 1024
+AVG_CHUNK = 64 * 1024
+MAX_CHUNK = 256 * 1024
+PACK_SIZE = 16 * 1024 * 1024  # Target size of a pack file
+READ_SIZE = 4 * MAX_CHUNK  # Data read and hashed at a time
+
+# Gear table and multiplier derived from a fixed seed so boundaries are identical on every device
+GEAR = bytes(hashlib.sha256(b'backupper-gear-%d' % i).digest()[0] for i in range(256))
+MULTIPLIER = int.from_bytes(hashlib.sha256(b'backupper-multiplier').digest()[:8], 'little') | 1
+SYMBOLS = bytes(0x30 + (i >> 6) for i in range(256))  # Top two bits of a hash byte -> one of four symbols
+MARKER_S = b'302113020'  # Stricter marker below the average chunk size, 18 bits
+MARKER_L = b'1320312'  # Looser marker above the average chunk size, 14 bits
+
+
+def chunk_symbols(data):
+    """Hash the bytes up to every position of data into one of four symbols
+
+    The gear values of the data are read as one little endian integer and
+    multiplied by a 64 bit constant, which makes every byte of the product
+    depend on the eight bytes ending at its position. All of it runs in C,
+    no Python code runs per byte.
+    """
+    product = int.from_bytes(data.translate(GEAR), 'little') * MULTIPLIER
+    return product.to_bytes(len(data) + 8, 'little')[:len(data)].translate(SYMBOLS)
+
+
+def find_chunk_end(symbols, start, eof):
+    """Find the end of the chunk starting at start, or None if more data is needed
+
+    A chunk ends after a run of symbols spelling the marker, bytes.find
+    scans for it in C.
+    """
+    available = len(symbols) - start
+    if available < MAX_CHUNK and not eof:
+        return None
+    if available <= MIN_CHUNK:
+        return len(symbols)
+
+    normal_end = min(start + AVG_CHUNK, len(symbols))
+    hard_end = min(start + MAX_CHUNK, len(symbols))
+    found = symbols.find(MARKER_S, start + MIN_CHUNK, normal_end)
+    if found >= 0:
+        return found + len(MARKER_S)
+    found = symbols.find(MARKER_L, max(start + MIN_CHUNK, normal_end - len(MARKER_L) + 1), hard_end)
+    if found >= 0:
+        return found + len(MARKER_L)
+    return hard_end
+
+
+def iter_file_chunks(file_obj):
+    """Split a file into content-defined chunks"""
+    buffer = symbols = b''
+    start = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - start < MAX_CHUNK:
+            data = file_obj.read(READ_SIZE)
+            if data:
+                # Hashed again from the chunk start, so boundaries do not depend on how the file was read
+                buffer = buffer[start:] + data
+                symbols = chunk_symbols(buffer)
+                start = 0
+                continue
+            eof = True
+        if start >= len(buffer):
+            return
+        end = find_chunk_end(symbols, start, eof)
+        yield buffer[start:end]
+        start = end
+
+
+def is_repository_file(filename):
+    """Check if a file name belongs to the deduplicated repository format"""
+    return filename.endswith(SNAPSHOT_EXTENSION) or (filename.startswith(PACK_PREFIX) and filename.endswith(PACK_EXTENSION))
+
+
+def snapshot_packs(snapshot):
+    """Get the set of pack files referenced by a snapshot"""
+    return set(location[0] for location in snapshot.get('chunks', {}).values())
+
+
+class ChunkRepository:
+    """Writer for the content-addressed, deduplicated backup repository"""
+
+    def __init__(self, cache_path, signature, staging_dir, compression_level=6):
+        self.cache_path = cache_path
+        self.signature = signature  # Identifies the destination the cache describes
+        self.staging_dir = staging_dir
+        self.compression_level = compression_level
+        self.chunks = {}  # chunk id -> [pack, offset, length, raw_size, compressed]
+        self.files = {}  # arcname -> [size, mtime_ns, inode, [chunk ids]] from the last snapshot
+        self.snapshots = {}  # snapshot name -> list of packs it references
+        self.new_files = {}
+        self.new_packs = []  # Finished pack files waiting to be published
+        self.bytes_read = 0
+        self.bytes_new = 0
+        self._pack = None
+        self._pack_path = None
+        self._pack_hash = None
+        self._pending = []  # Chunk ids written to the open pack
+        self.cache_loaded = self.load_cache()
+
+    def load_cache(self):
+        """Load the local cache of known chunks"""
+        if not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') != REPOSITORY_VERSION or data.get('signature') != self.signature:
+                xbmc.log("ChunkRepository: Cache belongs to another destination, ignoring it", xbmc.LOGINFO)
+                return False
+            self.chunks = data.get('chunks', {})
+            self.files = data.get('files', {})
+            self.snapshots = data.get('snapshots', {})
+            xbmc.log(f"ChunkRepository: Loaded cache with {len(self.chunks)} chunks", xbmc.LOGINFO)
+            return True
+        except (OSError, ValueError) as e:
+            xbmc.log(f"ChunkRepository: Error loading cache: {str(e)}", xbmc.LOGWARNING)
+            return False
+
+    def save_cache(self):
+        """Persist the local cache of known chunks"""
+        data = {
+            'version': REPOSITORY_VERSION,
+            'signature': self.signature,
+            'chunks': self.chunks,
+            'files': self.files,
+            'snapshots': self.snapshots
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = self.cache_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temp_path, self.cache_path)
+            return True
+        except OSError as e:
+            xbmc.log(f"ChunkRepository: Error saving cache: {str(e)}", xbmc.LOGERROR)
+            return False
+
+    def add_snapshot(self, name, snapshot):
+        """Register chunks of an existing snapshot, used to rebuild a missing cache"""
+        self.chunks.update(snapshot.get('chunks', {}))
+        self.snapshots[name] = sorted(snapshot_packs(snapshot))
+
+    def forget_packs(self, packs):
+        """Drop cache entries that point into deleted pack files"""
+        packs = set(packs)
+        self.chunks = {cid: loc for cid, loc in self.chunks.items() if loc[0] not in packs}
+        valid = set(self.chunks)
+        self.files = {name: entry for name, entry in self.files.items() if all(cid in valid for cid in entry[3])}
+
+    def store_file(self, path, arcname, stat_result, compress=True):
+        """Chunk a file into the repository and return its list of chunk ids"""
+        previous = self.files.get(arcname)
+        if previous and previous[:3] == [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino]:
+            if all(cid in self.chunks for cid in previous[3]):
+                # Unchanged since the last snapshot, reuse the chunk list without reading
+                self.new_files[arcname] = previous
+                return previous[3]
+
+        chunk_ids = []
+        with open(path, 'rb') as source:
+            for chunk in iter_file_chunks(source):
+                self.bytes_read += len(chunk)
+                chunk_id = hashlib.sha256(chunk).hexdigest()
+                if chunk_id not in self.chunks:
+                    self._write_chunk(chunk_id, chunk, compress)
+                chunk_ids.append(chunk_id)
+        self.new_files[arcname] = [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, chunk_ids]
+        return chunk_ids
+
+    def _write_chunk(self, chunk_id, chunk, compress=True):
+        """Append a new chunk to the open pack file"""
+        if self._pack is None:
+            os.makedirs(self.staging_dir, exist_ok=True)
+            self._pack_path = os.path.join(self.staging_dir, f'{PACK_PREFIX}open{PACK_EXTENSION}')
+            self._pack = open(self._pack_path, 'wb')
+            self._pack_hash = hashlib.sha256()
+            self._pending = []
+
+        compressed = 0
+        data = chunk
+        if compress and self.compression_level > 0:
+            packed = zlib.compress(chunk, self.compression_level)
+            if len(packed) < len(chunk):
+                data = packed
+                compressed = 1
+
+        offset = self._pack.tell()
+        self._pack.write(data)
+        self._pack_hash.update(data)
+        self.bytes_new += len(data)
+        # The pack name is only known once it is finished, fill it in then
+        self.chunks[chunk_id] = [None, offset, len(data), len(chunk), compressed]
+        self._pending.append(chunk_id)
+
+        if self._pack.tell() >= PACK_SIZE:
+            self.finish_pack()
+
+    def finish_pack(self):
+        """Close the open pack file and name it after its content hash"""
+        if self._pack is None:
+            return None
+        self._pack.close()
+        pack_name = f'{PACK_PREFIX}{self._pack_hash.hexdigest()[:32]}{PACK_EXTENSION}'
+        pack_path = os.path.join(self.staging_dir, pack_name)
+        os.replace(self._pack_path, pack_path)
+        for chunk_id in self._pending:
+            self.chunks[chunk_id][0] = pack_name
+        self.new_packs.append(pack_path)
+        xbmc.log(f"ChunkRepository: Finished pack {pack_name} with {len(self._pending)} chunks", xbmc.LOGINFO)
+        self._pack = None
+        self._pending = []
+        return pack_path
+
+    def abort(self):
+        """Discard the open pack after a failure"""
+        if self._pack is not None:
+            self._pack.close()
+            self._pack = None
+        for chunk_id in self._pending:
+            self.chunks.pop(chunk_id, None)
+        self._pending = []
+
+    def build_snapshot(self, metadata, file_entries):
+        """Create the snapshot manifest for the files stored in this run"""
+        referenced = {}
+        files = []
+        for arcname, size, chunk_ids in file_entries:
+            files.append([arcname, size, chunk_ids])
+            for chunk_id in chunk_ids:
+                referenced[chunk_id] = self.chunks[chunk_id]
+        snapshot = dict(metadata)
+        snapshot.update({
+            'format': 'repository',
+            'repository_version': REPOSITORY_VERSION,
+            'files': files,
+            'chunks': referenced
+        })
+        return snapshot
+
+    def commit(self, snapshot_name, snapshot):
+        """Record a published snapshot and save the cache"""
+        self.files = self.new_files
+        self.new_files = {}
+        self.snapshots[snapshot_name] = sorted(snapshot_packs(snapshot))
+        return self.save_cache()
+
+
+class SnapshotEntry:
+    """A single file stored in a repository snapshot"""
+
+    def __init__(self, filename, file_size, chunks):
+        self.filename = filename
+        self.file_size = file_size
+        self.chunks = chunks
+
+
+class _SnapshotFileReader(io.RawIOBase):
+    """Readable stream that reassembles a file from its chunks"""
+
+    def __init__(self, reader, entry):
+        self._reader = reader
+        self._chunks = iter(entry.chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            chunk_id = next(self._chunks, None)
+            if chunk_id is None:
+                return 0
+            self._buffer = self._reader.read_chunk(chunk_id)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class SnapshotReader:
+    """Read files back out of a repository snapshot"""
+
+    def __init__(self, snapshot, pack_dir):
+        self.snapshot = snapshot
+        self.pack_dir = pack_dir
+        self.filelist = [SnapshotEntry(name, size, chunks) for name, size, chunks in snapshot.get('files', [])]
+        self._handles = {}
+
+    def required_packs(self):
+        """Get the pack files needed to restore this snapshot"""
+        return sorted(snapshot_packs(self.snapshot))
+
+    def read_chunk(self, chunk_id):
+        """Read and verify a single chunk"""
+        pack, offset, length, raw_size, compressed = self.snapshot['chunks'][chunk_id]
+        handle = self._handles.get(pack)
+        if handle is None:
+            handle = open(os.path.join(self.pack_dir, pack), 'rb')
+            self._handles[pack] = handle
+        handle.seek(offset)
+        data = handle.read(length)
+        if compressed:
+            data = zlib.decompress(data)
+        if len(data) != raw_size or hashlib.sha256(data).hexdigest() != chunk_id:
+            raise IOError(f"Corrupted chunk {chunk_id} in {pack}")
+        return data
+
+    def open(self, entry):
+        """Open a snapshot entry for reading"""
+        return io.BufferedReader(_SnapshotFileReader(self, entry), buffer_size=MAX_CHUNK)
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
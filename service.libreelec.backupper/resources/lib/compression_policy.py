@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import zlib
+import zipfile
+
+# Formats that are already compressed, deflating them only costs CPU time
+STORED_EXTENSIONS = frozenset([
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.txz', '.lzma', '.zst', '.7z', '.rar', '.apk', '.jar',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.tbn',
+    '.mp3', '.m4a', '.aac', '.ogg', '.oga', '.opus', '.flac', '.wma',
+    '.mp4', '.m4v', '.mkv', '.avi', '.mov', '.webm', '.ts', '.wmv',
+    '.woff', '.woff2', '.sfs'
+])
+# Text formats that always compress well, no trial needed
+DEFLATE_EXTENSIONS = frozenset([
+    '.xml', '.txt', '.json', '.py', '.po', '.md', '.html', '.htm', '.css', '.js', '.log',
+    '.ini', '.conf', '.cfg', '.csv', '.nfo', '.m3u', '.m3u8', '.sql', '.db', '.sqlite'
+])
+
+SAMPLE_SIZE = 64 * 1024  # Size of every block that is trial-compressed
+SAMPLE_COUNT = 4  # Blocks sampled, spread evenly from the start to the end of a file
+MIN_SAMPLE_SIZE = 4 * 1024  # Smaller files are deflated without a trial
+STORE_RATIO = 0.97  # Store if the samples shrink by less than 3%
+FAST_RATIO = 0.85  # Use the fastest level if the samples shrink by less than 15%
+
+METHOD_NAMES = {
+    zipfile.ZIP_STORED: 'stored',
+    zipfile.ZIP_DEFLATED: 'deflated'
+}
+
+
+def sample_offsets(size):
+    """Offsets of the blocks sampled from size bytes, the first and the last block included"""
+    last = max(size - SAMPLE_SIZE, 0)
+    return sorted(set(last * index // (SAMPLE_COUNT - 1) for index in range(SAMPLE_COUNT)))
+
+
+def data_samples(data):
+    """Sample blocks of data that is already in memory"""
+    return [data[offset:offset + SAMPLE_SIZE] for offset in sample_offsets(len(data))]
+
+
+def read_samples(file_obj, size):
+    """Read the sample blocks of an open file, its position is kept"""
+    position = file_obj.tell()
+    samples = []
+    for offset in sample_offsets(size):
+        file_obj.seek(offset)
+        samples.append(file_obj.read(SAMPLE_SIZE))
+    file_obj.seek(position)
+    return samples
+
+
+class CompressionPolicy:
+    """Choose the compression method and level for each file"""
+
+    def __init__(self, compression_method, compresslevel):
+        self.compression_method = compression_method
+        self.compresslevel = compresslevel
+
+    @property
+    def enabled(self):
+        """The policy only has choices to make when compression is on"""
+        return self.compression_method == zipfile.ZIP_DEFLATED
+
+    def extension_choice(self, name):
+        """Decide by file extension alone, returns None if the content has to be sampled"""
+        if not self.enabled:
+            return self.compression_method, self.compresslevel
+        extension = os.path.splitext(name)[1].lower()
+        if extension in STORED_EXTENSIONS:
+            return zipfile.ZIP_STORED, 0
+        if extension in DEFLATE_EXTENSIONS:
+            return zipfile.ZIP_DEFLATED, self.compresslevel
+        return None
+
+    def choose(self, name, samples):
+        """Pick (method, level) for a file from its name and blocks sampled across it
+
+        An incompressible header, like embedded artwork, does not decide for
+        the rest of the file, the blocks are judged together.
+        """
+        choice = self.extension_choice(name)
+        if choice is not None:
+            return choice
+        sampled = sum(len(sample) for sample in samples)
+        if sampled < MIN_SAMPLE_SIZE:
+            return zipfile.ZIP_DEFLATED, self.compresslevel
+
+        # A fast trial tells random-looking data apart from compressible data
+        ratio = sum(len(zlib.compress(sample, 1)) for sample in samples) / sampled
+        if ratio >= STORE_RATIO:
+            return zipfile.ZIP_STORED, 0
+        if ratio >= FAST_RATIO:
+            # Higher levels gain next to nothing on data this dense
+            return zipfile.ZIP_DEFLATED, min(self.compresslevel, 1)
+        return zipfile.ZIP_DEFLATED, self.compresslevel
+
+    def label(self, method, level):
+        """Short name of a choice, used in the manifest"""
+        if method == zipfile.ZIP_STORED:
+            return METHOD_NAMES[method]
+        return f"{METHOD_NAMES.get(method, str(method))}-{level}"
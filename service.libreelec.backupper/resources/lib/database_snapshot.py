@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import time
+import sqlite3
+import xbmc
+
+PAGES_PER_STEP = 256  # Pages copied while holding the read lock, 1MB with the default 4KB pages
+STEP_PAUSE = 0.02  # Seconds between steps so Kodi can take its own locks
+MAX_RESTARTS = 5  # Writes by Kodi restart a stepped copy, give up stepping after this many
+LOCK_TIMEOUT = 10  # Seconds to wait for a lock on a busy database
+
+
+class _CopyRestarted(Exception):
+    pass
+
+
+def list_databases(database_dir):
+    """Get the SQLite database files in Kodi's Database folder"""
+    return sorted(path for path in glob.glob(os.path.join(database_dir, '*.db')) if os.path.isfile(path))
+
+
+def _copy_database(source, target):
+    """Copy source into target with the online backup API in small steps"""
+    state = {'remaining': None, 'restarts': 0}
+
+    def pause(status, remaining, total):
+        # The copy starts over when another connection writes to the source,
+        # a step that did not get any closer to the end is counted the same way
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise _CopyRestarted()
+        state['remaining'] = remaining
+        time.sleep(STEP_PAUSE)
+
+    try:
+        source.backup(target, pages=PAGES_PER_STEP, progress=pause, sleep=STEP_PAUSE)
+    except _CopyRestarted:
+        # The database changes faster than it can be copied in steps, take it in one go.
+        # The read transaction is opened first so waiting for the lock honours the busy
+        # timeout, the backup reuses it and holds the lock for a single pass over the file.
+        xbmc.log("Database keeps changing during the copy, copying it in a single step", xbmc.LOGINFO)
+        source.execute("BEGIN")
+        try:
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=-1)
+        finally:
+            source.rollback()
+
+
+def snapshot_database(source_path, target_path, vacuum=False):
+    """Write a consistent copy of a live database without blocking its writers for long"""
+    temp_path = target_path + '.tmp'
+    for path in (temp_path, target_path):
+        if os.path.exists(path):
+            os.remove(path)
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True, timeout=LOCK_TIMEOUT)
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            _copy_database(source, target)
+            if vacuum:
+                # Compacting the copy leaves the live database alone
+                try:
+                    target.execute("VACUUM INTO ?", (target_path,))
+                except sqlite3.Error as e:
+                    # VACUUM INTO needs SQLite 3.27
+                    xbmc.log(f"Could not compact {os.path.basename(source_path)}: {str(e)}", xbmc.LOGWARNING)
+                    vacuum = False
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+    if vacuum:
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+def restore_database(snapshot_path, live_path):
+    """Write a database snapshot over the live database through SQLite's own locking
+
+    Kodi keeps its databases open, so the file is not replaced underneath it.
+    The backup API copies every page while holding an exclusive lock, other
+    connections either see the old or the complete new content.
+    """
+    source = sqlite3.connect(f'file:{snapshot_path}?mode=ro', uri=True)
+    try:
+        # Fail early on a damaged snapshot instead of overwriting a working database
+        result = source.execute("PRAGMA quick_check").fetchone()
+        if not result or result[0] != 'ok':
+            raise sqlite3.DatabaseError(f"Snapshot failed integrity check: {result[0] if result else 'no result'}")
+        target = sqlite3.connect(live_path, timeout=LOCK_TIMEOUT)
+        try:
+            source.backup(target, pages=-1)
+        finally:
+            target.close()
+    finally:
+        source.close()
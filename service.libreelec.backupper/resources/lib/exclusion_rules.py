@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+import xbmc
+
+# Regenerable data that Kodi or the add-ons recreate on their own.
+# Patterns match archive names, a trailing slash makes a rule skip a whole directory.
+# * and ? stay within one path segment, ** spans any number of them and a
+# pattern without a slash matches the name at any depth.
+DEFAULT_RULES = [
+    ('addons/packages/', "Add-on download cache"),
+    ('addons/temp/', "Add-on install temp files"),
+    ('userdata/addon_data/*/cache/', "Add-on caches"),
+    ('userdata/addon_data/*/temp/', "Add-on temp files"),
+    ('userdata/addon_data/*/tmp/', "Add-on temp files"),
+    ('userdata/Database/Textures*.db', "Thumbnail cache index"),
+    ('__pycache__/', "Compiled Python files"),
+    ('*.pyc', "Compiled Python files"),
+    ('*.pyo', "Compiled Python files"),
+    ('*.log', "Log files"),
+    ('*.tmp', "Temp files")
+]
+
+
+def _translate_segment(segment):
+    """Turn one path segment of a glob into a regular expression that never crosses a slash"""
+    regex = []
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        i += 1
+        if char == '*':
+            regex.append('[^/]*')
+        elif char == '?':
+            regex.append('[^/]')
+        elif char == '[':
+            # A ] right after [ or [! belongs to the class
+            start = i + 1 if segment[i:i + 1] == '!' else i
+            end = segment.find(']', start + 1)
+            if end < 0:
+                regex.append(re.escape(char))
+                continue
+            members = segment[i:end].replace('\\', '\\\\')
+            i = end + 1
+            if members.startswith('!'):
+                members = '^' + members[1:]
+            elif members.startswith('^'):
+                members = '\\' + members
+            regex.append(f'[{members}]')
+        else:
+            regex.append(re.escape(char))
+    return ''.join(regex)
+
+
+def translate_pattern(pattern):
+    """Turn an exclusion glob into a regular expression matching archive names"""
+    segments = pattern.rstrip('/').split('/')
+    # Like .gitignore, a bare name matches in any directory
+    regex = ['(?:[^/]+/)*'] if len(segments) == 1 else []
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == '**':
+            regex.append('.*' if last else '(?:[^/]+/)*')
+        else:
+            regex.append(_translate_segment(segment) + ('' if last else '/'))
+    if pattern.endswith('/'):
+        regex.append('/')
+    return '(?s:' + ''.join(regex) + r')\Z'
+
+
+class ExclusionRule:
+    """A single exclusion pattern and the data it kept out of the backup"""
+
+    def __init__(self, pattern, description):
+        self.pattern = pattern
+        self.description = description
+        self.is_directory = pattern.endswith('/')
+        self.files = 0
+        self.bytes = 0
+
+
+class ExclusionRules:
+    """Compiled set of exclusion rules applied while scanning
+
+    All file rules are folded into one regular expression and all directory
+    rules into another, the named group that matched identifies the rule.
+    """
+
+    def __init__(self, user_patterns='', use_defaults=True):
+        self.rules = []
+        if use_defaults:
+            for pattern, description in DEFAULT_RULES:
+                self.rules.append(ExclusionRule(pattern, description))
+        for pattern in self.parse_patterns(user_patterns):
+            self.rules.append(ExclusionRule(pattern, "User rule"))
+        self._lock = threading.Lock()  # Walkers of different backup items record concurrently
+        self._file_regex = self._compile([rule for rule in self.rules if not rule.is_directory])
+        self._dir_regex = self._compile([rule for rule in self.rules if rule.is_directory])
+
+    @staticmethod
+    def parse_patterns(text):
+        """Split the comma separated globs entered in settings"""
+        patterns = []
+        for pattern in (text or '').split(','):
+            pattern = pattern.strip().lstrip('/')
+            if pattern:
+                patterns.append(pattern)
+        return patterns
+
+    def _compile(self, rules):
+        if not rules:
+            return None
+        groups = [f'(?P<r{self.rules.index(rule)}>{translate_pattern(rule.pattern)})' for rule in rules]
+        return re.compile('|'.join(groups))
+
+    def _lookup(self, regex, name):
+        if regex is None:
+            return None
+        match = regex.match(name)
+        if match is None:
+            return None
+        return self.rules[int(match.lastgroup[1:])]
+
+    def match_file(self, arcname):
+        """Get the rule excluding a file, or None"""
+        return self._lookup(self._file_regex, arcname)
+
+    def match_directory(self, arcdir):
+        """Get the rule excluding a directory given with a trailing slash, or None"""
+        return self._lookup(self._dir_regex, arcdir)
+
+    def excludes(self, arcname):
+        """Check a path against every rule, including the directories it sits in"""
+        if self.match_file(arcname):
+            return True
+        parts = arcname.split('/')
+        for depth in range(1, len(parts)):
+            if self.match_directory('/'.join(parts[:depth]) + '/'):
+                return True
+        return False
+
+    def record(self, rule, files, size):
+        """Account data a rule kept out of the backup"""
+        with self._lock:
+            rule.files += files
+            rule.bytes += size
+
+    @property
+    def excluded_bytes(self):
+        return sum(rule.bytes for rule in self.rules)
+
+    def report(self):
+        """Rules that excluded anything, largest savings first"""
+        used = [rule for rule in self.rules if rule.files]
+        used.sort(key=lambda rule: rule.bytes, reverse=True)
+        for rule in used:
+            xbmc.log(f"Exclusion rule {rule.pattern} ({rule.description}): {rule.files} files, {rule.bytes} bytes", xbmc.LOGINFO)
+        return [{'pattern': rule.pattern, 'description': rule.description, 'files': rule.files, 'bytes': rule.bytes} for rule in used]
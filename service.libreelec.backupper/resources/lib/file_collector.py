@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import xbmc
+
+BATCH_SIZE = 256  # Files handed from a walker to the consumer at once
+QUEUE_BATCHES = 16  # Batches a walker may run ahead of the consumer per root
+
+# Archive names of backup items that are single files
+FILE_ARCNAMES = {
+    'config': 'flash/config.txt',  # Ensure config.txt goes to flash directory
+    'sources': 'userdata/sources.xml',
+    'guisettings': 'userdata/guisettings.xml',
+    'advancedsettings': 'userdata/advancedsettings.xml',
+    'keyboard': 'userdata/keyboard.xml'
+}
+
+
+def archive_prefix(item_name, path):
+    """Get the archive directory that files below a backup item directory are stored in"""
+    if item_name == 'addons':
+        prefix = os.path.relpath(path, os.path.dirname(path))
+    elif item_name == 'addon_data':
+        prefix = f"userdata/{os.path.relpath(path, os.path.dirname(path))}"
+    elif item_name == 'keymaps':
+        prefix = "userdata/keymaps"
+    elif item_name == 'databases':
+        prefix = "userdata/Database"
+    elif item_name.startswith('repo_'):
+        prefix = f"repo/{os.path.relpath(path, os.path.dirname(path))}"
+    else:
+        prefix = item_name
+    return prefix + '/'
+
+
+class FileCollector:
+    """Walk backup items with scandir and yield (path, arcname, size, stat) as files are found
+
+    Every top-level item is walked on its own thread, results are yielded in
+    item order. Each file costs a single lstat, directory entry types come
+    from scandir. Symbolic links and special files are skipped.
+    """
+
+    def __init__(self, paths, include=None, workers=4, inode_order=True, exclusions=None):
+        self.paths = paths
+        self.include = include  # Optional callable(arcname, stat) deciding if a file is backed up
+        self.exclusions = exclusions  # Optional ExclusionRules applied while walking
+        self.workers = max(1, min(workers, len(paths)))
+        self.inode_order = inode_order
+        self.total_size = 0  # Size of the files yielded so far
+        self.file_count = 0
+        self.finished = False  # Set once every item has been walked
+        self._stop = threading.Event()
+
+    def _put(self, results, item):
+        while not self._stop.is_set():
+            try:
+                results.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _walk_file(self, item_name, path, results):
+        """Collect a backup item that is a single file"""
+        try:
+            file_stat = os.lstat(path)
+        except OSError as e:
+            xbmc.log(f"Error getting size for {path}: {str(e)}", xbmc.LOGWARNING)
+            return
+        arcname = FILE_ARCNAMES.get(item_name, item_name)
+        rule = self.exclusions.match_file(arcname) if self.exclusions else None
+        if rule is not None:
+            self.exclusions.record(rule, 1, file_stat.st_size)
+            return
+        self._put(results, [(path, arcname, file_stat.st_size, file_stat)])
+
+    def _measure(self, path):
+        """Count the files and bytes below an excluded directory"""
+        files = 0
+        size = 0
+        stack = [path]
+        while stack and not self._stop.is_set():
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_symlink():
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            files += 1
+                            size += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+        return files, size
+
+    def _exclude_directory(self, path, arcdir):
+        """Check a directory against the exclusion rules, accounting it if excluded"""
+        rule = self.exclusions.match_directory(arcdir) if self.exclusions else None
+        if rule is None:
+            return False
+        files, size = self._measure(path)
+        self.exclusions.record(rule, files, size)
+        return True
+
+    def _walk_directory(self, item_name, path, results):
+        """Collect the files below a backup item directory, depth first"""
+        batch = []
+        prefix = archive_prefix(item_name, path)
+        if self._exclude_directory(path, prefix):
+            return
+        stack = [(path, prefix)]
+        while stack and not self._stop.is_set():
+            directory, prefix = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError as e:
+                xbmc.log(f"Error scanning {directory}: {str(e)}", xbmc.LOGWARNING)
+                continue
+
+            files = []
+            subdirs = []
+            for entry in entries:
+                # Entry types come from the directory listing, no extra syscall
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry)
+
+            if self.inode_order:
+                # Reading in inode order keeps the head close to the data on slow storage
+                files.sort(key=lambda entry: entry.inode())
+                subdirs.sort(key=lambda entry: entry.inode())
+
+            for entry in files:
+                try:
+                    file_stat = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    xbmc.log(f"Error getting size for {entry.path}: {str(e)}", xbmc.LOGWARNING)
+                    continue
+                arcname = prefix + entry.name
+                rule = self.exclusions.match_file(arcname) if self.exclusions else None
+                if rule is not None:
+                    self.exclusions.record(rule, 1, file_stat.st_size)
+                    continue
+                batch.append((entry.path, arcname, file_stat.st_size, file_stat))
+                if len(batch) >= BATCH_SIZE:
+                    if not self._put(results, batch):
+                        return
+                    batch = []
+
+            # Reversed so subdirectories are visited in listing order
+            for entry in reversed(subdirs):
+                arcdir = prefix + entry.name + '/'
+                if not self._exclude_directory(entry.path, arcdir):
+                    stack.append((entry.path, arcdir))
+
+        if batch:
+            self._put(results, batch)
+
+    def _walk(self, item_name, path, results):
+        """Walk one backup item, always ending with the None sentinel"""
+        try:
+            xbmc.log(f"Processing backup item: {item_name} at path: {path}", xbmc.LOGINFO)
+            if not os.path.exists(path):
+                xbmc.log(f"Path does not exist: {path}", xbmc.LOGWARNING)
+            elif os.path.isfile(path):
+                if not os.path.islink(path):  # Skip symbolic links
+                    self._walk_file(item_name, path, results)
+            else:
+                self._walk_directory(item_name, path, results)
+        except Exception as e:
+            xbmc.log(f"Error collecting files for {item_name}: {str(e)}", xbmc.LOGERROR)
+        finally:
+            self._put(results, None)
+
+    def __iter__(self):
+        items = list(self.paths.items())
+        queues = [queue.Queue(maxsize=QUEUE_BATCHES) for _ in items]
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backupper-scan')
+        try:
+            # Items are submitted in order, so the one being consumed is always running
+            for (item_name, path), results in zip(items, queues):
+                executor.submit(self._walk, item_name, path, results)
+
+            for results in queues:
+                while True:
+                    batch = results.get()
+                    if batch is None:
+                        break
+                    for entry in batch:
+                        if self.include is not None and not self.include(entry[1], entry[3]):
+                            continue
+                        self.total_size += entry[2]
+                        self.file_count += 1
+                        yield entry
+            self.finished = True
+            xbmc.log(f"Total files to backup: {self.file_count}", xbmc.LOGINFO)
+        finally:
+            # Release walkers blocked on a full queue if the consumer stopped early
+            self._stop.set()
+            executor.shutdown(wait=True)
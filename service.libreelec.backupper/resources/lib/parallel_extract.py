@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs queued per worker, members are streamed to disk so this bounds memory as well
+JOBS_PER_WORKER = 4
+
+
+def directories_to_create(paths, top):
+    """Get the directories holding the given files, parents first, each one once
+
+    top(path) gives the highest directory the restore may create for a
+    file, the directories above it are never touched.
+    """
+    directories = set()
+    for path in paths:
+        limit = top(path)
+        directory = os.path.dirname(path)
+        # Parents of a known directory are known as well
+        while directory not in directories and (directory == limit or directory.startswith(limit.rstrip(os.sep) + os.sep)):
+            directories.add(directory)
+            directory = os.path.dirname(directory)
+    return sorted(directories, key=lambda directory: directory.count(os.sep))
+
+
+class ParallelExtractor:
+    """Extract archive members on a worker pool, every worker reading through its own archive handle
+
+    open_archive() opens another handle on the same archive, so workers
+    never share a file position. zlib releases the GIL while inflating,
+    threads are enough to use every core.
+    """
+
+    def __init__(self, open_archive, workers):
+        self.open_archive = open_archive
+        self.workers = workers
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def _archive(self):
+        archive = getattr(self._local, 'archive', None)
+        if archive is None:
+            archive = self._local.archive = self.open_archive()
+            with self._lock:
+                self._handles.append(archive)
+        return archive
+
+    def _run(self, extract, member, path):
+        return extract(self._archive(), member, path)
+
+    def extract(self, jobs, extract):
+        """Run extract(archive, member, path) for (member, path) jobs, yielding (member, path, error) in input order
+
+        A consumer that stops iterating after a failure leaves no further
+        jobs started, the ones already running are finished.
+        """
+        pending = deque()
+        jobs = iter(jobs)
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backupper-extract') as executor:
+            try:
+                while True:
+                    while not exhausted and len(pending) < self.workers * JOBS_PER_WORKER:
+                        job = next(jobs, None)
+                        if job is None:
+                            exhausted = True
+                            break
+                        member, path = job
+                        pending.append((member, path, executor.submit(self._run, extract, member, path)))
+                    if not pending:
+                        return
+
+                    member, path, future = pending.popleft()
+                    try:
+                        future.result()
+                        yield member, path, None
+                    except Exception as e:
+                        yield member, path, e
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+
+    def close(self):
+        for archive in self._handles:
+            archive.close()
+        self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import queue
+import threading
+import xbmc
+
+REPORT_INTERVAL = 0.5  # Seconds between progress reports
+
+
+def format_rate(bytes_per_second):
+    return f"{bytes_per_second / (1024 * 1024):.1f} MB/s"
+
+
+class UploadStreamStats:
+    """Bytes, files and busy time of one upload stream"""
+
+    def __init__(self, number):
+        self.number = number
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        return self.bytes / self.seconds if self.seconds else 0
+
+    def describe(self):
+        return f"Stream {self.number}: {self.files} files, {self.bytes / (1024 * 1024):.1f} MB at {format_rate(self.rate)}"
+
+
+class ParallelUploader:
+    """Upload files over several connections at once, one worker thread per connection
+
+    open_stream() returns an object with upload_file(local_path, remote_name,
+    publish, sha256) and disconnect_remote(), and a writable _upload_progress_callback
+    attribute through which the stream reports its bytes. Files are handed out
+    from a shared queue, so a slow stream simply takes fewer of them.
+
+    Files can be queued all at once with run(), or one by one with put()
+    while they are still being produced. put() blocks while every stream is
+    busy, so no more than one file per stream waits in the staging area.
+    With remove_uploaded published files are deleted as soon as they are stored.
+    """
+
+    def __init__(self, streams, open_stream, report=None, remove_uploaded=False):
+        self.streams = streams
+        self.open_stream = open_stream
+        self.report = report  # Optional callable(percent, detail) for progress
+        self.remove_uploaded = remove_uploaded
+        self.stats = []
+        self.failed = []
+        self._lock = threading.Lock()
+        self._sent = {}  # remote name -> bytes sent
+        self._total = 0
+        self._started = 0
+        self._last_report = 0
+        self.elapsed = 0
+        self._jobs = queue.Queue()
+        self._slots = threading.Semaphore(streams)
+        self._workers = []
+
+    def _progress(self, remote_name, sent):
+        with self._lock:
+            self._sent[remote_name] = sent
+            now = time.monotonic()
+            if self.report is None or now - self._last_report < REPORT_INTERVAL:
+                return
+            self._last_report = now
+            done = sum(self._sent.values())
+            rate = done / (now - self._started) if now > self._started else 0
+            percent = min(int(done * 100 / self._total), 100) if self._total else 100
+            self.report(percent, f"{done // (1024 * 1024)} / {self._total // (1024 * 1024)} MB, "
+                                 f"{format_rate(rate)} over {len(self.stats)} streams")
+
+    def _worker(self, stats):
+        stream = self.open_stream()
+        if stream is None:
+            xbmc.log(f"Upload stream {stats.number} could not connect", xbmc.LOGWARNING)
+            return
+        with self._lock:
+            self.stats.append(stats)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+                local_path, remote_name, publish, sha256 = job
+                size = os.path.getsize(local_path)
+                stream._upload_progress_callback = lambda sent, total, name=remote_name: self._progress(name, sent)
+                started = time.monotonic()
+                try:
+                    ok = stream.upload_file(local_path, remote_name, publish=publish, sha256=sha256)
+                    if ok and publish and self.remove_uploaded:
+                        os.remove(local_path)
+                finally:
+                    self._slots.release()
+                with self._lock:
+                    stats.seconds += time.monotonic() - started
+                    if ok:
+                        stats.files += 1
+                        stats.bytes += size
+                        self._sent[remote_name] = size
+                    else:
+                        self.failed.append(local_path)
+        finally:
+            stream.disconnect_remote()
+
+    def start(self):
+        self._started = time.monotonic()
+        self._workers = [threading.Thread(target=self._worker, args=(UploadStreamStats(number + 1),), daemon=True)
+                         for number in range(self.streams)]
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, local_path, remote_name, publish=True, sha256=None):
+        """Queue a file, waiting for a free stream, sha256 is passed on when it is already known"""
+        with self._lock:
+            self._total += os.path.getsize(local_path)
+        while not self._slots.acquire(timeout=1):
+            if not any(worker.is_alive() for worker in self._workers):
+                break  # No stream left, finish() reports the file as failed
+        self._jobs.put((local_path, remote_name, publish, sha256))
+
+    def finish(self):
+        """Wait for the queued files, returns the local paths that failed"""
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join()
+
+        # Files left when no stream could connect
+        while not self._jobs.empty():
+            job = self._jobs.get_nowait()
+            if job is not None:
+                self.failed.append(job[0])
+
+        self.elapsed = time.monotonic() - self._started
+        for stats in sorted(self.stats, key=lambda stats: stats.number):
+            xbmc.log(f"Parallel upload: {stats.describe()}", xbmc.LOGINFO)
+        xbmc.log(f"Parallel upload: {self._total // (1024 * 1024)} MB in {self.elapsed:.1f} s, {self.summary()}", xbmc.LOGINFO)
+        return self.failed
+
+    def run(self, files):
+        """Upload [(local_path, remote_name, publish[, sha256])], returns the local paths that failed"""
+        self.streams = min(self.streams, len(files))
+        self._slots = threading.Semaphore(self.streams)
+        self.start()
+        for file in files:
+            self.put(*file)
+        return self.finish()
+
+    def summary(self):
+        rate = format_rate(self._total / self.elapsed) if self.elapsed > 0 else "-"
+        return f"{rate} over {len(self.stats)} streams"
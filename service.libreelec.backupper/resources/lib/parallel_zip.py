@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import zlib
+import hashlib
+import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import xbmc
+from .compression_policy import data_samples, read_samples
+
+# Files above this size are streamed by the writer instead of being compressed in memory
+LARGE_FILE_THRESHOLD = 16 * 1024 * 1024
+# Upper bound for uncompressed data held by queued compression jobs
+MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+
+
+class ContentClaims:
+    """Decide which of several files with identical content gets compressed
+
+    The copy that comes first in archive order owns the content, later copies
+    skip compression and are stored as references to it.
+    """
+
+    def __init__(self):
+        self._owners = {}  # sha256 digest -> sequence number of the owning file
+        self._lock = threading.Lock()
+
+    def claim(self, digest, sequence):
+        """Check whether the file with this sequence number has to compress its content"""
+        with self._lock:
+            owner = self._owners.get(digest)
+            if owner is None or owner > sequence:
+                self._owners[digest] = sequence
+                return True
+            return owner == sequence
+
+
+def compress_member(file_path, compression_method, compresslevel, policy=None, claims=None, sequence=0):
+    """Read a file and compress it into a raw zip member body
+
+    Returns (size, crc, body, method, level, digest). The body is None when
+    claims is given and an earlier file already holds the same content.
+    """
+    with open(file_path, 'rb') as source:
+        data = source.read()
+    digest = None
+    if claims is not None and data:
+        digest = hashlib.sha256(data).digest()
+        if not claims.claim(digest, sequence):
+            return len(data), None, None, compression_method, compresslevel, digest
+    crc = zlib.crc32(data)
+    if policy is not None:
+        # The decision costs no extra read, the sample is the data already in memory
+        compression_method, compresslevel = policy.choose(file_path, data_samples(data))
+    if compression_method == zipfile.ZIP_DEFLATED:
+        # Same raw deflate stream zipfile itself produces, zlib releases the GIL while compressing
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        body = compressor.compress(data) + compressor.flush()
+    else:
+        body = data
+    return len(data), crc, body, compression_method, compresslevel, digest
+
+
+class RawMemberWriter:
+    """Append members that are already compressed to a zipfile.ZipFile
+
+    zipfile has no public call for this, the member is written through the
+    ZipFile's private state under its lock. That is only done when the
+    ZipFile has every attribute it relies on and a member written this way
+    once read back cleanly with testzip(). Otherwise members go through
+    ZipFile.open() and are compressed a second time.
+    """
+
+    ATTRIBUTES = ('fp', 'filelist', 'NameToInfo', 'start_dir', '_seekable', '_writecheck', '_didModify', '_lock', '_writing')
+    _round_trip = None  # Result of the testzip() check, run once per process
+
+    def __init__(self, zipf):
+        self.zipf = zipf
+        self.direct = all(hasattr(zipf, name) for name in self.ATTRIBUTES) and self.round_trip()
+
+    @classmethod
+    def round_trip(cls):
+        """Check once that a member written through the private state reads back"""
+        if cls._round_trip is None:
+            data = b'LibreELEC backupper ' * 64
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            body = compressor.compress(data) + compressor.flush()
+            buffer = io.BytesIO()
+            try:
+                with zipfile.ZipFile(buffer, 'w') as zipf:
+                    zinfo = zipfile.ZipInfo('check')
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    zinfo.file_size = len(data)
+                    zinfo.compress_size = len(body)
+                    zinfo.CRC = zlib.crc32(data)
+                    cls._write_direct(zipf, zinfo, body)
+                with zipfile.ZipFile(buffer, 'r') as zipf:
+                    cls._round_trip = zipf.testzip() is None and zipf.read('check') == data
+            except Exception as e:
+                xbmc.log(f"Writing compressed zip members directly failed: {str(e)}", xbmc.LOGWARNING)
+                cls._round_trip = False
+            if not cls._round_trip:
+                xbmc.log("Zip members will be compressed by zipfile itself", xbmc.LOGWARNING)
+        return cls._round_trip
+
+    @staticmethod
+    def _write_direct(zipf, zinfo, body):
+        zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT or len(body) > zipfile.ZIP64_LIMIT
+        with zipf._lock:
+            if zipf._writing:
+                raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+            if zipf._seekable:
+                zipf.fp.seek(zipf.start_dir)
+            zinfo.header_offset = zipf.fp.tell()
+            zipf._writecheck(zinfo)
+            zipf._didModify = True
+            zipf.fp.write(zinfo.FileHeader(zip64))
+            zipf.fp.write(body)
+            zipf.start_dir = zipf.fp.tell()
+            zipf.filelist.append(zinfo)
+            zipf.NameToInfo[zinfo.filename] = zinfo
+
+    def write(self, zinfo, body):
+        """Append a member whose compressed body, CRC and sizes are set on zinfo"""
+        if self.direct:
+            self._write_direct(self.zipf, zinfo, body)
+            return
+        data = zlib.decompress(body, -15) if zinfo.compress_type == zipfile.ZIP_DEFLATED else body
+        with self.zipf.open(zinfo, mode='w') as dest:
+            dest.write(data)
+
+
+class ParallelZipWriter:
+    """Compress zip members on a worker pool and write them to the archive in order"""
+
+    def __init__(self, zipf, compression_method, compresslevel, workers=None, policy=None, deduplicate=False, restore_path=None):
+        self.zipf = zipf
+        self.compression_method = compression_method
+        self.compresslevel = compresslevel
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = policy  # Optional CompressionPolicy choosing the method per file
+        self.bytes_written = 0
+        self.choices = {}  # arcname -> label, for files not using the configured method and level
+        self.summary = {}  # label -> [files, original bytes, stored bytes]
+        self.deduplicate = deduplicate
+        self.duplicates = {}  # arcname -> arcname of the member holding the same content
+        self.restore_path = restore_path or (lambda arcname: arcname)  # Where a member lands on restore
+        self._stored = {}  # sha256 digest -> arcname of a member written to the archive
+        self._streamed_sizes = set()  # Sizes of large members, only these are worth pre-hashing
+        self._claims = ContentClaims() if deduplicate else None
+        self._raw = RawMemberWriter(zipf)
+
+    def _record_choice(self, arcname, method, level, file_size, compress_size):
+        """Keep track of the method used for a member"""
+        label = self.policy.label(method, level) if self.policy else str(method)
+        if (method, level) != (self.compression_method, self.compresslevel):
+            self.choices[arcname] = label
+        totals = self.summary.setdefault(label, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += file_size
+        totals[2] += compress_size
+
+    def write_raw(self, arcname, file_size, crc, body, compression_method=None, compresslevel=None):
+        """Append an already compressed member to the archive"""
+        zinfo = zipfile.ZipInfo(arcname)
+        zinfo.compress_type = self.compression_method if compression_method is None else compression_method
+        zinfo._compresslevel = self.compresslevel if compresslevel is None else compresslevel
+        zinfo.file_size = file_size
+        zinfo.compress_size = len(body)
+        zinfo.CRC = crc
+        zinfo.flag_bits = 0x00  # Sizes are known up front, no data descriptor needed
+        zinfo.external_attr = 0o600 << 16  # Same permissions zipfile uses for streamed members
+        self._raw.write(zinfo, body)
+        self.bytes_written += file_size
+        return zinfo
+
+    def _add_duplicate(self, arcname, digest):
+        """Store a file as a reference to a member with the same content, if there is one"""
+        stored = self._stored.get(digest)
+        # Two names restoring to one file are both kept, the restore would copy the file onto itself
+        if stored is None or self.restore_path(stored) == self.restore_path(arcname):
+            return False
+        self.duplicates[arcname] = stored
+        return True
+
+    def _hash_file(self, file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.digest()
+
+    def write_stream(self, file_path, arcname, file_size):
+        """Stream a large file into the archive on the writer thread"""
+        if self.deduplicate:
+            # Large files are only read twice when a member of the same size exists
+            if file_size in self._streamed_sizes and self._add_duplicate(arcname, self._hash_file(file_path)):
+                return None
+            self._streamed_sizes.add(file_size)
+        digest = hashlib.sha256() if self.deduplicate else None
+        zinfo = zipfile.ZipInfo(arcname)
+        zinfo.file_size = file_size
+        buffer_size = 1024 * 1024  # 1MB buffer
+        with open(file_path, 'rb') as source:
+            chunk = source.read(buffer_size)
+            method, level = self.compression_method, self.compresslevel
+            if self.policy is not None:
+                method, level = self.policy.choose(file_path, read_samples(source, file_size))
+            zinfo.compress_type = method
+            zinfo._compresslevel = level
+            with self.zipf.open(zinfo, mode='w') as dest:
+                while chunk:
+                    dest.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    chunk = source.read(buffer_size)
+        if digest is not None and zinfo.file_size:
+            self._stored.setdefault(digest.digest(), arcname)
+        self.bytes_written += file_size
+        self._record_choice(arcname, method, level, file_size, zinfo.compress_size)
+        return zinfo
+
+    def write_files(self, files):
+        """Write (file_path, arcname, file_size, ...) entries, yielding (entry, error) in input order"""
+        pending = deque()
+        inflight_bytes = 0
+        files = iter(files)
+        exhausted = False
+        sequence = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backupper-zip') as executor:
+            while True:
+                # Keep the pool busy while bounding the memory held by queued jobs
+                while not exhausted and len(pending) < self.workers * 4 and inflight_bytes < MAX_INFLIGHT_BYTES:
+                    entry = next(files, None)
+                    if entry is None:
+                        exhausted = True
+                        break
+                    file_path, arcname, file_size = entry[:3]
+                    if file_size > LARGE_FILE_THRESHOLD:
+                        pending.append((entry, None))
+                    else:
+                        future = executor.submit(compress_member, file_path, self.compression_method, self.compresslevel,
+                                                 self.policy, self._claims, sequence)
+                        pending.append((entry, future))
+                        sequence += 1
+                        inflight_bytes += file_size
+
+                if not pending:
+                    break
+
+                # The single writer drains results in submission order
+                entry, future = pending.popleft()
+                file_path, arcname, file_size = entry[:3]
+                try:
+                    if future is None:
+                        self.write_stream(file_path, arcname, file_size)
+                    else:
+                        inflight_bytes -= file_size
+                        data_size, crc, body, method, level, digest = future.result()
+                        if digest is not None and self._add_duplicate(arcname, digest):
+                            yield entry, None
+                            continue
+                        if body is None:
+                            # The copy that owned this content failed, compress this one after all
+                            data_size, crc, body, method, level, digest = compress_member(
+                                file_path, self.compression_method, self.compresslevel, self.policy, ContentClaims())
+                        zinfo = self.write_raw(arcname, data_size, crc, body, method, level)
+                        self._record_choice(arcname, method, level, data_size, zinfo.compress_size)
+                        if digest is not None:
+                            self._stored.setdefault(digest, arcname)
+                    yield entry, None
+                except Exception as e:
+                    xbmc.log(f"Error backing up file {file_path}: {str(e)}", xbmc.LOGERROR)
+                    yield entry, e
@@ -14,6 +14,7 @@ from urllib.parse import urlparse, unquote
 import json
 import time
 import subprocess
+from .archive_backends import ARCHIVE_EXTENSIONS
 
 try:
     import paramiko
@@ -181,7 +182,7 @@ class RemoteBrowser:
         
         # Use Kodi's built-in file browser with appropriate mode
         browse_type = 0 if mode == 'backup' else 1  # 0 for folders, 1 for files
-        file_mask = '|.zip' if mode == 'restore' else ''
+        file_mask = '|.zip|.gz|.xz' if mode == 'restore' else ''
         selected_path = dialog.browse(browse_type, heading, 'files', file_mask, False, False, start_path)
         
         if not selected_path or selected_path == start_path:
@@ -189,8 +190,8 @@ class RemoteBrowser:
             return None
         
         # For restore mode, verify the selected file is a backup file
-        if mode == 'restore' and not selected_path.lower().endswith('.zip'):
-            dialog.ok("Invalid Selection", "Please select a backup file (.zip)")
+        if mode == 'restore' and not selected_path.lower().endswith(ARCHIVE_EXTENSIONS):
+            dialog.ok("Invalid Selection", "Please select a backup file (.zip, .tar.gz or .tar.xz)")
             return None
         
         # Process the selected path based on protocol
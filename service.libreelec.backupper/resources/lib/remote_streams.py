@@ -0,0 +1,387 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import io
+import time
+import queue
+import bisect
+import itertools
+import threading
+from collections import OrderedDict
+import xbmc
+
+STREAM_BLOCK_SIZE = 1024 * 1024  # Writes are coalesced into blocks of this size
+STREAM_QUEUE_BLOCKS = 8  # Blocks buffered between the archive writer and the transport
+RANGE_BLOCK_SIZE = 64 * 1024  # Smallest range read, a zip central directory usually fits in one
+RANGE_MAX_READAHEAD = 8 * 1024 * 1024  # Largest range read once a member is read front to back
+RANGE_CACHE_SIZE = 32 * 1024 * 1024  # Bytes of fetched blocks kept for later reads
+
+
+class FileStreamWriter(io.RawIOBase):
+    """Writable sink over an open remote file handle (SFTP, NFS or xbmcvfs)"""
+
+    def __init__(self, fileobj, seekable=True):
+        self._file = fileobj
+        self._seekable = seekable
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return self._seekable
+
+    def write(self, b):
+        data = bytes(b)
+        result = self._file.write(data)
+        if result is False:  # xbmcvfs.File reports failures through its return value
+            raise IOError("Write to remote file failed")
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        if self._seekable:
+            return self._file.tell()
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if not self._seekable:
+            raise io.UnsupportedOperation("Remote stream is not seekable")
+        return self._file.seek(offset, whence)
+
+    @property
+    def bytes_written(self):
+        # The archive writer leaves the position at the end of the data
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self._seekable:
+                    self._position = self._file.tell()
+                self._file.close()
+            finally:
+                super().close()
+
+    def abort(self):
+        """Close the handle after a failure, ignoring errors"""
+        try:
+            self.close()
+        except Exception as e:
+            xbmc.log(f"Error closing aborted remote stream: {str(e)}", xbmc.LOGWARNING)
+
+
+class _QueueReader(io.RawIOBase):
+    """File-like view of the queued blocks for transports that pull data (FTP storbinary)"""
+
+    def __init__(self, blocks):
+        self._blocks = blocks
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            block = next(self._blocks, None)
+            if block is None:
+                return 0
+            self._buffer = block
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class QueueStreamWriter(io.RawIOBase):
+    """Non-seekable sink that feeds a transport running on its own thread
+
+    The consumer is called with an iterator of byte blocks and must return
+    once the upload is complete, raising on failure.
+    """
+
+    def __init__(self, name, consumer):
+        self.name = name
+        self._consumer = consumer
+        self._queue = queue.Queue(maxsize=STREAM_QUEUE_BLOCKS)
+        self._buffer = bytearray()
+        self._position = 0
+        self._error = None
+        self._aborted = False
+        self._thread = threading.Thread(target=self._run, name=f'backupper-upload-{name}', daemon=True)
+        self._thread.start()
+
+    def _blocks(self):
+        while True:
+            block = self._queue.get()
+            if self._aborted:
+                raise IOError("Upload aborted")
+            if block is None:
+                return
+            yield block
+
+    def _run(self):
+        try:
+            self._consumer(self._blocks())
+        except Exception as e:
+            self._error = e
+            xbmc.log(f"Streaming upload of {self.name} failed: {str(e)}", xbmc.LOGERROR)
+            # Drain so the writer never blocks on a dead consumer
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _put(self, block):
+        while True:
+            if self._error is not None:
+                raise IOError(f"Streaming upload failed: {str(self._error)}")
+            try:
+                self._queue.put(block, timeout=1)
+                return
+            except queue.Full:
+                if not self._thread.is_alive():
+                    raise IOError("Streaming upload stopped unexpectedly")
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        raise io.UnsupportedOperation("Remote stream is not seekable")
+
+    def tell(self):
+        return self._position
+
+    def write(self, b):
+        self._buffer += b
+        self._position += len(b)
+        if len(self._buffer) >= STREAM_BLOCK_SIZE:
+            self._put(bytes(self._buffer))
+            self._buffer = bytearray()
+        return len(b)
+
+    @property
+    def bytes_written(self):
+        return self._position
+
+    def close(self):
+        """Flush the remaining data and wait for the transport to confirm the upload"""
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._put(bytes(self._buffer))
+                self._buffer = bytearray()
+            self._put(None)
+            self._thread.join()
+            if self._error is not None:
+                raise IOError(f"Streaming upload failed: {str(self._error)}")
+        finally:
+            super().close()
+
+    def abort(self):
+        """Stop the transport after a failure"""
+        self._aborted = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=30)
+        super().close()
+
+
+def reader_for(blocks):
+    """Wrap a block iterator in a buffered readable file object"""
+    return io.BufferedReader(_QueueReader(blocks), buffer_size=STREAM_BLOCK_SIZE)
+
+
+class RangeReader(io.RawIOBase):
+    """Seekable read-only view of a remote file fetched block by block with range reads
+
+    parts lists (name, size) of the remote files that make up the archive,
+    one file or the volumes of a split archive, read_range(name, offset,
+    length) returns bytes from one of them. Fetched blocks are kept in an
+    LRU cache. A read right after the previous fetch counts as sequential
+    and doubles the read-ahead, so opening a zip costs a few small range
+    reads and extracting a member runs in large ones.
+    """
+
+    def __init__(self, parts, read_range, block_size=RANGE_BLOCK_SIZE,
+                 max_readahead=RANGE_MAX_READAHEAD, cache_size=RANGE_CACHE_SIZE):
+        self.parts = parts
+        self.read_range = read_range
+        self.block_size = block_size
+        self.max_readahead = max_readahead
+        self.size = sum(size for _, size in parts)
+        self.bytes_fetched = 0
+        self.requests = 0
+        self._starts = list(itertools.accumulate([0] + [size for _, size in parts[:-1]]))
+        self._cache = OrderedDict()  # block index -> bytes
+        self._cache_blocks = max(cache_size // block_size, 1)
+        self._next_block = None  # First block after the last fetch
+        self._readahead = block_size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        filled = 0
+        while filled < len(view) and self._position < self.size:
+            index, offset = divmod(self._position, self.block_size)
+            block = self._block(index)
+            count = min(len(view) - filled, len(block) - offset)
+            view[filled:filled + count] = block[offset:offset + count]
+            filled += count
+            self._position += count
+        return filled
+
+    def _block(self, index):
+        block = self._cache.get(index)
+        if block is not None:
+            self._cache.move_to_end(index)
+            return block
+
+        if index == self._next_block:
+            self._readahead = min(self._readahead * 2, self.max_readahead)
+        else:
+            self._readahead = self.block_size
+        start = index * self.block_size
+        length = min(self._readahead, self.size - start)
+        # Blocks still cached end the fetch early
+        count = -(-length // self.block_size)
+        for ahead in range(1, count):
+            if index + ahead in self._cache:
+                count = ahead
+                break
+        data = self._fetch(start, min(count * self.block_size, self.size - start))
+        for ahead in range(count):
+            self._cache[index + ahead] = data[ahead * self.block_size:(ahead + 1) * self.block_size]
+        while len(self._cache) > self._cache_blocks:
+            self._cache.popitem(last=False)
+        self._next_block = index + count
+        return self._cache[index]
+
+    def _fetch(self, offset, length):
+        """Read a range that may span several parts"""
+        chunks = []
+        end = offset + length
+        part = bisect.bisect_right(self._starts, offset) - 1
+        while offset < end:
+            name, size = self.parts[part]
+            part_offset = offset - self._starts[part]
+            count = min(end - offset, size - part_offset)
+            data = self.read_range(name, part_offset, count)
+            if data is None or len(data) != count:
+                raise IOError(f"Range read of {name} at {part_offset} returned "
+                              f"{'nothing' if data is None else len(data)} of {count} bytes")
+            chunks.append(data)
+            self.requests += 1
+            self.bytes_fetched += count
+            offset += count
+            part += 1
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+
+class PrefetchReader(io.RawIOBase):
+    """Non-seekable reader over remote files downloaded front to back on a background thread
+
+    open_blocks(name) returns a generator of byte blocks of one remote file.
+    The names are read one after the other, so the volumes of a split
+    archive read as one stream. Up to STREAM_QUEUE_BLOCKS blocks are fetched
+    ahead while the consumer is busy, so the download and the work on the
+    data already received overlap.
+    """
+
+    def __init__(self, names, open_blocks, queue_blocks=STREAM_QUEUE_BLOCKS):
+        self.names = names
+        self.bytes_read = 0
+        self._open_blocks = open_blocks
+        self._queue = queue.Queue(maxsize=queue_blocks)
+        self._buffer = b''
+        self._error = None
+        self._done = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=f'backupper-download-{names[0]}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for name in self.names:
+                blocks = self._open_blocks(name)
+                try:
+                    for block in blocks:
+                        if not self._put(block):
+                            return
+                finally:
+                    blocks.close()
+        except Exception as e:
+            self._error = e
+            xbmc.log(f"Streaming download of {self.names[0]} failed: {str(e)}", xbmc.LOGERROR)
+        finally:
+            self._put(None)
+
+    def _put(self, block):
+        """Queue a block, False once the reader has been closed"""
+        while not self._stopped:
+            try:
+                self._queue.put(block, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            if self._done:
+                return 0
+            block = self._queue.get()
+            if block is None:
+                self._done = True
+                if self._error is not None:
+                    raise IOError(f"Streaming download failed: {str(self._error)}")
+                return 0
+            self._buffer = block
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        self.bytes_read += n
+        return n
+
+    def close(self):
+        """Stop the download, blocks not read yet are dropped"""
+        if self.closed:
+            return
+        self._stopped = True
+        # Drain so a download blocked on a full queue notices the stop, a stalled transport is left behind
+        deadline = time.monotonic() + 30
+        while self._thread.is_alive() and time.monotonic() < deadline:
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        super().close()
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import re
+import subprocess
+import xbmc
+
+MOUNTINFO_PATH = '/proc/self/mountinfo'
+
+
+def _unescape(field):
+    """Decode the octal escapes mountinfo uses for spaces, tabs and backslashes in paths"""
+    return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), field)
+
+
+def read_mountinfo(path=MOUNTINFO_PATH):
+    """Get {mount point: read_only} of every mount, the last mount of a point wins as it hides the others"""
+    mounts = {}
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 6:
+                continue
+            read_only = 'ro' in fields[5].split(',')
+            # Superblock options follow the ' - ' separator, the filesystem type and the source
+            if '-' in fields[6:]:
+                superblock = fields[fields.index('-', 6) + 3:]
+                read_only = read_only or (bool(superblock) and 'ro' in superblock[0].split(','))
+            mounts[_unescape(fields[4])] = read_only
+    return mounts
+
+
+def mount_point_of(path, mounts):
+    """Get the mount point of the filesystem holding path, the deepest one containing it"""
+    best = '/'
+    for mount_point in mounts:
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best):
+            best = mount_point
+    return best
+
+
+class MountSession:
+    """Read-write window over the filesystems a restore writes to
+
+    The mount table is read from /proc/self/mountinfo once when the first
+    user begins the session. A read-only filesystem is remounted read-write
+    the first time a file on it is written and stays writable until the
+    last user ends the session, which puts back exactly the filesystems
+    that were remounted. Filesystems that were writable before are never
+    touched.
+    """
+
+    def __init__(self, mountinfo=MOUNTINFO_PATH):
+        self.mountinfo = mountinfo
+        self._depth = 0
+        self._mounts = {}  # Mount point -> read only
+        self._remounted = []  # Mount points made writable by this session, in order
+
+    def begin(self):
+        """Enter the session, False when the mount table cannot be read and the session was not entered
+
+        Without the table every path would seem to lie on the root
+        filesystem, so nothing may be written.
+        """
+        if not self._depth:
+            try:
+                mounts = read_mountinfo(self.mountinfo)
+            except OSError as e:
+                xbmc.log(f"Cannot read the mount table: {str(e)}", xbmc.LOGERROR)
+                return False
+            if not mounts:
+                xbmc.log(f"Mount table {self.mountinfo} lists no mounts", xbmc.LOGERROR)
+                return False
+            self._mounts = mounts
+            self._remounted = []
+        self._depth += 1
+        return True
+
+    def end(self):
+        """Leave the session, the last user puts the remounted filesystems back to read-only"""
+        self._depth = max(self._depth - 1, 0)
+        if self._depth:
+            return True
+        success = True
+        for mount_point in reversed(self._remounted):
+            try:
+                subprocess.run(['mount', '-o', 'remount,ro', mount_point], check=True)
+                xbmc.log(f"Remounted {mount_point} as read-only", xbmc.LOGINFO)
+            except (OSError, subprocess.CalledProcessError) as e:
+                xbmc.log(f"Error remounting {mount_point} as read-only: {str(e)}", xbmc.LOGERROR)
+                success = False
+        self._remounted = []
+        return success
+
+    def mount_point(self, path):
+        """Get the mount point of the filesystem holding path, from the table read when the session began"""
+        return mount_point_of(path, self._mounts)
+
+    def writable(self, path):
+        """Make sure the filesystem holding path can be written, remounting it once if needed"""
+        if not self._depth:
+            raise RuntimeError("Mount session not started")
+        mount_point = mount_point_of(path, self._mounts)
+        if not self._mounts.get(mount_point):
+            return True
+        try:
+            subprocess.run(['mount', '-o', 'remount,rw', mount_point], check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            xbmc.log(f"Error remounting {mount_point} as read-write: {str(e)}", xbmc.LOGERROR)
+            return False
+        xbmc.log(f"Remounted {mount_point} as read-write for the restore", xbmc.LOGINFO)
+        self._mounts[mount_point] = False
+        self._remounted.append(mount_point)
+        return True
+
+    def __enter__(self):
+        if not self.begin():
+            raise IOError(f"Cannot read the mount table {self.mountinfo}")
+        return self
+
+    def __exit__(self, *args):
+        self.end()
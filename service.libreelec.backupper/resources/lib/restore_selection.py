@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import xbmc
+import xbmcgui
+
+# Top level of the restore tree, the first matching archive prefix wins
+RESTORE_CATEGORIES = [
+    ('addons/', "Installed Add-ons"),
+    ('userdata/addon_data/', "Add-on User Data"),
+    ('repo/', "Repositories"),
+    ('userdata/Database/', "Kodi Databases"),
+    ('', "Configuration Files")  # flash/config.txt, keymaps and the userdata XML files
+]
+
+
+class RestoreNode:
+    """Folder of the restore tree, files are kept as archive names"""
+
+    def __init__(self, label, path):
+        self.label = label
+        self.path = path  # Archive prefix of everything below, None for a category without one
+        self.folders = {}  # name -> RestoreNode
+        self.files = {}  # name -> archive name
+        self.names = set()  # Archive names of every file below this folder
+
+    def add(self, parts, arcname):
+        self.names.add(arcname)
+        if len(parts) == 1:
+            self.files[parts[0]] = arcname
+            return
+        folder = self.folders.get(parts[0])
+        if folder is None:
+            path = (self.path or '') + parts[0] + '/'
+            folder = self.folders[parts[0]] = RestoreNode(parts[0], path)
+        folder.add(parts[1:], arcname)
+
+
+class RestoreSelection:
+    """Files of a backup arranged by category and folder, with the ones chosen for restoring
+
+    Nothing is selected at first. Selecting a folder selects every file
+    below it, covers() tells which deleted files a selection takes along.
+    """
+
+    def __init__(self, names):
+        self.root = RestoreNode("Backup", None)
+        for prefix, label in RESTORE_CATEGORIES:
+            self.root.folders[label] = RestoreNode(label, prefix or None)
+        for arcname in names:
+            for prefix, label in RESTORE_CATEGORIES:
+                if arcname.startswith(prefix):
+                    self.root.names.add(arcname)
+                    self.root.folders[label].add(arcname[len(prefix):].split('/'), arcname)
+                    break
+        # Categories without files are not offered
+        self.root.folders = {label: node for label, node in self.root.folders.items() if node.names}
+        self.names = set()
+
+    def state(self, node):
+        """'all', 'some' or 'none' of the files below a folder are selected"""
+        selected = len(node.names & self.names)
+        if not selected:
+            return 'none'
+        return 'all' if selected == len(node.names) else 'some'
+
+    def toggle_folder(self, node):
+        if self.state(node) == 'all':
+            self.names -= node.names
+        else:
+            self.names |= node.names
+
+    def toggle_file(self, arcname):
+        self.names ^= {arcname}
+
+    def covers(self, arcname):
+        """Check if a file deleted before the backup lies in a folder selected as a whole"""
+        node = self.root
+        for prefix, label in RESTORE_CATEGORIES:
+            if arcname.startswith(prefix):
+                node = self.root.folders.get(label)
+                parts = arcname[len(prefix):].split('/')[:-1]
+                break
+        while node is not None:
+            if node.path is not None and self.state(node) == 'all':
+                return True
+            node = node.folders.get(parts.pop(0)) if parts else None
+        return False
+
+
+def choose_restore_files(names, title):
+    """Let the user pick categories, folders and files to restore
+
+    Returns the RestoreSelection, or None when the dialog was cancelled or
+    nothing was picked.
+    """
+    selection = RestoreSelection(names)
+    dialog = xbmcgui.Dialog()
+    marks = {'all': '[X]', 'some': '[-]', 'none': '[  ]'}
+    trail = [selection.root]
+    while trail:
+        node = trail[-1]
+        if node is selection.root:
+            entries = [(f"Restore {len(selection.names)} selected files", 'done')]
+        else:
+            entries = [("..", 'up'),
+                       (f"{marks[selection.state(node)]} Everything in {node.label} ({len(node.names)} files)", 'toggle')]
+        for folder in sorted(node.folders.values(), key=lambda folder: folder.label.lower()):
+            entries.append((f"{marks[selection.state(folder)]} {folder.label}/ ({len(folder.names)} files)", folder))
+        for name in sorted(node.files, key=str.lower):
+            entries.append((f"{marks['all' if node.files[name] in selection.names else 'none']} {name}", ('file', node.files[name])))
+
+        heading = title if node is selection.root else f"{title}: {node.path or node.label}"
+        chosen = dialog.select(heading, [entry[0] for entry in entries])
+        if chosen == -1:
+            if node is selection.root:
+                xbmc.log("Selective restore cancelled", xbmc.LOGINFO)
+                return None
+            trail.pop()
+            continue
+        action = entries[chosen][1]
+        if action == 'done':
+            if not selection.names:
+                dialog.ok(title, "Nothing selected, open a category and select the items to restore")
+                continue
+            xbmc.log(f"Selective restore of {len(selection.names)} files", xbmc.LOGINFO)
+            return selection
+        elif action == 'up':
+            trail.pop()
+        elif action == 'toggle':
+            selection.toggle_folder(node)
+        elif isinstance(action, RestoreNode):
+            # A folder is either opened or selected as a whole
+            choice = dialog.contextmenu(["Open", "Deselect all" if selection.state(action) == 'all' else "Select all"])
+            if choice == 0:
+                trail.append(action)
+            elif choice == 1:
+                selection.toggle_folder(action)
+        else:
+            selection.toggle_file(action[1])
+    return None
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import shutil
+import xbmc
+from .database_snapshot import snapshot_database, restore_database
+
+STAGING_DIR = '.backupper-restore'  # Made at the top of every filesystem a restore writes to
+ROLLBACK_JOURNAL_NAME = 'restore_rollback.json'
+
+
+def _save_journal(path, journal):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(journal, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def _load_journal(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        xbmc.log(f"Error reading restore rollback journal: {str(e)}", xbmc.LOGWARNING)
+        return None
+
+
+def _put_back(entries):
+    """Return every [live path, previous version, kind] entry to its previous version, newest first
+
+    An entry whose previous version is None was created by the restore and
+    is removed. A previous version that is not there was never set aside, so
+    its live file was not touched. Returns the live paths that failed.
+    """
+    failed = []
+    for path, previous, kind in reversed(entries):
+        try:
+            if previous is None:
+                if os.path.lexists(path):
+                    os.remove(path)
+            elif os.path.lexists(previous):
+                if kind == 'database':
+                    restore_database(previous, path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(previous, path)
+        except Exception as e:
+            xbmc.log(f"Error putting back {path}: {str(e)}", xbmc.LOGERROR)
+            failed.append(path)
+    return failed
+
+
+def _remove_trees(paths):
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class StagedRestore:
+    """Restore into staging trees, then swap the new files in with one short pass of renames
+
+    Every file is written below a staging directory at the top of the
+    filesystem that holds it, so moving it into place is a rename. commit()
+    moves the live files aside into a rollback tree on the same filesystem
+    and the staged ones into place, a failure half way puts everything back.
+    The journal is written before the first rename, a restore interrupted
+    during the swap is undone before the next one starts. The previous
+    versions stay until the next restore is committed, so the last restore
+    can be undone once.
+
+    Kodi's databases cannot be renamed while Kodi holds them open, their
+    staged snapshots are written through SQLite after the files are swapped
+    and the live databases are snapshotted for the rollback first.
+    """
+
+    def __init__(self, mount_point, journal_path):
+        self.mount_point = mount_point  # Callable giving the mount point of the filesystem holding a path
+        self.journal_path = journal_path
+        self.session = str(int(time.time() * 1000))
+        self.databases = []  # Live paths of the databases written by the commit
+        self._staged = {}  # Live path -> staged file, in restore order
+        self._staged_databases = {}  # Live path -> staged database snapshot
+        self._removed = []  # Live paths of files deleted since the backup was taken
+        self._roots = set()  # Staging directories of this restore
+
+    def root(self, path):
+        """Get the staging directory on the filesystem holding a live path"""
+        return os.path.join(self.mount_point(path), STAGING_DIR)
+
+    def _tree(self, kind, path):
+        """Get the place of a live path in this restore's staged or previous tree on its filesystem"""
+        root = self.root(path)
+        if root not in self._roots:
+            self._roots.add(root)
+            # Left behind by a restore that stopped before its commit
+            if os.path.isdir(root):
+                _remove_trees(os.path.join(root, name) for name in os.listdir(root) if name.startswith('staged-'))
+        return os.path.join(root, f'{kind}-{self.session}', path.lstrip('/'))
+
+    def stage(self, path, database=False):
+        """Get the path to write the new version of a live file to"""
+        staged = self._staged_databases if database else self._staged
+        if path not in staged:
+            staged[path] = self._tree('staged', path)
+        return staged[path]
+
+    def remove(self, path):
+        """Delete a live file together with the commit"""
+        self._removed.append(path)
+
+    @property
+    def file_count(self):
+        return len(self._staged) + len(self._staged_databases) + len(self._removed)
+
+    def commit(self):
+        """Swap the staged files in, raises after putting the live files back when that fails"""
+        entries = []  # [live path, previous version or None, kind]
+        for path in list(self._staged) + list(dict.fromkeys(self._removed)):
+            entries.append([path, self._tree('previous', path) if os.path.lexists(path) else None, 'file'])
+        for path in self._staged_databases:
+            entries.append([path, self._tree('previous', path) if os.path.exists(path) else None, 'database'])
+        trees = sorted(os.path.join(root, f'previous-{self.session}') for root in self._roots)
+
+        # The journal goes first, a commit cut short is undone from it
+        last = _load_journal(self.journal_path)
+        _save_journal(self.journal_path, {'state': 'committing', 'time': int(time.time()),
+                                          'entries': entries, 'trees': trees})
+        started = time.monotonic()
+        try:
+            for path, previous, kind in entries:
+                if kind == 'database':
+                    self._write_database(path, previous)
+                    continue
+                if previous is not None:
+                    os.makedirs(os.path.dirname(previous), exist_ok=True)
+                    os.replace(path, previous)
+                if path in self._staged:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(self._staged[path], path)
+        except Exception as e:
+            xbmc.log(f"Restore commit failed, putting the previous files back: {str(e)}", xbmc.LOGERROR)
+            failed = _put_back(entries)
+            if failed:
+                # The journal stays, undoing the restore can retry the files left over
+                raise IOError(f"Restore failed and {len(failed)} files could not be put back: {str(e)}")
+            _remove_trees(trees)
+            if last is not None:
+                _save_journal(self.journal_path, last)
+            else:
+                os.remove(self.journal_path)
+            raise
+
+        _save_journal(self.journal_path, {'state': 'committed', 'time': int(time.time()),
+                                          'entries': entries, 'trees': trees})
+        xbmc.log(f"Swapped {len(entries)} restored files in {time.monotonic() - started:.2f} s", xbmc.LOGINFO)
+        # Only the last restore can be undone
+        if last is not None:
+            _remove_trees(last.get('trees', []))
+        self.discard()
+
+    def _write_database(self, path, previous):
+        staged = self._staged_databases[path]
+        if previous is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged, path)
+        else:
+            os.makedirs(os.path.dirname(previous), exist_ok=True)
+            snapshot_database(path, previous)
+            restore_database(staged, path)
+        self.databases.append(path)
+
+    def discard(self):
+        """Drop the staged files, the live files stay as they are"""
+        _remove_trees(os.path.join(root, f'staged-{self.session}') for root in self._roots)
+
+
+class RestoreRollback:
+    """Previous versions of the files the last restore replaced, enough to undo it once"""
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.journal = _load_journal(journal_path)
+
+    @property
+    def available(self):
+        return bool(self.journal and self.journal.get('entries'))
+
+    @property
+    def interrupted(self):
+        """Check if the last restore stopped half way through its commit"""
+        return self.available and self.journal.get('state') == 'committing'
+
+    @property
+    def paths(self):
+        return [path for path, _, _ in self.journal.get('entries', [])] if self.journal else []
+
+    @property
+    def databases(self):
+        return [path for path, _, kind in self.journal.get('entries', []) if kind == 'database'] if self.journal else []
+
+    def undo(self):
+        """Put the previous versions back, returns the live paths that failed"""
+        failed = _put_back(self.journal['entries'])
+        if failed:
+            return failed
+        _remove_trees(self.journal.get('trees', []))
+        os.remove(self.journal_path)
+        self.journal = None
+        return []
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from datetime import datetime
+import xbmc
+
+SCHEDULE_STATE_NAME = 'schedule_state.json'
+MAX_DEFERRALS = 20  # Deferral entries kept per backup window
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ScheduleState:
+    """Start time and deferral reasons of the current scheduled backup window
+
+    Written by the service, read by the add-on menu. Consecutive checks that
+    defer for the same reason are folded into one entry with a count.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.window_start = None  # Scheduled start of the window the entries belong to
+        self.deferrals = []  # [{'since', 'reason', 'checks'}]
+        self.started = None
+        self.start_reason = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.window_start = data.get('window_start')
+            self.deferrals = data.get('deferrals', [])
+            self.started = data.get('started')
+            self.start_reason = data.get('start_reason')
+        except (OSError, ValueError) as e:
+            xbmc.log(f"Error reading schedule state: {str(e)}", xbmc.LOGWARNING)
+
+    def save(self):
+        data = {
+            'window_start': self.window_start,
+            'deferrals': self.deferrals,
+            'started': self.started,
+            'start_reason': self.start_reason
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            xbmc.log(f"Error saving schedule state: {str(e)}", xbmc.LOGWARNING)
+
+    def _enter_window(self, window_start):
+        """Start fresh entries when a new backup window opens"""
+        window_start = window_start.strftime(TIME_FORMAT)
+        if self.window_start != window_start:
+            self.window_start = window_start
+            self.deferrals = []
+            self.started = None
+            self.start_reason = None
+
+    def defer(self, window_start, reason):
+        """Record that the backup of a window was put off"""
+        self._enter_window(window_start)
+        if self.deferrals and self.deferrals[-1]['reason'] == reason:
+            self.deferrals[-1]['checks'] += 1
+        else:
+            xbmc.log(f"Scheduled backup deferred: {reason}", xbmc.LOGINFO)
+            self.deferrals.append({'since': datetime.now().strftime(TIME_FORMAT), 'reason': reason, 'checks': 1})
+            del self.deferrals[:-MAX_DEFERRALS]
+        self.save()
+
+    def start(self, window_start, reason):
+        """Record when and why the backup of a window was started"""
+        self._enter_window(window_start)
+        self.started = datetime.now().strftime(TIME_FORMAT)
+        self.start_reason = reason
+        xbmc.log(f"Scheduled backup started at {self.started}: {reason}", xbmc.LOGINFO)
+        self.save()
+
+    def summary(self):
+        """One line describing the latest scheduled run, for the add-on menu"""
+        if self.started:
+            text = f"Started {self.started} ({self.start_reason})"
+            if self.deferrals:
+                text += f" after {sum(entry['checks'] for entry in self.deferrals)} deferred checks"
+            return text
+        if self.deferrals:
+            return f"Deferred since {self.deferrals[0]['since']} ({self.deferrals[-1]['reason']})"
+        return "No scheduled run yet"
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import ctypes
+import platform
+import threading
+import xbmc
+
+# Throttle modes selectable per kind of backup
+MODE_FULL_SPEED = 0
+MODE_LOW_PRIORITY = 1
+MODE_YIELD_TO_PLAYBACK = 2
+
+LOW_NICE = 19  # Lowest CPU priority, Kodi's own threads win every contended time slice
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_SHIFT = 13
+LOW_IOPRIO = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | 7  # Lowest best-effort level, idle class could starve the backup
+IOPRIO_WHO_PROCESS = 1  # Takes a thread id on Linux
+# ioprio_get/ioprio_set syscall numbers, Python has no wrapper for them
+IOPRIO_SYSCALLS = {
+    'x86_64': (252, 251),
+    'i686': (290, 289),
+    'aarch64': (31, 30),
+    'armv7l': (315, 314),
+    'armv8l': (315, 314)
+}
+
+PLAYER_CHECK_INTERVAL = 0.5  # Seconds between player state checks
+PAUSE_POLL_INTERVAL = 2  # Seconds between checks while paused for playback
+HIGH_BITRATE_RESOLUTIONS = ('4K', '8K', '2160', '4320')  # Used when the bitrate cannot be worked out
+
+
+def _ioprio_syscall(get):
+    numbers = IOPRIO_SYSCALLS.get(platform.machine())
+    if numbers is None:
+        return None
+    libc = ctypes.CDLL(None, use_errno=True)
+    number = numbers[0] if get else numbers[1]
+    return lambda *args: libc.syscall(number, *args)
+
+
+class ResourceThrottle:
+    """Keep a backup job from disturbing playback
+
+    start() lowers the CPU and I/O priority of the calling thread. Linux gives
+    threads created afterwards the same priorities, so the scan, compression
+    and upload threads of the job run at low priority too. checkpoint() is
+    called between files and sleeps while something is playing, so the job
+    only works for the configured share of the time. During playback of high
+    bitrate video it blocks until playback ends, the job carries on where it
+    stopped.
+    """
+
+    def __init__(self, mode=MODE_FULL_SPEED, duty_cycle=100, pause_bitrate=0, notify=None):
+        self.mode = mode
+        self.duty_cycle = max(1, min(duty_cycle, 100))  # Percent of the time spent working during playback
+        self.pause_bitrate = pause_bitrate  # Mbit/s above which the job pauses, 0 never pauses
+        self.notify = notify  # Optional callable(title, message) for pause and resume messages
+        self.paused_seconds = 0
+        self._player = None
+        self._monitor = None
+        self._tid = None
+        self._saved_nice = None
+        self._saved_ioprio = None
+        self._last_check = 0
+        self._work_started = 0
+        self._playback_state = None
+        self._playing_file = None
+        self._file_bitrate = None
+
+    @property
+    def enabled(self):
+        return self.mode != MODE_FULL_SPEED
+
+    def start(self):
+        """Lower the priority of the calling thread and the threads it starts"""
+        if not self.enabled:
+            return
+        self._tid = threading.get_native_id()
+        try:
+            self._saved_nice = os.getpriority(os.PRIO_PROCESS, self._tid)
+            os.setpriority(os.PRIO_PROCESS, self._tid, max(self._saved_nice, LOW_NICE))
+        except (OSError, AttributeError) as e:
+            xbmc.log(f"Could not lower CPU priority: {str(e)}", xbmc.LOGWARNING)
+            self._saved_nice = None
+        try:
+            ioprio_get, ioprio_set = _ioprio_syscall(True), _ioprio_syscall(False)
+            if ioprio_get is not None:
+                saved = ioprio_get(IOPRIO_WHO_PROCESS, self._tid)
+                if saved >= 0 and ioprio_set(IOPRIO_WHO_PROCESS, self._tid, LOW_IOPRIO) == 0:
+                    self._saved_ioprio = saved
+        except (OSError, AttributeError) as e:
+            xbmc.log(f"Could not lower I/O priority: {str(e)}", xbmc.LOGWARNING)
+        if self.mode == MODE_YIELD_TO_PLAYBACK:
+            self._player = xbmc.Player()
+            self._monitor = xbmc.Monitor()
+        self._work_started = time.monotonic()
+        xbmc.log(f"Backup throttling: mode {self.mode}, {self.duty_cycle}% during playback, pause above {self.pause_bitrate} Mbit/s", xbmc.LOGINFO)
+
+    def stop(self):
+        """Give the calling thread its original priorities back"""
+        if self._tid is None:
+            return
+        if self._saved_nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, self._tid, self._saved_nice)
+            except OSError as e:
+                # Raising the priority again needs CAP_SYS_NICE
+                xbmc.log(f"Could not restore CPU priority: {str(e)}", xbmc.LOGWARNING)
+        if self._saved_ioprio is not None:
+            ioprio_set = _ioprio_syscall(False)
+            if ioprio_set is not None:
+                ioprio_set(IOPRIO_WHO_PROCESS, self._tid, self._saved_ioprio)
+        if self.paused_seconds:
+            xbmc.log(f"Backup throttling: paused for {int(self.paused_seconds)} seconds in total", xbmc.LOGINFO)
+        self._tid = None
+        self._saved_nice = None
+        self._saved_ioprio = None
+
+    def _bitrate(self):
+        """Estimate the bitrate of the playing video in Mbit/s, or None if it cannot be worked out"""
+        try:
+            playing_file = self._player.getPlayingFile()
+        except RuntimeError:
+            return None
+        if playing_file != self._playing_file:
+            self._playing_file = playing_file
+            self._file_bitrate = None
+            try:
+                duration = self._player.getTotalTime()
+                if duration > 0 and os.path.isfile(playing_file):
+                    self._file_bitrate = os.path.getsize(playing_file) * 8 / duration / 1000000
+            except (RuntimeError, OSError):
+                pass
+        return self._file_bitrate
+
+    def _check_playback(self):
+        """Get None when idle, 'playing', or 'pause' for video the job must not compete with"""
+        if not self._player.isPlaying():
+            return None
+        if self.pause_bitrate and self._player.isPlayingVideo():
+            bitrate = self._bitrate()
+            if bitrate is not None:
+                if bitrate >= self.pause_bitrate:
+                    return 'pause'
+            elif xbmc.getInfoLabel('VideoPlayer.VideoResolution') in HIGH_BITRATE_RESOLUTIONS:
+                return 'pause'
+        return 'playing'
+
+    def checkpoint(self):
+        """Called between units of work, sleeps or blocks as long as playback needs it"""
+        if self._player is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < PLAYER_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        state = self._check_playback()
+
+        if state == 'pause':
+            self._pause()
+        elif state == 'playing' and self.duty_cycle < 100:
+            # Rest in proportion to the time worked since the last rest
+            worked = now - self._work_started
+            rest = worked * (100 - self.duty_cycle) / self.duty_cycle
+            if self._monitor.waitForAbort(rest):
+                raise InterruptedError("Kodi is shutting down")
+            self.paused_seconds += rest
+        self._work_started = time.monotonic()
+
+    def _pause(self):
+        """Block until the high bitrate playback is over"""
+        xbmc.log("Backup throttling: pausing for high bitrate playback", xbmc.LOGINFO)
+        if self.notify:
+            self.notify("Backup paused", "Waiting for playback to finish")
+        started = time.monotonic()
+        while self._check_playback() == 'pause':
+            if self._monitor.waitForAbort(PAUSE_POLL_INTERVAL):
+                raise InterruptedError("Kodi is shutting down")
+        self.paused_seconds += time.monotonic() - started
+        xbmc.log(f"Backup throttling: resuming after {int(time.monotonic() - started)} seconds", xbmc.LOGINFO)
+        if self.notify:
+            self.notify("Backup resumed", "Playback finished")
@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import time
+import errno
+import hashlib
+import threading
+
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+START_CHUNK_SIZE = 1024 * 1024
+TARGET_CHUNK_SECONDS = 0.25  # Time one chunk should take, long enough to amortise the call, short enough to throttle
+KERNEL_COPY_SIZE = 64 * 1024 * 1024  # Bytes per copy_file_range or sendfile call
+PROGRESS_INTERVAL = 0.5  # Seconds between progress reports
+# Errors that mean the kernel cannot copy between these two files, not that the copy failed
+UNSUPPORTED_COPY_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF)
+
+
+class AdaptiveChunkSize:
+    """Chunk size tuned to the measured throughput
+
+    A chunk that takes much less than the target time doubles the size, one
+    that takes much longer halves it. Fast links get few large writes, slow
+    ones still see the throttle and report progress several times a second.
+    """
+
+    def __init__(self, size=START_CHUNK_SIZE, minimum=MIN_CHUNK_SIZE, maximum=MAX_CHUNK_SIZE):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def measure(self, length, seconds):
+        """Adjust the size after a chunk of length bytes took seconds"""
+        if seconds < TARGET_CHUNK_SECONDS / 2 and length >= self.size:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > TARGET_CHUNK_SECONDS * 2:
+            self.size = max(self.size // 2, self.minimum)
+
+
+class TransferProgress:
+    """Progress of a transfer, reported from a timer thread instead of the copy loop
+
+    The copy loop only adds the bytes it moved. report(done, total) is called
+    every PROGRESS_INTERVAL seconds while the transfer runs and once at the end.
+    """
+
+    def __init__(self, total, report=None, done=0):
+        self.total = total
+        self.done = done
+        self.report = report
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, length):
+        self.done += length
+
+    def _run(self):
+        while not self._stopped.wait(PROGRESS_INTERVAL):
+            self.report(self.done, self.total)
+
+    def __enter__(self):
+        if self.report is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.report(self.done, self.total)
+
+
+def read_chunks(source, chunking=None, progress=None, checkpoint=None):
+    """Read a file object in chunks of an adaptive size into one reused buffer
+
+    Yields the buffer itself while chunks are full and a copy of a short
+    chunk, so every chunk is a bytearray. The buffer is overwritten by the
+    next read, a consumer has to be done with a chunk before asking for the
+    next one. The time between two reads counts for the chunk size, so a
+    slow consumer makes the chunks smaller.
+    """
+    chunking = chunking or AdaptiveChunkSize()
+    buffer = bytearray(chunking.size)
+    while True:
+        if checkpoint is not None:
+            checkpoint()
+        if len(buffer) != chunking.size:
+            buffer = bytearray(chunking.size)
+        started = time.monotonic()
+        count = source.readinto(buffer)
+        if not count:
+            return
+        yield buffer if count == len(buffer) else buffer[:count]
+        if progress is not None:
+            progress.add(count)
+        chunking.measure(count, time.monotonic() - started)
+
+
+def copy_file(source, target, offset=0, progress=None, checkpoint=None):
+    """Copy an open file from offset to the same offset of another, inside the kernel where it can
+
+    Tries copy_file_range, which lets NFS servers copy on their side, then
+    sendfile, then a read loop for files the kernel cannot copy between.
+    Returns the number of bytes copied.
+    """
+    source_fd, target_fd = source.fileno(), target.fileno()
+    size = os.fstat(source_fd).st_size
+    position = offset
+    methods = [method for method in ('copy_file_range', 'sendfile') if hasattr(os, method)]
+    while position < size and methods:
+        if checkpoint is not None:
+            checkpoint()
+        length = min(KERNEL_COPY_SIZE, size - position)
+        try:
+            if methods[0] == 'copy_file_range':
+                copied = os.copy_file_range(source_fd, target_fd, length, position, position)
+            else:
+                os.lseek(target_fd, position, os.SEEK_SET)
+                copied = os.sendfile(target_fd, source_fd, position, length)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_COPY_ERRORS:
+                raise
+            methods.pop(0)
+            continue
+        if not copied:
+            break  # The source ended early, the caller checks the size
+        position += copied
+        if progress is not None:
+            progress.add(copied)
+
+    if position < size:
+        source.seek(position)
+        target.seek(position)
+        for chunk in read_chunks(source, progress=progress, checkpoint=checkpoint):
+            target.write(chunk)
+            position += len(chunk)
+    return position - offset
+
+
+class HashingWriter(io.RawIOBase):
+    """Writable target that computes the SHA-256 and size of everything passing through
+
+    Wraps a local file or a remote stream writer. It is not seekable, so
+    zipfile records member sizes in data descriptors and never rewrites bytes
+    that were already hashed. Closing closes the wrapped target.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self._digest = hashlib.sha256()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, b):
+        data = memoryview(b).cast('B')
+        self.target.write(data)
+        self._digest.update(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    @property
+    def bytes_written(self):
+        return self._position
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.target.close()
+            finally:
+                super().close()
+
+    def abort(self):
+        """Close the target after a failure"""
+        if hasattr(self.target, 'abort'):
+            self.target.abort()
+        else:
+            self.target.close()
+        super().close()
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+import threading
+import xbmc
+
+UPLOAD_JOURNAL_NAME = 'upload_journal.json'
+PARTIAL_SUFFIX = '.part'  # Uploads go to this name and are renamed once verified
+JOURNAL_SAVE_INTERVAL = 5  # Seconds between journal writes while an upload runs
+
+
+def partial_name(remote_filename):
+    """Get the remote name an upload is written to until it is complete"""
+    return remote_filename + PARTIAL_SUFFIX
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    """Hash a local file without reading it into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadJournal:
+    """Uploads in flight, persisted so an interrupted upload resumes after a restart
+
+    Every entry ties a remote file name to the local file it is uploaded from,
+    identified by size and mtime, and to the backup location. An entry with
+    attempts has bytes at the remote end that may be continued, the offset is
+    the last position confirmed by the transport. Parallel upload streams
+    share one journal, every change happens under a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # remote filename -> entry dict
+        self._last_save = 0
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+            # Entries whose local file is gone cannot be continued
+            self.entries = {name: entry for name, entry in entries.items() if os.path.exists(entry['local_path'])}
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            xbmc.log(f"Error reading upload journal: {str(e)}", xbmc.LOGWARNING)
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(self.entries, f, indent=2)
+                os.replace(temp_path, self.path)
+                self._last_save = time.monotonic()
+            except OSError as e:
+                xbmc.log(f"Error saving upload journal: {str(e)}", xbmc.LOGWARNING)
+
+    def begin(self, remote_filename, local_path, location, sha256=None):
+        """Get the entry of an upload, a new one unless the same file was already on its way
+
+        A SHA-256 computed while the file was written saves hashing it again
+        for the verification.
+        """
+        with self._lock:
+            file_stat = os.stat(local_path)
+            entry = self.entries.get(remote_filename)
+            if entry is None or entry['location'] != location or entry['size'] != file_stat.st_size or entry['mtime'] != int(file_stat.st_mtime):
+                entry = {
+                    'local_path': local_path,
+                    'location': location,
+                    'size': file_stat.st_size,
+                    'mtime': int(file_stat.st_mtime),
+                    'offset': 0,
+                    'attempts': 0,
+                    'sha256': None
+                }
+                self.entries[remote_filename] = entry
+            else:
+                xbmc.log(f"Continuing upload of {remote_filename}, {entry['offset']} of {entry['size']} bytes confirmed", xbmc.LOGINFO)
+            entry['local_path'] = local_path
+            if sha256 is not None:
+                entry['sha256'] = sha256
+            self.save()
+            return entry
+
+    def start_attempt(self, remote_filename, offset):
+        """Record that an attempt starts writing at offset"""
+        with self._lock:
+            entry = self.entries[remote_filename]
+            entry['attempts'] += 1
+            entry['offset'] = offset
+            self.save()
+
+    def confirm(self, remote_filename, offset):
+        """Record the bytes the transport accepted, written to disk every few seconds"""
+        with self._lock:
+            entry = self.entries.get(remote_filename)
+            if entry is None:
+                return
+            entry['offset'] = offset
+            if time.monotonic() - self._last_save >= JOURNAL_SAVE_INTERVAL:
+                self.save()
+
+    def restart(self, remote_filename):
+        """Forget the remote bytes of an upload, the next attempt starts from zero"""
+        with self._lock:
+            entry = self.entries.get(remote_filename)
+            if entry is not None:
+                entry['offset'] = 0
+                entry['attempts'] = 0
+                self.save()
+
+    def move(self, remote_filename, local_path):
+        """Follow the local file of an upload to a new place"""
+        with self._lock:
+            entry = self.entries.get(remote_filename)
+            if entry is not None:
+                entry['local_path'] = local_path
+                self.save()
+
+    def sha256(self, remote_filename):
+        """Hash of the local file, computed once per upload"""
+        with self._lock:
+            entry = self.entries[remote_filename]
+        # Hashed outside the lock, other streams keep confirming meanwhile
+        if entry['sha256'] is None:
+            digest = file_sha256(entry['local_path'])
+            with self._lock:
+                entry['sha256'] = digest
+                self.save()
+        return entry['sha256']
+
+    def finish(self, remote_filename):
+        with self._lock:
+            if self.entries.pop(remote_filename, None) is not None:
+                self.save()
@@ -8,6 +8,7 @@ import xbmcaddon
 import xbmcvfs
 from datetime import datetime, timedelta, time
 from resources.lib.backup_utils import BackupManager
+from resources.lib.schedule_state import ScheduleState, SCHEDULE_STATE_NAME
 
 ADDON = xbmcaddon.Addon()
 ADDON_ID = ADDON.getAddonInfo('id')
@@ -16,6 +17,11 @@ ADDON_PATH = xbmcvfs.translatePath(ADDON.getAddonInfo('path'))
 ADDON_DATA_PATH = xbmcvfs.translatePath(ADDON.getAddonInfo('profile'))
 LAST_BACKUP_FILE = os.path.join(ADDON_DATA_PATH, 'last_backup.txt')
 LAST_ATTEMPT_FILE = os.path.join(ADDON_DATA_PATH, 'last_attempt.txt')
+SCHEDULE_STATE_FILE = os.path.join(ADDON_DATA_PATH, SCHEDULE_STATE_NAME)
+
+MAX_IDLE_LOAD = 0.5  # 1 minute load average per CPU below which the box counts as idle
+IDLE_INPUT_SECONDS = 600  # Time without input that counts as idle when no screensaver runs
+WINDOW_CLOSING = timedelta(minutes=2)  # Two scheduler checks before the window closes
 
 # Log function
 def log(message, level=xbmc.LOGINFO):
@@ -79,93 +85,121 @@ def check_reminders(current_time, schedule_time):
 
     return False, None
 
-def should_run_backup():
-    """Check if it's time to run a scheduled backup"""
+class ServiceMonitor(xbmc.Monitor):
+    """Monitor that keeps track of the screensaver"""
+
+    def __init__(self):
+        super().__init__()
+        # The service may start while the screensaver is already running
+        self.screensaver_active = xbmc.getCondVisibility('System.ScreenSaverActive')
+
+    def onScreensaverActivated(self):
+        self.screensaver_active = True
+
+    def onScreensaverDeactivated(self):
+        self.screensaver_active = False
+
+def get_idle_state(monitor):
+    """Check whether the box is idle, returns (idle, reason)"""
+    if xbmc.Player().isPlaying():
+        return False, "playback in progress"
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        if load > MAX_IDLE_LOAD:
+            return False, f"system load {load:.2f} per CPU"
+    except OSError:
+        pass
+    if monitor.screensaver_active:
+        return True, "screensaver active"
+    # Without a screensaver a long stretch without input counts as idle too
+    idle_seconds = xbmc.getGlobalIdleTime()
+    if idle_seconds >= IDLE_INPUT_SECONDS:
+        return True, f"no input for {idle_seconds // 60} minutes"
+    return False, "screensaver not active"
+
+def get_schedule_start(current_time, schedule_time, schedule_type):
+    """Get the most recent scheduled start at or before current_time"""
+    target_time = datetime.combine(current_time.date(), schedule_time)
+    if schedule_type == 1:  # Weekly
+        schedule_day = ADDON.getSettingInt('schedule_day')  # 0=Monday, 6=Sunday
+        target_time -= timedelta(days=(current_time.weekday() - schedule_day) % 7)
+        if target_time > current_time:
+            target_time -= timedelta(days=7)
+    elif schedule_type == 2:  # Monthly
+        schedule_date = ADDON.getSettingInt('schedule_date') + 1  # Convert 0-based to 1-based
+        target_time = target_time.replace(day=schedule_date)
+        if target_time > current_time:
+            # Same date in the previous month, dates only go up to 28
+            target_time = (target_time.replace(day=1) - timedelta(days=1)).replace(day=schedule_date)
+    elif target_time > current_time:  # Daily
+        target_time -= timedelta(days=1)
+    return target_time
+
+def should_run_backup(monitor, schedule_state):
+    """Check if it's time to run a scheduled backup
+
+    Within the backup window the run waits for the box to be idle, deferrals
+    and the reason the run finally started are recorded in schedule_state.
+    """
+    # Return tuple of (should_run, is_missed, missed_date, show_warning, should_remind, reminder_minutes)
+    def check_result(should_run, is_missed=False, missed_date=None, show_warning=False, should_remind=False, reminder_minutes=None):
+        return (should_run, is_missed, missed_date, show_warning, should_remind, reminder_minutes)
+
     if not ADDON.getSettingBool('enable_scheduler'):
-        return False, False, None, False, False, None
+        return check_result(False)
 
     current_time = datetime.now()
     try:
         schedule_time_str = ADDON.getSetting('schedule_time')
         if not schedule_time_str:
             log("No schedule time set", xbmc.LOGWARNING)
-            return False, False, None, False, False, None
+            return check_result(False)
             
         # Parse time string manually to avoid datetime.strptime issues
         hours, minutes = map(int, schedule_time_str.split(':'))
         schedule_time = time(hours, minutes)
     except (ValueError, TypeError) as e:
         log(f"Error parsing schedule time: {str(e)}", xbmc.LOGERROR)
-        return False, False, None, False, False, None
+        return check_result(False)
 
     schedule_type = ADDON.getSettingInt('schedule_type')  # 0=Daily, 1=Weekly, 2=Monthly
     run_missed = ADDON.getSettingBool('run_missed_backups')
 
-    # Get the target backup time for today
-    target_time = datetime.combine(current_time.date(), schedule_time)
+    # A window of 0 hours keeps the backup to the scheduled minute
+    window_hours = ADDON.getSettingInt('schedule_window')
+    window = timedelta(hours=window_hours) if window_hours else timedelta(minutes=1)
+    schedule_start = get_schedule_start(current_time, schedule_time, schedule_type)
     
     # Get last backup and attempt times
     last_backup = get_last_backup_time()
     last_attempt = get_last_attempt_time()
     
-    # Check if we're within the backup window
-    current_minutes = current_time.hour * 60 + current_time.minute
-    schedule_minutes = schedule_time.hour * 60 + schedule_time.minute
-    time_diff = schedule_minutes - current_minutes
-    
     # Check for reminders
     should_remind, reminder_minutes = check_reminders(current_time, schedule_time)
-    
-    # Return tuple of (should_run, is_missed, missed_date, show_warning, should_remind, reminder_minutes)
-    def check_result(should_run, is_missed=False, missed_date=None, show_warning=False, should_remind=False, reminder_minutes=None):
-        return (should_run, is_missed, missed_date, show_warning, should_remind, reminder_minutes)
 
-    # If we've already attempted a backup today, don't try again
-    if last_attempt and last_attempt.date() == current_time.date():
-        return check_result(False)
+    # Each scheduled start is attempted once
+    if last_attempt and last_attempt >= schedule_start:
+        return check_result(False, should_remind=should_remind, reminder_minutes=reminder_minutes)
 
-    if schedule_type == 0:  # Daily
-        if time_diff == 0:  # At scheduled time
+    if current_time < schedule_start + window:
+        if not window_hours or not ADDON.getSettingBool('wait_for_idle'):
+            schedule_state.start(schedule_start, "scheduled time")
             return check_result(True)
-        elif run_missed and last_backup:
-            # Run if we missed today's backup and haven't run yet
-            if current_time > target_time and last_backup.date() < current_time.date():
-                return check_result(True, True, target_time.date())
-            
-    elif schedule_type == 1:  # Weekly
-        schedule_day = ADDON.getSettingInt('schedule_day')  # 0=Monday, 6=Sunday
-        is_schedule_day = current_time.weekday() == schedule_day
-        
-        if is_schedule_day:
-            if time_diff == 0:  # At scheduled time
-                return check_result(True)
-            elif run_missed and last_backup:
-                # If it's still the scheduled day but we missed the window
-                if current_time > target_time and last_backup.date() < current_time.date():
-                    return check_result(True, True, target_time.date())
-        elif run_missed and last_backup:
-            # If we completely missed the last scheduled day
-            last_schedule = current_time - timedelta(days=(current_time.weekday() - schedule_day) % 7)
-            if current_time > last_schedule and (last_backup is None or last_backup < last_schedule):
-                return check_result(True, True, last_schedule.date())
-            
-    elif schedule_type == 2:  # Monthly
-        schedule_date = ADDON.getSettingInt('schedule_date') + 1  # Convert 0-based to 1-based
-        is_schedule_date = current_time.day == schedule_date
-        
-        if is_schedule_date:
-            if time_diff == 0:  # At scheduled time
-                return check_result(True)
-            elif run_missed and last_backup:
-                # If it's still the scheduled date but we missed the window
-                if current_time > target_time and last_backup.date() < current_time.date():
-                    return check_result(True, True, target_time.date())
-        elif run_missed and last_backup:
-            # If we completely missed the last scheduled date
-            if current_time.day > schedule_date:
-                last_schedule = current_time.replace(day=schedule_date)
-                if last_backup is None or last_backup < last_schedule:
-                    return check_result(True, True, last_schedule.date())
+        idle, reason = get_idle_state(monitor)
+        if idle:
+            schedule_state.start(schedule_start, reason)
+            return check_result(True)
+        # The last checks of the window run the backup whatever the box is doing
+        if current_time >= schedule_start + window - WINDOW_CLOSING:
+            schedule_state.start(schedule_start, f"window closing, {reason}")
+            return check_result(True)
+        schedule_state.defer(schedule_start, reason)
+        return check_result(False)
+
+    if run_missed and last_backup and last_backup < schedule_start:
+        # The window passed without a backup, e.g. because the box was off
+        schedule_state.start(schedule_start, f"missed backup of {schedule_start.strftime('%Y-%m-%d')}")
+        return check_result(True, True, schedule_start.date())
 
     return check_result(False, should_remind=should_remind, reminder_minutes=reminder_minutes)
 
@@ -175,7 +209,8 @@ def main():
     backup_manager = BackupManager()
     
     # Main service loop
-    monitor = xbmc.Monitor()
+    monitor = ServiceMonitor()
+    schedule_state = ScheduleState(SCHEDULE_STATE_FILE)
     last_check = datetime.now()
     
     # Log service start
@@ -187,7 +222,7 @@ def main():
         
         # Check scheduler every minute
         if (current_time - last_check).total_seconds() >= 60:
-            should_run, is_missed, missed_date, show_warning, should_remind, reminder_minutes = should_run_backup()
+            should_run, is_missed, missed_date, show_warning, should_remind, reminder_minutes = should_run_backup(monitor, schedule_state)
             
             if should_remind:
                 # Calculate string ID based on reminder time
@@ -216,7 +251,7 @@ def main():
                     save_last_attempt_time(current_time)
                     
                     # Run the backup
-                    success, message = backup_manager.create_backup()
+                    success, message = backup_manager.create_backup(scheduled=True)
                     
                     if success:
                         save_last_backup_time(current_time)